@@ -9,80 +9,36 @@ try:
     # Import the FastAPI app from main.py
     from main import app
     
-    # Add static file routes specifically for Vercel
-    from fastapi.responses import FileResponse, Response
-    
-    # Get the current API directory
-    API_DIR = Path(__file__).parent
-    STATIC_DIR = API_DIR / "static"
+    # Static assets (/api/static/*) are served by main.py from the fingerprinted,
+    # precompressed build (static_assets.py)
+    from fastapi import Request
+    from fastapi.responses import Response
+    import static_assets
     
     # Root HTML endpoint for Vercel
     @app.get("/api/")
-    async def serve_index_html():
-        html_file = STATIC_DIR / "index.html"
-        if html_file.exists():
-            return FileResponse(str(html_file), media_type="text/html")
+    async def serve_index_html(request: Request):
+        response = await static_assets.serve("index.html", request.headers)
+        if response is not None:
+            return response
         return Response("HTML not found", status_code=404)
     
     # Test endpoint to verify static file serving
     @app.get("/api/test-static")
-    async def test_static():
-        css_exists = (STATIC_DIR / "styles.css").exists()
-        js_exists = (STATIC_DIR / "app.js").exists()
-        html_exists = (STATIC_DIR / "index.html").exists()
-        
+    def test_static():
+        assets = static_assets.load()
         return {
-            "static_dir": str(STATIC_DIR),
-            "css_exists": css_exists,
-            "js_exists": js_exists,
-            "html_exists": html_exists,
-            "css_path": str(STATIC_DIR / "styles.css"),
-            "js_path": str(STATIC_DIR / "app.js")
+            "static_dir": str(static_assets.STATIC_DIR),
+            "css_exists": "styles.css" in assets,
+            "js_exists": "app.js" in assets,
+            "html_exists": "index.html" in assets,
+            "assets": {
+                name: {"url": static_assets.STATIC_URL_PREFIX + asset.url_name, "encodings": sorted(asset.variants)}
+                for name, asset in assets.items()
+            },
         }
     
-    # Static file endpoints for Vercel
-    @app.get("/api/static/styles.css")
-    async def serve_css():
-        css_file = STATIC_DIR / "styles.css"
-        print(f"CSS request - File exists: {css_file.exists()}, Path: {css_file}")
-        if css_file.exists():
-            return FileResponse(str(css_file), media_type="text/css")
-        return Response("/* CSS not found */", media_type="text/css", status_code=404)
-    
-    @app.get("/api/static/app.js") 
-    async def serve_js():
-        js_file = STATIC_DIR / "app.js"
-        print(f"JS request - File exists: {js_file.exists()}, Path: {js_file}")
-        if js_file.exists():
-            return FileResponse(str(js_file), media_type="application/javascript")
-        return Response("console.log('JS not found');", media_type="application/javascript", status_code=404)
-    
-    @app.get("/api/static/{filename}")
-    async def serve_static_file(filename: str):
-        static_file = STATIC_DIR / filename
-        if static_file.exists() and static_file.is_file():
-            # Determine media type
-            if filename.endswith('.css'):
-                media_type = "text/css"
-            elif filename.endswith('.js'):
-                media_type = "application/javascript"
-            elif filename.endswith('.html'):
-                media_type = "text/html"
-            elif filename.endswith('.svg'):
-                media_type = "image/svg+xml"
-            elif filename.endswith('.ico'):
-                media_type = "image/x-icon"
-            elif filename.endswith(('.png', '.jpg', '.jpeg')):
-                media_type = f"image/{filename.split('.')[-1]}"
-            else:
-                media_type = "text/plain"
-            
-            return FileResponse(str(static_file), media_type=media_type)
-        
-        from fastapi import HTTPException
-        raise HTTPException(status_code=404, detail=f"Static file '{filename}' not found")
-    
-    print("✅ FastAPI app imported successfully for Vercel with static file handlers")
+    print("✅ FastAPI app imported successfully for Vercel")
     
 except Exception as e:
     print(f"❌ Error importing FastAPI app: {e}")
@@ -102,6 +102,7 @@ $(document).ready(function() {
         
         // Enrollment dropdowns
         $('#enrollment-course').change(loadCourseStudents);
+        $('#enrollment-student-search').on('input', searchEnrollmentStudents);
     }
     
     // Authentication functions
@@ -345,15 +346,9 @@ $(document).ready(function() {
     }
     
     function loadEnrollmentData() {
-        // Load students for dropdown
-        $.ajax({
-            url: '/api/admin/students',
-            method: 'GET',
-            headers: { 'Authorization': `Bearer ${token}` },
-            success: function(students) {
-                populateStudentDropdown(students);
-            }
-        });
+        // Students are found with the typeahead instead of loading them all
+        $('#enrollment-student-search').val('');
+        populateStudentDropdown([]);
         
         // Load courses for dropdown
         $.ajax({
@@ -471,6 +466,20 @@ $(document).ready(function() {
     }
     
     // Card creation functions
+    // Pick an audio rendition to suit the connection (Network Information API where available)
+    function audioQuality() {
+        const connection = navigator.connection;
+        if (!connection) return 'high';
+        if (connection.saveData || ['slow-2g', '2g'].includes(connection.effectiveType)) return 'low';
+        if (connection.effectiveType === '3g') return 'medium';
+        return 'high';
+    }
+    
+    // Audio goes through the server's range-streaming route so seeking is fast
+    function documentUrl(doc) {
+        return doc.file_type === 'audio' ? `/api/audio/${doc.id}?quality=${audioQuality()}` : doc.file_url;
+    }
+    
     function createCourseCard(course, isStudent = false) {
         const metaItems = [];
         if (course.instructor) metaItems.push(`<div class="course-meta-item">Instructor: ${course.instructor}</div>`);
@@ -489,7 +498,7 @@ $(document).ready(function() {
                         ${section.documents && section.documents.length > 0 ? `
                             <div class="section-documents">
                                 ${section.documents.map(doc => 
-                                    `<a href="#" onclick="previewMedia('${encodeURIComponent(doc.file_url)}', '${encodeURIComponent(doc.title)}', '${doc.file_type}')" class="document-link ${doc.file_type === 'audio' ? 'audio' : 'document'}">
+                                    `<a href="#" onclick="previewMedia('${encodeURIComponent(documentUrl(doc))}', '${encodeURIComponent(doc.title)}', '${doc.file_type}')" class="document-link ${doc.file_type === 'audio' ? 'audio' : 'document'}">
                                         ${doc.file_type === 'audio' ? '🎵' : '📄'} ${doc.title}
                                     </a>`
                                 ).join('')}
@@ -574,10 +583,45 @@ $(document).ready(function() {
         `);
     }
     
+    // Student typeahead: debounced, and only the latest request's results are shown
+    let studentSearchTimer = null;
+    let studentSearchRequest = null;
+    
+    function searchEnrollmentStudents() {
+        clearTimeout(studentSearchTimer);
+        const query = $(this).val().trim();
+        studentSearchTimer = setTimeout(() => {
+            if (studentSearchRequest) {
+                studentSearchRequest.abort();
+            }
+            if (!query) {
+                populateStudentDropdown([]);
+                return;
+            }
+            studentSearchRequest = $.ajax({
+                url: '/api/admin/students/search',
+                method: 'GET',
+                headers: { 'Authorization': `Bearer ${token}` },
+                data: { q: query, limit: 20 },
+                success: function(students) {
+                    populateStudentDropdown(students);
+                },
+                error: function(xhr, textStatus) {
+                    if (textStatus !== 'abort') {
+                        showToast(xhr.responseJSON?.detail || 'Student search failed', 'error');
+                    }
+                }
+            });
+        }, 200);
+    }
+    
     // Dropdown population functions
     function populateStudentDropdown(students) {
         const dropdown = $('#enrollment-student');
-        dropdown.empty().append('<option value="">Select Student</option>');
+        const placeholder = $('#enrollment-student-search').val().trim()
+            ? (students.length ? 'Select Student' : 'No matching students')
+            : 'Type to search students';
+        dropdown.empty().append(`<option value="">${placeholder}</option>`);
         
         students.forEach(student => {
             dropdown.append(`<option value="${student.id}">${student.email}</option>`);
@@ -911,7 +955,7 @@ $(document).ready(function() {
             const icon = doc.file_type === 'audio' ? '🎵' : '📄';
             const docEl = $(`
                 <div class="document-item">
-                    <a href="#" onclick="previewMedia('${encodeURIComponent(doc.file_url)}', '${encodeURIComponent(doc.title)}', '${doc.file_type}')" class="document-link">
+                    <a href="#" onclick="previewMedia('${encodeURIComponent(documentUrl(doc))}', '${encodeURIComponent(doc.title)}', '${doc.file_type}')" class="document-link">
                         ${icon} ${doc.title}
                     </a>
                     <button class="btn btn-sm btn-danger" onclick="deleteDocument(${doc.id})">×</button>
@@ -0,0 +1,378 @@
+"""
+Byte-range audio streaming for remotely stored audio documents
+
+Audio is fetched from blob storage in fixed-size segments that are kept in a
+small in-process LRU cache. Each response covers at most AUDIO_MAX_RESPONSE_BYTES
+(players simply ask for the next range), so a seek anywhere in an hour-long
+recording only waits for one segment. The segments after the one just served
+are prefetched in the background.
+
+An origin that ignores Range and answers 200 is read in one streamed pass
+per file instead, cutting the body into the same cached segments as it
+arrives, so later segments and prefetches wait for that pass rather than
+each downloading the whole file again.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Dict, Tuple, Set
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.types import Scope, Receive, Send
+
+import blob_utils
+import crud
+import storage
+
+AUDIO_SEGMENT_SIZE = int(os.getenv("AUDIO_SEGMENT_SIZE", str(256 * 1024)))
+AUDIO_CACHE_BYTES = int(os.getenv("AUDIO_CACHE_BYTES", str(64 * 1024 * 1024)))
+AUDIO_READ_AHEAD_SEGMENTS = int(os.getenv("AUDIO_READ_AHEAD_SEGMENTS", "2"))
+AUDIO_MAX_RESPONSE_BYTES = int(os.getenv("AUDIO_MAX_RESPONSE_BYTES", str(2 * 1024 * 1024)))
+AUDIO_DOCUMENT_TTL = float(os.getenv("AUDIO_DOCUMENT_TTL", "60"))
+# Entries in each of the document / remote size lookup caches
+AUDIO_LOOKUP_CACHE_ENTRIES = int(os.getenv("AUDIO_LOOKUP_CACHE_ENTRIES", "1024"))
+
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# While renditions are still being generated the same URL will serve a different file later
+AUDIO_FALLBACK_CACHE_CONTROL = "no-cache"
+
+class SegmentCache:
+    """LRU of (url, segment index) -> bytes, bounded by total size"""
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.segments: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, int]) -> Optional[bytes]:
+        data = self.segments.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.segments.move_to_end(key)
+        return data
+
+    def put(self, key: Tuple[str, int], data: bytes):
+        if key in self.segments or len(data) > self.max_bytes:
+            return
+        self.segments[key] = data
+        self.current_bytes += len(data)
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self.segments.popitem(last=False)
+            self.current_bytes -= len(evicted)
+
+    def stats(self) -> Dict:
+        return {
+            "segments": len(self.segments),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+class LookupCache:
+    """LRU of key -> value bounded by entry count, entries optionally expiring after ttl seconds"""
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self.ttl is not None and time.monotonic() - stored_at >= self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+class FullPass:
+    """
+    One streamed GET of a file whose origin ignores Range, cut into cached
+    segments as the body arrives; segment(index) waits for its turn
+    """
+    def __init__(self, url: str, total_size: int, response=None):
+        self.url = url
+        self.total_size = total_size
+        # Index of the next segment the pass will produce
+        self.position = 0
+        self.waiters: Dict[int, "asyncio.Future[bytes]"] = {}
+        self.task = asyncio.create_task(self._run(response))
+
+    async def segment(self, index: int) -> bytes:
+        future = self.waiters.get(index)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.waiters[index] = future
+        return await asyncio.shield(future)
+
+    def _deliver(self, data: bytes):
+        segment_cache.put((self.url, self.position), data)
+        future = self.waiters.pop(self.position, None)
+        if future is not None and not future.done():
+            future.set_result(data)
+        self.position += 1
+
+    async def _run(self, response):
+        error: Optional[BaseException] = None
+        try:
+            if response is None:
+                response = await blob_utils.request_with_retries("GET", self.url, stream=True)
+            if response.status_code != 200:
+                raise RuntimeError(f"full download failed: HTTP {response.status_code}")
+            buffer = bytearray()
+            async for chunk in response.aiter_bytes():
+                buffer += chunk
+                while len(buffer) >= AUDIO_SEGMENT_SIZE:
+                    self._deliver(bytes(buffer[:AUDIO_SEGMENT_SIZE]))
+                    del buffer[:AUDIO_SEGMENT_SIZE]
+            if buffer:
+                self._deliver(bytes(buffer))
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if response is not None:
+                await response.aclose()
+            self._release_waiters(error or RuntimeError("full download ended before the requested segment"))
+
+    def _release_waiters(self, error: BaseException):
+        for future in self.waiters.values():
+            if future.done():
+                continue
+            if isinstance(error, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(error)
+                # Nobody may be waiting on this future; don't warn about it
+                future.exception()
+        self.waiters.clear()
+
+segment_cache = SegmentCache(AUDIO_CACHE_BYTES)
+_inflight: Dict[Tuple[str, int], "asyncio.Future[bytes]"] = {}
+_prefetch_tasks: Set[asyncio.Task] = set()
+_remote_sizes = LookupCache(AUDIO_LOOKUP_CACHE_ENTRIES)
+_documents = LookupCache(AUDIO_LOOKUP_CACHE_ENTRIES, ttl=AUDIO_DOCUMENT_TTL)
+# URLs whose origin answered a Range request with 200, and their current full pass
+_ranges_ignored = LookupCache(AUDIO_LOOKUP_CACHE_ENTRIES)
+_full_passes: Dict[str, FullPass] = {}
+
+def _start_full_pass(url: str, total_size: int, response=None) -> FullPass:
+    full_pass = FullPass(url, total_size, response)
+    _full_passes[url] = full_pass
+
+    def finished(task: asyncio.Task):
+        if _full_passes.get(url) is full_pass:
+            del _full_passes[url]
+        if not task.cancelled():
+            task.exception()
+
+    full_pass.task.add_done_callback(finished)
+    return full_pass
+
+async def _full_pass_segment(url: str, index: int, total_size: int) -> bytes:
+    full_pass = _full_passes.get(url)
+    if full_pass is None or full_pass.task.done() or full_pass.position > index:
+        # No pass running, or it is already past this segment (evicted or a seek back)
+        full_pass = _start_full_pass(url, total_size)
+    return await full_pass.segment(index)
+
+async def _fetch_segment(url: str, index: int, total_size: int) -> bytes:
+    if _ranges_ignored.get(url):
+        return await _full_pass_segment(url, index, total_size)
+    start = index * AUDIO_SEGMENT_SIZE
+    end = min(start + AUDIO_SEGMENT_SIZE, total_size) - 1
+    response = await blob_utils.request_with_retries("GET", url, stream=True, headers={"Range": f"bytes={start}-{end}"})
+    if response.status_code == 200:
+        # Origin ignored Range - this response becomes the file's single pass,
+        # unless a concurrent request already started one that can serve it
+        _ranges_ignored.put(url, True)
+        running = _full_passes.get(url)
+        if running is not None and not running.task.done() and running.position <= index:
+            await response.aclose()
+            return await running.segment(index)
+        return await _start_full_pass(url, total_size, response).segment(index)
+    try:
+        if response.status_code == 206:
+            return await response.aread()
+        raise RuntimeError(f"segment fetch failed: HTTP {response.status_code}")
+    finally:
+        await response.aclose()
+
+async def get_segment(url: str, index: int, total_size: int) -> bytes:
+    """Get one segment from cache, joining any in-flight fetch for the same segment"""
+    key = (url, index)
+    data = segment_cache.get(key)
+    if data is not None:
+        return data
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        data = await _fetch_segment(url, index, total_size)
+        segment_cache.put(key, data)
+        future.set_result(data)
+        return data
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Nobody may be waiting on this future; don't warn about it
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+def _prefetch(url: str, first_index: int, total_size: int):
+    last_index = (total_size - 1) // AUDIO_SEGMENT_SIZE
+    for index in range(first_index, min(first_index + AUDIO_READ_AHEAD_SEGMENTS, last_index + 1)):
+        key = (url, index)
+        if key in segment_cache.segments or key in _inflight:
+            continue
+        task = asyncio.create_task(get_segment(url, index, total_size))
+        _prefetch_tasks.add(task)
+        task.add_done_callback(_prefetch_done)
+
+def _prefetch_done(task: asyncio.Task):
+    _prefetch_tasks.discard(task)
+    if not task.cancelled():
+        # Prefetch failures are retried on demand; just consume the exception
+        task.exception()
+
+async def get_remote_size(url: str) -> Optional[int]:
+    """Content length of a remote file (HEAD request, remembered per URL)"""
+    size = _remote_sizes.get(url)
+    if size is not None:
+        return size
+    response = await blob_utils.request_with_retries("HEAD", url)
+    length = response.headers.get("content-length")
+    if response.status_code != 200 or not length:
+        return None
+    _remote_sizes.put(url, int(length))
+    return int(length)
+
+def _load_audio_document(document_id: int) -> Optional[Dict]:
+    document = crud.get_section_document(document_id)
+    if document and document["file_type"] == "audio":
+        document["renditions"] = crud.get_document_renditions(document_id)
+    return document
+
+async def get_audio_document(document_id: int) -> Optional[Dict]:
+    """
+    Document (with its renditions) lookup with a short TTL so scrubbing
+    doesn't hit the database on every range request; missing ids aren't cached
+    """
+    document = _documents.get(document_id)
+    if document is not None:
+        return document
+    document = await run_in_threadpool(_load_audio_document, document_id)
+    if document is not None:
+        _documents.put(document_id, document)
+    return document
+
+def get_stats() -> Dict:
+    """Segment cache statistics"""
+    return {
+        **segment_cache.stats(),
+        "inflight": len(_inflight),
+        "prefetching": len(_prefetch_tasks),
+        "full_passes": len(_full_passes),
+        "segment_size": AUDIO_SEGMENT_SIZE,
+    }
+
+class RemoteAudioResponse(Response):
+    """206/200 response for a remote audio file served from the segment cache"""
+    def __init__(self, url: str, size: int, content_type: str, etag: str, headers, cache_control: str = AUDIO_CACHE_CONTROL):
+        self.url = url
+        self.size = size
+        self.etag = etag
+        self.request_headers = headers
+        super().__init__(headers={
+            "accept-ranges": "bytes",
+            "cache-control": cache_control,
+            "etag": etag,
+            "content-type": content_type,
+            # Of the whole file; each response sends the length of what it serves
+            "content-length": str(size),
+        })
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self._send(scope, send)
+        if self.background is not None:
+            await self.background()
+
+    async def _send(self, scope: Scope, send: Send):
+        # self.raw_headers, so headers added to the response object are sent too
+        base_headers = [header for header in self.raw_headers if header[0] != b"content-length"]
+        if self.request_headers.get("if-none-match") == self.etag:
+            await send({"type": "http.response.start", "status": 304, "headers": base_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        try:
+            byte_range = storage.parse_range(self.request_headers.get("range"), self.size)
+        except ValueError:
+            await send({
+                "type": "http.response.start",
+                "status": 416,
+                "headers": [(b"content-range", f"bytes */{self.size}".encode()), (b"content-length", b"0")],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if byte_range is None and scope["method"] == "HEAD":
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": base_headers + [(b"content-length", str(self.size).encode())],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if byte_range:
+            # Answer ranges with a bounded partial response; players request the rest
+            status = 206
+            start, end = byte_range
+            end = min(end, start + AUDIO_MAX_RESPONSE_BYTES - 1)
+            headers = base_headers + [(b"content-range", f"bytes {start}-{end}/{self.size}".encode())]
+        else:
+            status = 200
+            start, end = 0, self.size - 1
+            headers = list(base_headers)
+        headers.append((b"content-length", str(end - start + 1).encode()))
+
+        first_index = start // AUDIO_SEGMENT_SIZE
+        last_index = end // AUDIO_SEGMENT_SIZE
+        # Fetch the first segment before committing to a status code
+        first = await get_segment(self.url, first_index, self.size)
+        _prefetch(self.url, first_index + 1, self.size)
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        for index in range(first_index, last_index + 1):
+            data = first if index == first_index else await get_segment(self.url, index, self.size)
+            segment_start = index * AUDIO_SEGMENT_SIZE
+            body = data[max(start - segment_start, 0):end - segment_start + 1]
+            await send({"type": "http.response.body", "body": body, "more_body": index < last_index})
+
+        _prefetch(self.url, last_index + 1, self.size)
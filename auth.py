@@ -1,50 +1,106 @@
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
+from contextlib import contextmanager
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-jwt-key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Optional cap on concurrent bcrypt operations (the rest queue instead of piling
+# onto every CPU); unset or 0 means no limit, only the duration is recorded
+BCRYPT_CONCURRENCY = int(os.getenv("BCRYPT_CONCURRENCY") or "0")
+
+_bcrypt_slots = threading.BoundedSemaphore(BCRYPT_CONCURRENCY) if BCRYPT_CONCURRENCY > 0 else None
+
+_pwd_context = None
+_pwd_context_lock = threading.Lock()
+
+def get_pwd_context():
+    """
+    Password hashing context, built on first use
+    passlib and the bcrypt self-test (a full 12-round hash + verify) would
+    otherwise run on every import, i.e. on every serverless cold start
+    """
+    global _pwd_context
+    if _pwd_context is not None:
+        return _pwd_context
+    with _pwd_context_lock:
+        if _pwd_context is None:
+            _pwd_context = _create_pwd_context()
+    return _pwd_context
 
-# Configure bcrypt with explicit settings to avoid compatibility issues
-# Handle serverless environment bcrypt issues
-try:
-    pwd_context = CryptContext(
-        schemes=["bcrypt"], 
-        deprecated="auto",
-        bcrypt__rounds=12,
-        # Add more explicit settings for serverless compatibility
-        bcrypt__default_ident="2b"  # Use most compatible bcrypt variant
-    )
-    # Test bcrypt functionality
-    test_hash = pwd_context.hash("test")
-    if not pwd_context.verify("test", test_hash):
-        raise Exception("Bcrypt verification test failed")
-    print("✅ Bcrypt configured successfully")
-except Exception as e:
-    print(f"⚠️  Bcrypt configuration issue: {e}")
-    print("🔄 Falling back to basic bcrypt configuration")
-    # Fallback configuration for problematic environments
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def _create_pwd_context():
+    from passlib.context import CryptContext
+
+    # Configure bcrypt with explicit settings to avoid compatibility issues
+    # Handle serverless environment bcrypt issues
+    try:
+        pwd_context = CryptContext(
+            schemes=["bcrypt"], 
+            deprecated="auto",
+            bcrypt__rounds=12,
+            # Add more explicit settings for serverless compatibility
+            bcrypt__default_ident="2b"  # Use most compatible bcrypt variant
+        )
+        # Test bcrypt functionality
+        test_hash = pwd_context.hash("test")
+        if not pwd_context.verify("test", test_hash):
+            raise Exception("Bcrypt verification test failed")
+        print("✅ Bcrypt configured successfully")
+    except Exception as e:
+        print(f"⚠️  Bcrypt configuration issue: {e}")
+        print("🔄 Falling back to basic bcrypt configuration")
+        # Fallback configuration for problematic environments
+        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return pwd_context
+
+@contextmanager
+def _bcrypt_slot(operation: str):
+    """
+    Record hashing time, and with BCRYPT_CONCURRENCY set wait for a slot
+    first, recording queue depth and wait time
+    """
+    if _bcrypt_slots is None:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics.bcrypt_duration_seconds.observe(time.perf_counter() - start, operation)
+        return
+    start = time.perf_counter()
+    with metrics.bcrypt_queue_depth.track():
+        _bcrypt_slots.acquire()
+    acquired = time.perf_counter()
+    metrics.bcrypt_wait_seconds.observe(acquired - start, operation)
+    try:
+        yield
+    finally:
+        _bcrypt_slots.release()
+        metrics.bcrypt_duration_seconds.observe(time.perf_counter() - acquired, operation)
 
 def verify_password(plain_password, hashed_password):
     # Handle bcrypt 72-byte limit by truncating long passwords
     if len(plain_password.encode('utf-8')) > 72:
         plain_password = plain_password[:72]
-    return pwd_context.verify(plain_password, hashed_password)
+    with _bcrypt_slot("verify"):
+        return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     # Handle bcrypt 72-byte limit by truncating long passwords
     if len(password.encode('utf-8')) > 72:
         password = password[:72]
-    return pwd_context.hash(password)
+    with _bcrypt_slot("hash"):
+        return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -55,6 +111,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str):
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Cold-start breakdown for the serverless entry point
+
+Each run starts a fresh interpreter, like a new Vercel instance, and times
+three phases: importing the entry module (api/index.py by default), running
+the startup hooks, and serving the first request (/livez). A separate
+`python -X importtime` run attributes the import phase to packages by their
+self time, so the expensive imports are easy to spot.
+Results are printed to stderr; the application's own logs are discarded.
+
+Usage: python benchmarks/cold_start.py [--runs 5] [--entry api.index] [--top 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Runs inside the fresh interpreter; writes phase timings (ms) to argv[2]
+CHILD = """
+import asyncio, importlib, json, sys, time
+start = time.perf_counter()
+app = importlib.import_module(sys.argv[1]).app
+imported = time.perf_counter()
+
+async def boot():
+    # The test client's own import isn't part of the app's startup
+    client_import = time.perf_counter()
+    import httpx
+    client_import = time.perf_counter() - client_import
+    await app.router.startup()
+    started = time.perf_counter()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://cold") as client:
+        await client.get("/livez")
+    served = time.perf_counter()
+    await app.router.shutdown()
+    return started, served, client_import
+
+started, served, client_import = asyncio.run(boot())
+with open(sys.argv[2], "w") as f:
+    json.dump({
+        "import": (imported - start) * 1000,
+        "startup": (started - imported - client_import) * 1000,
+        "first_request": (served - started) * 1000,
+    }, f)
+"""
+
+def run_phases(entry: str) -> dict:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_path = f.name
+    try:
+        subprocess.run(
+            [sys.executable, "-c", CHILD, entry, result_path],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True,
+        )
+        with open(result_path) as f:
+            return json.load(f)
+    finally:
+        os.unlink(result_path)
+
+def import_breakdown(entry: str) -> dict:
+    """Self time per top-level package (ms) from -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {entry}"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    totals: dict = defaultdict(float)
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, module = line[len("import time:"):].split("|", 2)
+        totals[module.strip().split(".")[0]] += int(self_us) / 1000
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--entry", default="api.index", help="module exposing `app`")
+    parser.add_argument("--top", type=int, default=15, help="packages to list in the import breakdown")
+    args = parser.parse_args()
+
+    runs = [run_phases(args.entry) for _ in range(args.runs)]
+    print(f"Cold start of {args.entry}: median of {args.runs} fresh interpreters", file=sys.stderr)
+    total = 0.0
+    for phase in ("import", "startup", "first_request"):
+        median = statistics.median(run[phase] for run in runs)
+        total += median
+        print(f"  {phase:<16} {median:8.1f} ms", file=sys.stderr)
+    print(f"  {'total':<16} {total:8.1f} ms", file=sys.stderr)
+
+    totals = import_breakdown(args.entry)
+    print(f"\nImport self time by package (-X importtime, single run, {sum(totals.values()):.1f} ms total)", file=sys.stderr)
+    for package, ms in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {package:<24} {ms:8.1f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Synthetic production-scale dataset for load tests and index tuning
+
+Like benchmarks/seed.py it resets the application tables of a bench
+database, but the data is shaped like a real deployment and sized by the
+caller:
+
+- sections per course, documents per section and text lengths follow
+  log-normal distributions around the given means
+- documents are mostly PDFs with some audio, with the metadata the
+  background jobs would have extracted (page count / duration)
+- course popularity is Zipf-distributed (--skew), and enrollments per
+  student are log-normal, summing to exactly --enrollments
+- a small share of students and courses is inactive
+
+Rows are written with COPY, explicit ids and the sequences moved past
+them; student_course is loaded without its keys, which are re-added
+afterwards, and the tables are ANALYZEd at the end. Everything comes from one seeded RNG
+and a fixed reference date, so a given set of arguments always produces
+the same database. Accounts share bench-password, and the emails match
+seed.py, so the load test can log in as any student.
+
+Usage: python benchmarks/generate_data.py --database-url postgresql://localhost/sloka_bench --students 100000 --courses 2000 --enrollments 1000000
+"""
+import argparse
+import bisect
+import io
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import seed as bench_seed
+
+# Data spans the two years before this date, so runs don't depend on today
+REFERENCE_DATE = datetime(2026, 1, 1)
+HISTORY_DAYS = 730
+INACTIVE_STUDENT_RATIO = 0.03
+INACTIVE_COURSE_RATIO = 0.05
+AUDIO_RATIO = 0.25
+# Nobody takes more than this many courses
+MAX_ENROLLMENTS_PER_STUDENT = 60
+
+def _lognormal_int(rng: random.Random, mean: float, sigma: float, low: int, high: int) -> int:
+    """Log-normal sample with the given mean, rounded and clamped"""
+    mu = math.log(max(mean, 1e-9)) - sigma * sigma / 2
+    return min(max(int(round(rng.lognormvariate(mu, sigma))), low), high)
+
+def _timestamp(rng: random.Random) -> datetime:
+    return REFERENCE_DATE - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+
+def _paragraphs(rng: random.Random, words: int) -> str:
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(6, 18))
+        sentences.append(bench_seed._text(rng, length))
+        words -= length
+    return "\n\n".join(" ".join(sentences[i:i + 6]) for i in range(0, len(sentences), 6))
+
+def _copy(cursor, table: str, columns: List[str], rows) -> int:
+    count = 0
+    with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+            count += 1
+    if "id" in columns:
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), GREATEST((SELECT MAX(id) FROM {table}), 1))")
+    return count
+
+def _drop_constraints(cursor, table: str) -> List[str]:
+    """Drop a table's primary key and foreign keys; returns the statements that restore them"""
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'f') ORDER BY contype DESC",
+        (table,),
+    )
+    restore = []
+    for name, definition in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+        restore.append(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    return restore
+
+def enrollment_counts(rng: random.Random, students: int, courses: int, enrollments: int) -> List[int]:
+    """Courses per student: log-normal around the mean, adjusted to sum to `enrollments`"""
+    cap = min(courses, MAX_ENROLLMENTS_PER_STUDENT)
+    if enrollments > students * cap:
+        raise SystemExit(f"{enrollments} enrollments don't fit {students} students x {cap} courses each")
+    mean = enrollments / students if students else 0
+    counts = [_lognormal_int(rng, mean, 0.9, 0, cap) for _ in range(students)] if mean else [0] * students
+    diff = enrollments - sum(counts)
+    while diff:
+        i = rng.randrange(students)
+        if diff > 0 and counts[i] < cap:
+            counts[i] += 1
+            diff -= 1
+        elif diff < 0 and counts[i] > 0:
+            counts[i] -= 1
+            diff += 1
+    return counts
+
+def generate(
+    database_url: str,
+    students: int = 10000,
+    courses: int = 200,
+    sections_per_course: float = 6,
+    documents_per_section: float = 3,
+    enrollments: int = 50000,
+    skew: float = 1.1,
+    storage_dir: Optional[Path] = None,
+    random_seed: int = 42,
+) -> Dict:
+    """Reset and fill the database; returns the same summary as seed.seed() plus counts and timings"""
+    os.environ["DATABASE_URL"] = database_url
+    import auth
+    import database
+
+    rng = random.Random(random_seed)
+    timings = {}
+    started = time.perf_counter()
+    database.create_tables()
+    password_hash = auth.get_password_hash(bench_seed.STUDENT_PASSWORD)
+
+    pdf_url = "https://example.com/bench/sample.pdf"
+    if storage_dir is not None:
+        import storage
+        sha256 = storage.LocalDiskBackend(Path(storage_dir))._write(io.BytesIO(bench_seed.sample_pdf()))
+        pdf_url = f"{storage.FILES_URL_PREFIX}{sha256}/sample.pdf"
+    audio_url = "https://example.com/bench/sample.mp3"
+    timings["prepare"] = time.perf_counter() - started
+
+    with database.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"TRUNCATE {', '.join(bench_seed.APP_TABLES)} RESTART IDENTITY CASCADE")
+        cursor.execute(
+            """
+            INSERT INTO admins (email, hashed_password, is_active) VALUES (%s, %s, TRUE)
+            ON CONFLICT (email) DO UPDATE SET hashed_password = EXCLUDED.hashed_password, is_active = TRUE
+            """,
+            (bench_seed.ADMIN_EMAIL, password_hash),
+        )
+
+        phase = time.perf_counter()
+        course_rows = (
+            (
+                course_id,
+                bench_seed._text(rng, _lognormal_int(rng, 4, 0.4, 2, 10))[:-1],
+                bench_seed._text(rng, _lognormal_int(rng, 40, 0.5, 8, 200)),
+                _paragraphs(rng, _lognormal_int(rng, 900, 0.8, 50, 20000)),
+                bench_seed._text(rng, 2)[:-1],
+                f"{rng.randint(2, 24)} weeks",
+                _timestamp(rng),
+                rng.random() >= INACTIVE_COURSE_RATIO,
+            )
+            for course_id in range(1, courses + 1)
+        )
+        _copy(cursor, "courses", ["id", "title", "description", "content", "instructor", "duration", "created_at", "is_active"], course_rows)
+        timings["courses"] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        section_counts = [_lognormal_int(rng, sections_per_course, 0.5, 1, 60) for _ in range(courses)]
+        section_ids = itertools.count(1)
+        section_rows = (
+            (next(section_ids), course_id, f"Section {order + 1}: {bench_seed._text(rng, rng.randint(2, 6))[:-1]}", bench_seed._text(rng, _lognormal_int(rng, 25, 0.6, 0, 150)), order, _timestamp(rng))
+            for course_id, count in zip(range(1, courses + 1), section_counts)
+            for order in range(count)
+        )
+        section_total = _copy(cursor, "course_sections", ["id", "course_id", "title", "description", "order_index", "created_at"], section_rows)
+
+        def document_rows():
+            document_id = 0
+            for section_id in range(1, section_total + 1):
+                for order in range(_lognormal_int(rng, documents_per_section, 0.7, 0, 40)):
+                    document_id += 1
+                    if rng.random() < AUDIO_RATIO:
+                        minutes = _lognormal_int(rng, 35, 0.6, 1, 300)
+                        metadata = {"duration_seconds": minutes * 60.0, "bitrate": 128000, "codec": "mp3", "sample_rate": 44100, "channels": 2}
+                        yield document_id, section_id, f"Talk {order + 1}", audio_url, "audio", order, json.dumps(metadata), _timestamp(rng)
+                    else:
+                        metadata = {"page_count": _lognormal_int(rng, 18, 0.9, 1, 800)}
+                        yield document_id, section_id, f"Reading {order + 1}", pdf_url, "document", order, json.dumps(metadata), _timestamp(rng)
+
+        document_total = _copy(cursor, "section_documents", ["id", "section_id", "title", "file_url", "file_type", "order_index", "metadata", "created_at"], document_rows())
+        timings["sections_documents"] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        student_active = [rng.random() >= INACTIVE_STUDENT_RATIO for _ in range(students)]
+        student_rows = (
+            (i + 1, bench_seed.student_email(i), password_hash, _timestamp(rng), student_active[i])
+            for i in range(students)
+        )
+        _copy(cursor, "students", ["id", "email", "hashed_password", "created_at", "is_active"], student_rows)
+        timings["students"] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        # Popularity rank is independent of id, so popular courses aren't all old or new
+        ranks = list(range(1, courses + 1))
+        rng.shuffle(ranks)
+        cum_weights = list(itertools.accumulate(1 / rank ** skew for rank in ranks))
+        course_ids = range(1, courses + 1)
+
+        def enrollment_rows():
+            for student_id, count in enumerate(enrollment_counts(rng, students, courses, enrollments), start=1):
+                if count * 2 > courses:
+                    picked = set(rng.sample(course_ids, count))
+                else:
+                    picked = set()
+                    while len(picked) < count:
+                        picked.update(
+                            course_ids[bisect.bisect(cum_weights, rng.random() * cum_weights[-1])]
+                            for _ in range(count - len(picked))
+                        )
+                for course_id in sorted(picked):
+                    yield student_id, course_id
+
+        # Building the primary key and checking the foreign keys once at the
+        # end is several times faster than doing it row by row
+        restore = _drop_constraints(cursor, "student_course")
+        enrollment_total = _copy(cursor, "student_course", ["student_id", "course_id"], enrollment_rows())
+        for statement in restore:
+            cursor.execute(statement)
+        timings["enrollments"] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        conn.commit()
+        conn.autocommit = True
+        cursor.execute("ANALYZE courses, course_sections, section_documents, students, student_course")
+        timings["commit_analyze"] = time.perf_counter() - phase
+    timings["total"] = time.perf_counter() - started
+
+    return {
+        "courses": courses,
+        "sections": section_total,
+        "documents": document_total,
+        "students": students,
+        "enrollments": enrollment_total,
+        # Only accounts that can log in
+        "student_emails": [bench_seed.student_email(i) for i in range(students) if student_active[i]],
+        "student_password": bench_seed.STUDENT_PASSWORD,
+        "admin_email": bench_seed.ADMIN_EMAIL,
+        "admin_password": bench_seed.ADMIN_PASSWORD,
+        "pdf_url": pdf_url,
+        "timings_s": {name: round(seconds, 2) for name, seconds in timings.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=bench_seed.DEFAULT_DATABASE_URL)
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--sections-per-course", type=float, default=6, help="mean")
+    parser.add_argument("--documents-per-section", type=float, default=3, help="mean")
+    parser.add_argument("--enrollments", type=int, default=50000, help="total student_course rows")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of course popularity (0 = uniform)")
+    parser.add_argument("--storage-dir", type=Path, help="LOCAL_STORAGE_DIR to put the sample PDF in")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="reset a database whatever its name")
+    args = parser.parse_args()
+
+    bench_seed.check_database_url(args.database_url, args.force)
+    summary = generate(
+        args.database_url, args.students, args.courses, args.sections_per_course, args.documents_per_section,
+        args.enrollments, args.skew, args.storage_dir, args.random_seed,
+    )
+    summary.pop("student_emails")
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Load test: seeded local Postgres, a real server process and scripted user journeys
+
+Seeds the database (benchmarks/seed.py, or generate_data.py with
+--synthetic for production-shaped data), starts the app (uvicorn, or
+gunicorn with gunicorn.conf.py) against it with local file storage, waits
+for /readyz and then runs each scenario for --duration seconds with
+--concurrency virtual users looping over its journey:
+
+- browse:    anonymous catalog browsing (page, assets, course list, course detail)
+- student:   student login, then the dashboard (my courses, profile, a course)
+- admin:     admin editing storm (course and section updates, admin listing)
+- upload:    upload bursts (multipart document uploads into random sections)
+- pdf:       PDF viewing through /api/pdf-proxy, whole file and ranged
+
+Reports requests, errors, error rate, RPS and p50/p95/p99 latency per
+scenario and per endpoint as JSON (stdout, or --output). --base-url runs
+against an already running server (seeding with --seed still works, but
+uploads and PDFs then need that server to use the same local storage).
+
+Usage: python benchmarks/load_test.py [--scenarios browse,student] [--concurrency 20] [--duration 30] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import httpx
+
+import generate_data
+import seed as bench_seed
+
+ROOT = Path(__file__).resolve().parent.parent
+
+class Recorder:
+    """Latency samples and errors per endpoint label"""
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_samples: List[str] = []
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, label: str, ok=(200,), **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.latencies[label].append((time.perf_counter() - start) * 1000)
+            self._error(label, f"{label}: {type(e).__name__}")
+            return None
+        self.latencies[label].append((time.perf_counter() - start) * 1000)
+        if response.status_code not in ok:
+            self._error(label, f"{label}: HTTP {response.status_code}")
+        return response
+
+    def _error(self, label: str, sample: str):
+        self.errors[label] += 1
+        if len(self.error_samples) < 20:
+            self.error_samples.append(sample)
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "error_rate": round(errors / len(values), 4) if values else 0.0,
+        "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(values, 0.50), 2),
+            "p95": round(percentile(values, 0.95), 2),
+            "p99": round(percentile(values, 0.99), 2),
+            "max": round(values[-1], 2) if values else 0.0,
+            "mean": round(statistics.fmean(values), 2) if values else 0.0,
+        },
+    }
+
+# Scenarios: one journey of one virtual user; `state` is per user, `data` is the seed summary
+
+async def browse(client, rec: Recorder, data: Dict, state: Dict, rng: random.Random):
+    await rec.request(client, "GET", "/", "GET /")
+    await rec.request(client, "GET", "/static/app.js", "GET /static/app.js", headers={"Accept-Encoding": "br, gzip"})
+    await rec.request(client, "GET", "/api/courses", "GET /api/courses", headers={"Accept-Encoding": "br, gzip"})
+    for _ in range(2):
+        await rec.request(client, "GET", f"/api/courses/{rng.randint(1, data['courses'])}", "GET /api/courses/{id}")
+
+async def student(client, rec: Recorder, data: Dict, state: Dict, rng: random.Random):
+    email = rng.choice(data["student_emails"])
+    response = await rec.request(
+        client, "POST", "/api/auth/student/login", "POST /api/auth/student/login",
+        json={"email": email, "password": data["student_password"]},
+    )
+    if response is None or response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}", "Accept-Encoding": "br, gzip"}
+    await rec.request(client, "GET", "/api/student/courses", "GET /api/student/courses", headers=headers)
+    await rec.request(client, "GET", "/api/student/profile", "GET /api/student/profile", headers=headers)
+    await rec.request(client, "GET", f"/api/courses/{rng.randint(1, data['courses'])}", "GET /api/courses/{id}", headers=headers)
+
+async def _admin_headers(client, rec: Recorder, data: Dict, state: Dict) -> Optional[Dict]:
+    if "admin_headers" not in state:
+        response = await rec.request(
+            client, "POST", "/api/auth/admin/login", "POST /api/auth/admin/login",
+            json={"email": data["admin_email"], "password": data["admin_password"]},
+        )
+        if response is None or response.status_code != 200:
+            return None
+        state["admin_headers"] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return state["admin_headers"]
+
+async def admin(client, rec: Recorder, data: Dict, state: Dict, rng: random.Random):
+    headers = await _admin_headers(client, rec, data, state)
+    if headers is None:
+        return
+    course_id = rng.randint(1, data["courses"])
+    await rec.request(
+        client, "PUT", f"/api/admin/courses/{course_id}", "PUT /api/admin/courses/{id}", headers=headers,
+        json={"description": f"Edited at {time.time():.3f}", "duration": f"{rng.randint(4, 16)} weeks"},
+    )
+    await rec.request(
+        client, "PUT", f"/api/admin/sections/{rng.randint(1, data['sections'])}", "PUT /api/admin/sections/{id}", headers=headers,
+        json={"description": f"Edited at {time.time():.3f}"},
+    )
+    await rec.request(client, "GET", f"/api/admin/courses/{course_id}/sections", "GET /api/admin/courses/{id}/sections", headers=headers)
+    await rec.request(client, "GET", "/api/admin/courses", "GET /api/admin/courses", headers=headers)
+
+async def upload(client, rec: Recorder, data: Dict, state: Dict, rng: random.Random):
+    headers = await _admin_headers(client, rec, data, state)
+    if headers is None:
+        return
+    # Unique content each time, so deduplication doesn't turn uploads into lookups
+    content = bench_seed.sample_pdf(rng.randint(32, 512) * 1024)[:-6] + os.urandom(16) + b"\n%%EOF\n"
+    await rec.request(
+        client, "POST", f"/api/admin/sections/{rng.randint(1, data['sections'])}/documents", "POST /api/admin/sections/{id}/documents",
+        headers=headers, data={"title": "Load test upload"}, files={"file": ("upload.pdf", content, "application/pdf")},
+    )
+
+async def pdf(client, rec: Recorder, data: Dict, state: Dict, rng: random.Random):
+    url = data["pdf_url"]
+    await rec.request(client, "GET", "/api/pdf-proxy", "GET /api/pdf-proxy", params={"url": url})
+    await rec.request(client, "GET", "/api/pdf-proxy", "GET /api/pdf-proxy (range)", ok=(206,), params={"url": url}, headers={"Range": "bytes=0-16383"})
+
+SCENARIOS: Dict[str, Callable] = {"browse": browse, "student": student, "admin": admin, "upload": upload, "pdf": pdf}
+
+async def run_scenario(name: str, base_url: str, data: Dict, concurrency: int, duration: float, timeout: float) -> Dict:
+    journey = SCENARIOS[name]
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        deadline = time.perf_counter() + duration
+
+        async def user(index: int):
+            rng = random.Random(index)
+            state: Dict = {}
+            while time.perf_counter() < deadline:
+                await journey(client, rec, data, state, rng)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    all_latencies = [value for values in rec.latencies.values() for value in values]
+    result = summarize(all_latencies, sum(rec.errors.values()), elapsed)
+    result["concurrency"] = concurrency
+    result["duration_s"] = round(elapsed, 2)
+    result["endpoints"] = {label: summarize(values, rec.errors[label], elapsed) for label, values in sorted(rec.latencies.items())}
+    if rec.error_samples:
+        result["error_samples"] = rec.error_samples
+    return result
+
+def start_server(args, database_url: str, storage_dir: Path, log_path: Path) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "ENVIRONMENT": "production",
+        "STORAGE_BACKEND": "local",
+        "LOCAL_STORAGE_DIR": str(storage_dir),
+        "JOB_WORKER_MODE": "external",
+        "LOG_FILE": "",
+        "LOG_REQUEST_SAMPLE_RATE": "0",
+        "ADMIN_EMAIL": bench_seed.ADMIN_EMAIL,
+        "HOST": "127.0.0.1",
+        "PORT": str(args.port),
+        "WEB_WORKERS": str(args.workers),
+    }
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+            "--workers", str(args.workers), "--no-access-log",
+        ]
+    log = open(log_path, "w")
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+def wait_ready(base_url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"Server at {base_url} did not become ready within {timeout:g}s")
+
+def stop_server(process: subprocess.Popen):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users per scenario")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per scenario")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    parser.add_argument("--database-url", default=bench_seed.DEFAULT_DATABASE_URL)
+    parser.add_argument("--base-url", help="use a running server instead of starting one")
+    parser.add_argument("--seed", action=argparse.BooleanOptionalAction, default=True, help="reset and seed the database first")
+    parser.add_argument("--courses", type=int, default=20)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--synthetic", action="store_true", help="seed production-shaped data with generate_data.py")
+    parser.add_argument("--enrollments", type=int, help="with --synthetic: total enrollments (default 5 per student)")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--force", action="store_true", help="reset a database whatever its name")
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    work_dir = Path(tempfile.mkdtemp(prefix="sloka-loadtest-"))
+    storage_dir = work_dir / "storage"
+    if args.seed:
+        bench_seed.check_database_url(args.database_url, args.force)
+        print(f"🌱 Seeding {args.database_url}", file=sys.stderr)
+        if args.synthetic:
+            data = generate_data.generate(
+                args.database_url, students=args.students, courses=args.courses,
+                enrollments=args.enrollments or args.students * 5, storage_dir=storage_dir,
+            )
+        else:
+            data = bench_seed.seed(args.database_url, courses=args.courses, students=args.students, storage_dir=storage_dir)
+    else:
+        data = {
+            "courses": args.courses, "sections": args.courses * 4, "students": args.students,
+            "student_emails": [bench_seed.student_email(i) for i in range(args.students)],
+            "student_password": bench_seed.STUDENT_PASSWORD,
+            "admin_email": bench_seed.ADMIN_EMAIL, "admin_password": bench_seed.ADMIN_PASSWORD,
+            "pdf_url": "https://example.com/bench/sample.pdf",
+        }
+
+    server = None
+    base_url = args.base_url
+    completed = False
+    try:
+        if base_url is None:
+            base_url = f"http://127.0.0.1:{args.port}"
+            log_path = work_dir / "server.log"
+            print(f"🚀 Starting {args.server} ({args.workers} workers), log: {log_path}", file=sys.stderr)
+            server = start_server(args, args.database_url, storage_dir, log_path)
+        wait_ready(base_url)
+
+        report = {
+            "config": {
+                "base_url": base_url,
+                "server": None if args.base_url else args.server,
+                "workers": None if args.base_url else args.workers,
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "courses": data["courses"],
+                "students": data["students"],
+            },
+            "scenarios": {},
+        }
+        for name in scenarios:
+            print(f"🏃 {name}: {args.concurrency} users for {args.duration:g}s", file=sys.stderr)
+            result = asyncio.run(run_scenario(name, base_url, data, args.concurrency, args.duration, args.timeout))
+            report["scenarios"][name] = result
+            latency = result["latency_ms"]
+            print(
+                f"   {result['rps']:8.1f} req/s  p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  p99 {latency['p99']:.1f} ms"
+                f"  errors {result['error_rate']:.2%}",
+                file=sys.stderr,
+            )
+        completed = True
+    finally:
+        if server is not None:
+            stop_server(server)
+        if completed:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"⚠️  Kept {work_dir} (server log, storage) for inspection", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+        print(f"📄 Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the crud/auth hot paths with a regression gate
+
+Times the individual functions behind the busiest endpoints against a
+local Postgres seeded by benchmarks/seed.py (same data every run): the
+catalog and enrollment queries, JWT creation and verification, and the
+JSON encoding FastAPI does for their results. Each benchmark is
+calibrated to run for at least --min-time per round; the median per-call
+time over --rounds rounds is what gets stored and compared.
+
+    run      time everything, optionally --save the results as the baseline
+    compare  time everything again (or load --current) and exit 1 when a
+             benchmark's median is slower than the baseline's by more than
+             --tolerance and even its fastest round is slower than the
+             baseline median (so one noisy round doesn't fail the gate)
+
+Baselines depend on the machine and Postgres setup, so compare only
+against one recorded on the same box. Results are printed to stderr.
+
+Usage: python benchmarks/microbench.py run --save
+       python benchmarks/microbench.py compare [--tolerance 0.15] [--bench-tolerance get_courses=0.3]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import generate_data
+import seed as bench_seed
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "results" / "microbench-baseline.json"
+DEFAULT_TOLERANCE = float(os.getenv("MICROBENCH_TOLERANCE", "0.15"))
+
+def _benchmarks(data: Dict) -> Dict[str, Callable[[], object]]:
+    """name -> zero-argument callable; imports happen after DATABASE_URL is set"""
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    import auth
+    import crud
+
+    course_id, student_id = 1, 1
+    token = auth.create_access_token({"sub": data["admin_email"], "type": "admin"})
+    courses = crud.get_courses(0, 100)
+    sections = crud.get_course_sections(course_id)
+    student_courses = crud.get_student_courses(student_id)
+
+    def encode(content):
+        # What FastAPI does with a returned dict/list
+        return JSONResponse(jsonable_encoder(content)).body
+
+    return {
+        "crud.get_courses": lambda: crud.get_courses(0, 100),
+        "crud.get_course_by_id": lambda: crud.get_course_by_id(course_id),
+        "crud.get_student_courses": lambda: crud.get_student_courses(student_id),
+        "crud.get_course_sections": lambda: crud.get_course_sections(course_id),
+        "auth.create_access_token": lambda: auth.create_access_token({"sub": data["admin_email"], "type": "admin"}),
+        "auth.verify_token": lambda: auth.verify_token(token),
+        "json.courses": lambda: encode(courses),
+        "json.course_sections": lambda: encode(sections),
+        "json.student_courses": lambda: encode(student_courses),
+    }
+
+def measure(fn: Callable[[], object], rounds: int, min_time: float) -> Dict:
+    """Per-call timings in microseconds over `rounds` calibrated rounds"""
+    for _ in range(3):
+        fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+
+    per_call_us = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call_us.append((time.perf_counter() - start) / number * 1e6)
+    return {
+        "median_us": round(statistics.median(per_call_us), 3),
+        "min_us": round(min(per_call_us), 3),
+        "stdev_us": round(statistics.stdev(per_call_us), 3) if rounds > 1 else 0.0,
+        "rounds": rounds,
+        "number": number,
+    }
+
+def run(args) -> Dict:
+    if args.seed:
+        bench_seed.check_database_url(args.database_url, args.force)
+        print(f"🌱 Seeding {args.database_url}", file=sys.stderr)
+        if args.synthetic:
+            data = generate_data.generate(args.database_url, students=args.students, courses=args.courses, enrollments=args.enrollments or args.students * 5)
+        else:
+            data = bench_seed.seed(args.database_url, courses=args.courses, students=args.students)
+    else:
+        os.environ["DATABASE_URL"] = args.database_url
+        data = {"admin_email": bench_seed.ADMIN_EMAIL}
+
+    benchmarks = _benchmarks(data)
+    selected = [name for name in benchmarks if not args.filter or any(f in name for f in args.filter)]
+    results = {}
+    for name in selected:
+        results[name] = measure(benchmarks[name], args.rounds, args.min_time)
+        result = results[name]
+        print(f"  {name:<28} {result['median_us']:>10.1f} µs  (min {result['min_us']:.1f}, ±{result['stdev_us']:.1f}, {result['number']}x{result['rounds']})", file=sys.stderr)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.node(),
+            "courses": args.courses,
+            "students": args.students,
+            "synthetic": args.synthetic,
+            "rounds": args.rounds,
+            "min_time_s": args.min_time,
+        },
+        "results": results,
+    }
+
+def compare(baseline: Dict, current: Dict, tolerance: float, overrides: Dict[str, float]) -> List[str]:
+    """Print a comparison table; returns the names of regressed benchmarks"""
+    regressions = []
+    print(f"  {'benchmark':<28} {'baseline µs':>12} {'current µs':>12} {'change':>8}", file=sys.stderr)
+    for name, base in baseline["results"].items():
+        now = current["results"].get(name)
+        if now is None:
+            print(f"  {name:<28} {base['median_us']:>12.1f} {'-':>12} {'skipped':>8}", file=sys.stderr)
+            continue
+        change = now["median_us"] / base["median_us"] - 1
+        limit = overrides.get(name, tolerance)
+        regressed = change > limit and now["min_us"] > base["median_us"]
+        if regressed:
+            regressions.append(name)
+        marker = "❌" if regressed else ("🚀" if change < -limit else "  ")
+        print(f"{marker}{name:<28} {base['median_us']:>12.1f} {now['median_us']:>12.1f} {change:>+8.1%}", file=sys.stderr)
+    for name in current["results"].keys() - baseline["results"].keys():
+        print(f"  {name:<28} {'-':>12} {current['results'][name]['median_us']:>12.1f} {'new':>8}", file=sys.stderr)
+    return regressions
+
+def _parse_overrides(items: List[str], parser: argparse.ArgumentParser) -> Dict[str, float]:
+    overrides = {}
+    for item in items:
+        name, sep, value = item.partition("=")
+        try:
+            overrides[name] = float(value)
+        except ValueError:
+            sep = ""
+        if not sep:
+            parser.error(f"--bench-tolerance expects NAME=FRACTION, got {item!r}")
+    return overrides
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_run_options(sub: argparse.ArgumentParser):
+        sub.add_argument("--database-url", default=bench_seed.DEFAULT_DATABASE_URL)
+        sub.add_argument("--seed", action=argparse.BooleanOptionalAction, default=True, help="reset and seed the database first")
+        sub.add_argument("--courses", type=int, default=20)
+        sub.add_argument("--students", type=int, default=200)
+        sub.add_argument("--synthetic", action="store_true", help="seed production-shaped data with generate_data.py")
+        sub.add_argument("--enrollments", type=int, help="with --synthetic: total enrollments (default 5 per student)")
+        sub.add_argument("--force", action="store_true", help="reset a database whatever its name")
+        sub.add_argument("--rounds", type=int, default=9)
+        sub.add_argument("--min-time", type=float, default=0.3, help="minimum seconds per round")
+        sub.add_argument("--filter", action="append", help="only benchmarks whose name contains this (repeatable)")
+
+    run_parser = subparsers.add_parser("run", help="time the benchmarks")
+    add_run_options(run_parser)
+    run_parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, type=Path, help=f"write the results (default {DEFAULT_BASELINE})")
+
+    compare_parser = subparsers.add_parser("compare", help="fail if slower than the baseline")
+    add_run_options(compare_parser)
+    compare_parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    compare_parser.add_argument("--current", type=Path, help="results from an earlier `run --save` instead of running now")
+    compare_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown as a fraction (0.15 = 15%%)")
+    compare_parser.add_argument("--bench-tolerance", action="append", default=[], metavar="NAME=FRACTION", help="per-benchmark tolerance")
+    compare_parser.add_argument("--save", type=Path, help="also write the current results here")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(args)
+        if args.save:
+            args.save.parent.mkdir(parents=True, exist_ok=True)
+            args.save.write_text(json.dumps(results, indent=2), encoding="utf-8")
+            print(f"💾 Saved {len(results['results'])} results to {args.save}", file=sys.stderr)
+        return
+
+    overrides = _parse_overrides(args.bench_tolerance, compare_parser)
+    if not args.baseline.exists():
+        raise SystemExit(f"No baseline at {args.baseline}: record one with `python benchmarks/microbench.py run --save`")
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    current = json.loads(args.current.read_text(encoding="utf-8")) if args.current else run(args)
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(current, indent=2), encoding="utf-8")
+
+    regressions = compare(baseline, current, args.tolerance, overrides)
+    if regressions:
+        print(f"❌ {len(regressions)} regressed beyond tolerance: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ No regressions beyond {args.tolerance:.0%}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
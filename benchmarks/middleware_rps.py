@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Requests per second with and without RequestTimingMiddleware
+
+Runs the real app in-process through httpx's ASGI transport with a number
+of concurrent clients, once with the middleware stack as configured and
+once with RequestTimingMiddleware removed. /api/courses needs a reachable
+DATABASE_URL; any other path can be benchmarked with --path.
+Application logs go to stdout, so redirect it; results are printed to stderr.
+
+Usage: python benchmarks/middleware_rps.py [--path /api/courses] [--seconds 5] [--concurrency 20] > /dev/null
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+async def measure(app, path: str, seconds: float, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(50):
+            await client.get(path)
+
+        completed = 0
+        deadline = time.perf_counter() + seconds
+
+        async def client_loop():
+            nonlocal completed
+            while time.perf_counter() < deadline:
+                await client.get(path)
+                completed += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        return completed / (time.perf_counter() - start)
+
+async def run(path: str, seconds: float, concurrency: int):
+    import middleware
+    from main import app
+
+    configured = list(app.user_middleware)
+    results = {}
+    for label, stack in (
+        ("with RequestTimingMiddleware", configured),
+        ("without", [m for m in configured if m.cls is not middleware.RequestTimingMiddleware]),
+    ):
+        app.user_middleware = stack
+        app.middleware_stack = app.build_middleware_stack()
+        results[label] = await measure(app, path, seconds, concurrency)
+    app.user_middleware = configured
+    app.middleware_stack = app.build_middleware_stack()
+
+    print(f"GET {path}: {concurrency} concurrent clients, {seconds:g}s per run", file=sys.stderr)
+    for label, rps in results.items():
+        print(f"  {label:<30} {rps:8.0f} req/s", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare throughput with and without the timing middleware")
+    parser.add_argument("--path", default="/api/courses")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.path, args.seconds, args.concurrency))
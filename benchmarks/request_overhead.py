@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Per-request overhead of the middleware/logging stack
+
+Drives the real app in-process (no network, no server) with httpx's ASGI
+transport and reports the mean time per request. Application logs go to
+stdout as usual, so redirect it; results are printed to stderr.
+
+Usage: python benchmarks/request_overhead.py [--path /api/health] [--requests 2000] > /dev/null
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+async def run(path: str, requests: int, rounds: int):
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up routing, imports and caches
+        for _ in range(50):
+            await client.get(path)
+
+        per_request_us = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(requests):
+                await client.get(path)
+            per_request_us.append((time.perf_counter() - start) / requests * 1e6)
+
+    print(f"GET {path}: {requests} requests x {rounds} rounds", file=sys.stderr)
+    print(f"  median {statistics.median(per_request_us):.1f} µs/request, best {min(per_request_us):.1f} µs/request", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure per-request overhead in-process")
+    parser.add_argument("--path", default="/api/health")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.path, args.requests, args.rounds))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Deterministic benchmark dataset for a local Postgres
+
+Creates the schema, empties the application tables (admins are kept) and
+inserts a fixed set of courses, sections, documents, students and
+enrollments from a seeded RNG, so two runs against the same database see
+the same data. Every student shares one password and there is a dedicated
+admin, so one bcrypt hash covers all accounts. With --storage-dir a small
+sample PDF is written to local storage (STORAGE_BACKEND=local) and the
+document rows point at it.
+
+Only databases whose name contains "bench", "loadtest" or "test" are
+reset unless --force is given.
+
+Usage: python benchmarks/seed.py --database-url postgresql://localhost/sloka_bench [--courses 20] [--students 200]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+DEFAULT_DATABASE_URL = os.getenv("BENCH_DATABASE_URL", "postgresql://localhost/sloka_bench")
+ADMIN_EMAIL = "bench-admin@example.com"
+STUDENT_PASSWORD = ADMIN_PASSWORD = "bench-password"
+SAFE_DATABASE_MARKERS = ("bench", "loadtest", "test")
+
+APP_TABLES = ("student_course", "document_renditions", "section_documents", "course_sections", "courses", "students", "blobs", "jobs")
+
+WORDS = (
+    "dharma karma yoga bhakti jnana atman brahman sadhana satsang mantra sloka gita upanishad "
+    "veda shanti seva guru shishya prana dhyana samadhi viveka vairagya ananda sattva"
+).split()
+
+def student_email(index: int) -> str:
+    return f"bench-student-{index}@example.com"
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def sample_pdf(size: int = 64 * 1024) -> bytes:
+    """A one-page PDF padded with a comment to roughly `size` bytes"""
+    body = (
+        b"%PDF-1.4\n"
+        b"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+        b"2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n"
+        b"3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >> endobj\n"
+    )
+    padding = b"%" + b"x" * max(size - len(body) - 64, 0) + b"\n"
+    return body + padding + b"trailer << /Root 1 0 R >>\n%%EOF\n"
+
+def check_database_url(database_url: str, force: bool = False):
+    name = urlparse(database_url).path.lstrip("/")
+    if not force and not any(marker in name for marker in SAFE_DATABASE_MARKERS):
+        raise SystemExit(f"Refusing to reset database '{name}': use a bench/loadtest/test database or --force")
+
+def seed(
+    database_url: str,
+    courses: int = 20,
+    sections_per_course: int = 4,
+    documents_per_section: int = 3,
+    students: int = 200,
+    enrollments_per_student: int = 5,
+    storage_dir: Optional[Path] = None,
+    random_seed: int = 42,
+) -> Dict:
+    """Reset and fill the database; returns what the benchmarks need to know about the data"""
+    # database.py reads DATABASE_URL at import
+    os.environ["DATABASE_URL"] = database_url
+    import auth
+    import database
+
+    rng = random.Random(random_seed)
+    database.create_tables()
+    password_hash = auth.get_password_hash(STUDENT_PASSWORD)
+
+    pdf_url = "https://example.com/bench/sample.pdf"
+    if storage_dir is not None:
+        import storage
+        sha256 = storage.LocalDiskBackend(Path(storage_dir))._write(io.BytesIO(sample_pdf()))
+        pdf_url = f"{storage.FILES_URL_PREFIX}{sha256}/sample.pdf"
+
+    with database.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"TRUNCATE {', '.join(APP_TABLES)} RESTART IDENTITY CASCADE")
+        cursor.execute(
+            """
+            INSERT INTO admins (email, hashed_password, is_active) VALUES (%s, %s, TRUE)
+            ON CONFLICT (email) DO UPDATE SET hashed_password = EXCLUDED.hashed_password, is_active = TRUE
+            """,
+            (ADMIN_EMAIL, password_hash),
+        )
+
+        cursor.executemany(
+            "INSERT INTO courses (title, description, content, instructor, duration) VALUES (%s, %s, %s, %s, %s)",
+            [
+                (f"Course {i + 1}: {_text(rng, 3)}", _text(rng, 30), "\n\n".join(_text(rng, 120) for _ in range(8)), _text(rng, 2), f"{rng.randint(4, 16)} weeks")
+                for i in range(courses)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO course_sections (course_id, title, description, order_index) VALUES (%s, %s, %s, %s)",
+            [
+                (course_id, f"Section {order + 1}: {_text(rng, 3)}", _text(rng, 20), order)
+                for course_id in range(1, courses + 1)
+                for order in range(sections_per_course)
+            ],
+        )
+        section_count = courses * sections_per_course
+        cursor.executemany(
+            "INSERT INTO section_documents (section_id, title, file_url, file_type, order_index) VALUES (%s, %s, %s, %s, %s)",
+            [
+                (section_id, f"Reading {order + 1}", pdf_url, "document", order)
+                for section_id in range(1, section_count + 1)
+                for order in range(documents_per_section)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO students (email, hashed_password) VALUES (%s, %s)",
+            [(student_email(i), password_hash) for i in range(students)],
+        )
+        cursor.executemany(
+            "INSERT INTO student_course (student_id, course_id) VALUES (%s, %s)",
+            [
+                (student_id, course_id)
+                for student_id in range(1, students + 1)
+                for course_id in rng.sample(range(1, courses + 1), min(enrollments_per_student, courses))
+            ],
+        )
+        conn.commit()
+
+    return {
+        "courses": courses,
+        "sections": section_count,
+        "documents": section_count * documents_per_section,
+        "students": students,
+        "student_emails": [student_email(i) for i in range(students)],
+        "student_password": STUDENT_PASSWORD,
+        "admin_email": ADMIN_EMAIL,
+        "admin_password": ADMIN_PASSWORD,
+        "pdf_url": pdf_url,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--courses", type=int, default=20)
+    parser.add_argument("--sections-per-course", type=int, default=4)
+    parser.add_argument("--documents-per-section", type=int, default=3)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--enrollments-per-student", type=int, default=5)
+    parser.add_argument("--storage-dir", type=Path, help="LOCAL_STORAGE_DIR to put the sample PDF in")
+    parser.add_argument("--force", action="store_true", help="reset a database whatever its name")
+    args = parser.parse_args()
+
+    check_database_url(args.database_url, args.force)
+    summary = seed(
+        args.database_url, args.courses, args.sections_per_course, args.documents_per_section,
+        args.students, args.enrollments_per_student, args.storage_dir,
+    )
+    summary.pop("student_emails")
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,143 @@
 """
 Vercel Blob Storage utilities for file uploads
+
+httpx is imported when the shared client is first created rather than at
+module import, which keeps it off the serverless cold-start path.
 """
-import httpx
+import asyncio
+import hashlib
 import os
-from typing import Optional
+import random
+from typing import TYPE_CHECKING, Optional, List, Dict, Tuple
+
+if TYPE_CHECKING:
+    import httpx
 
 VERCEL_BLOB_TOKEN = os.getenv("BLOB_READ_WRITE_TOKEN")
 VERCEL_BLOB_BASE_URL = "https://blob.vercel-storage.com"
 
+# Shared HTTP client tuning (one pooled client per process, see open_http_client)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_ENABLE_HTTP2 = os.getenv("HTTP_ENABLE_HTTP2", "true").lower() == "true"
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.25"))
+
+# Streaming uploads: files above the threshold go through multipart upload,
+# holding at most BLOB_PART_CONCURRENCY parts of BLOB_PART_SIZE bytes in memory
+BLOB_MULTIPART_THRESHOLD = int(os.getenv("BLOB_MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+BLOB_PART_SIZE = max(int(os.getenv("BLOB_PART_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+BLOB_PART_CONCURRENCY = int(os.getenv("BLOB_PART_CONCURRENCY", "4"))
+
+# Transient upstream failures worth retrying
+RETRYABLE_STATUS_CODES = {500, 502, 503, 504}
+
+def _retryable_exceptions() -> tuple:
+    import httpx
+    return (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+_http_client: Optional["httpx.AsyncClient"] = None
+_http2_enabled = False
+
+_http_stats = {
+    "requests": 0,
+    "connections_opened": 0,
+    "retries": 0,
+    "failures": 0,
+}
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def open_http_client() -> "httpx.AsyncClient":
+    """
+    Create the application-scoped HTTP client (called from the FastAPI startup hook)
+    Safe to call more than once; the existing client is kept
+    """
+    global _http_client, _http2_enabled
+    if _http_client is None or _http_client.is_closed:
+        import httpx
+        _http2_enabled = HTTP_ENABLE_HTTP2 and _http2_available()
+        _http_client = httpx.AsyncClient(
+            http2=_http2_enabled,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+    return _http_client
+
+async def close_http_client():
+    """Close the shared HTTP client and its pooled connections"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def get_http_client() -> "httpx.AsyncClient":
+    """
+    Get the shared HTTP client
+    Serverless runtimes may not run startup hooks, so the client is created lazily
+    """
+    if _http_client is None or _http_client.is_closed:
+        return open_http_client()
+    return _http_client
+
+async def _trace_connections(event_name: str, info: dict):
+    """httpcore trace hook - counts new TCP connections so reuse can be reported"""
+    if event_name == "connection.connect_tcp.complete":
+        _http_stats["connections_opened"] += 1
+
+def get_http_client_stats() -> dict:
+    """Connection reuse statistics for the shared HTTP client"""
+    requests = _http_stats["requests"]
+    opened = _http_stats["connections_opened"]
+    return {
+        **_http_stats,
+        "connections_reused": max(requests - opened, 0),
+        "reuse_ratio": round(1 - opened / requests, 4) if requests else 0.0,
+        "http2": _http2_enabled,
+        "client_open": _http_client is not None and not _http_client.is_closed,
+    }
+
+async def request_with_retries(method: str, url: str, stream: bool = False, max_retries: Optional[int] = None, **kwargs) -> "httpx.Response":
+    """
+    Send a request through the shared client
+    Retries connection errors and transient 5xx responses with exponential backoff,
+    up to max_retries times (HTTP_MAX_RETRIES by default; 0 for non-idempotent calls)
+    With stream=True the body is not read; the caller must aclose() the response
+    """
+    client = get_http_client()
+    retryable_exceptions = _retryable_exceptions()
+    max_retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+        _http_stats["requests"] += 1
+        try:
+            request = client.build_request(method, url, extensions={"trace": _trace_connections}, **kwargs)
+            response = await client.send(request, stream=stream)
+        except retryable_exceptions:
+            if attempt == max_retries:
+                _http_stats["failures"] += 1
+                raise
+        else:
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                return response
+            await response.aclose()
+        
+        _http_stats["retries"] += 1
+        delay = HTTP_RETRY_BACKOFF * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
 async def upload_file_to_blob(file_content: bytes, filename: str, content_type: str) -> Optional[str]:
     """
     Upload a file to Vercel Blob Storage
@@ -25,28 +155,236 @@ async def upload_file_to_blob(file_content: bytes, filename: str, content_type:
         # Use the put endpoint for Vercel Blob
         url = f"{VERCEL_BLOB_BASE_URL}/{filename}"
         
-        async with httpx.AsyncClient() as client:
-            response = await client.put(
-                url,
-                content=file_content,
-                headers={
-                    **headers,
-                    "Content-Type": content_type,
-                    "x-content-type": content_type,
-                }
-            )
-            
-            if response.status_code in [200, 201]:
-                # Vercel Blob returns the URL in the response
-                return response.json().get("url") or url
-            else:
-                print(f"Blob upload failed: {response.status_code} - {response.text}")
-                return None
+        response = await request_with_retries(
+            "PUT",
+            url,
+            content=file_content,
+            headers={
+                **headers,
+                "Content-Type": content_type,
+                "x-content-type": content_type,
+            }
+        )
+        
+        if response.status_code in [200, 201]:
+            # Vercel Blob returns the URL in the response
+            return response.json().get("url") or url
+        else:
+            print(f"Blob upload failed: {response.status_code} - {response.text}")
+            return None
                 
     except Exception as e:
         print(f"Error uploading to blob: {e}")
         return None
 
+async def _read_exactly(file, size: int) -> bytes:
+    """Read up to size bytes from an async file-like object (e.g. UploadFile)"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = await file.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+async def _abort_multipart_upload(mpu_url: str, params: Dict, part_headers: Dict):
+    """
+    Ask the store to discard an unfinished multipart upload's parts
+    Best effort only: the public Vercel Blob SDK has no abort step (just
+    create/upload/complete), so the API may reject this action, in which
+    case the failure is logged and the parts stay behind
+    """
+    try:
+        response = await request_with_retries("POST", mpu_url, params=params, headers={**part_headers, "x-mpu-action": "abort"})
+        if response.status_code not in [200, 201, 204]:
+            print(f"Blob multipart abort failed: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Error aborting blob multipart upload: {e}")
+
+async def _multipart_upload(file, filename: str, content_type: str) -> Optional[str]:
+    """
+    Upload a file to Vercel Blob in parts using the multipart (mpu) API
+    Parts are read one at a time and sent concurrently; memory is bounded
+    by BLOB_PART_SIZE * BLOB_PART_CONCURRENCY
+    Only part uploads are retried: a retried create or complete the server
+    did receive would start a second upload or complete one twice. If a step
+    fails after create, an abort is attempted (see _abort_multipart_upload)
+    """
+    mpu_url = f"{VERCEL_BLOB_BASE_URL}/mpu"
+    params = {"pathname": filename}
+    headers = {
+        "Authorization": f"Bearer {VERCEL_BLOB_TOKEN}",
+        "x-content-type": content_type,
+    }
+    
+    try:
+        response = await request_with_retries("POST", mpu_url, params=params, headers={**headers, "x-mpu-action": "create"}, max_retries=0)
+    except Exception as e:
+        print(f"Blob multipart create failed: {e}")
+        return None
+    if response.status_code not in [200, 201]:
+        print(f"Blob multipart create failed: {response.status_code} - {response.text}")
+        return None
+    upload = response.json()
+    part_headers = {
+        **headers,
+        "x-mpu-key": upload["key"],
+        "x-mpu-upload-id": upload["uploadId"],
+    }
+    
+    parts: List[Dict] = []
+    slots = asyncio.Semaphore(BLOB_PART_CONCURRENCY)
+    
+    async def send_part(part_number: int, data: bytes):
+        try:
+            part_response = await request_with_retries(
+                "POST",
+                mpu_url,
+                params=params,
+                content=data,
+                headers={**part_headers, "x-mpu-action": "upload", "x-mpu-part-number": str(part_number)},
+            )
+            if part_response.status_code not in [200, 201]:
+                raise RuntimeError(f"part {part_number} failed: {part_response.status_code} - {part_response.text}")
+            parts.append({"partNumber": part_number, "etag": part_response.json()["etag"]})
+        finally:
+            slots.release()
+    
+    tasks = []
+    part_number = 1
+    url = None
+    try:
+        while True:
+            # Wait for a free slot before reading so at most N parts are buffered
+            await slots.acquire()
+            if any(task.done() and task.exception() for task in tasks):
+                # A part already failed - stop reading and surface it via gather
+                slots.release()
+                break
+            data = await _read_exactly(file, BLOB_PART_SIZE)
+            if not data:
+                slots.release()
+                break
+            tasks.append(asyncio.create_task(send_part(part_number, data)))
+            part_number += 1
+        await asyncio.gather(*tasks)
+        
+        parts.sort(key=lambda part: part["partNumber"])
+        response = await request_with_retries(
+            "POST",
+            mpu_url,
+            params=params,
+            json=parts,
+            headers={**part_headers, "x-mpu-action": "complete"},
+            max_retries=0,
+        )
+        if response.status_code not in [200, 201]:
+            print(f"Blob multipart complete failed: {response.status_code} - {response.text}")
+            return None
+        url = response.json().get("url")
+        return url
+    except Exception as e:
+        print(f"Blob multipart upload failed: {e}")
+        return None
+    finally:
+        if not url:
+            # Stop the remaining parts, then drop the ones already stored
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await _abort_multipart_upload(mpu_url, params, part_headers)
+
+async def upload_stream_to_blob(file, filename: str, content_type: str, size: Optional[int] = None) -> Optional[str]:
+    """
+    Upload from an async file-like object (e.g. FastAPI's UploadFile spool) without
+    reading the whole file into memory
+    Small files are sent in one PUT, large ones with concurrent multipart upload
+    Returns the URL of the uploaded file or None if failed
+    """
+    if not VERCEL_BLOB_TOKEN:
+        print("Error: BLOB_READ_WRITE_TOKEN not configured")
+        return None
+    
+    try:
+        if size is None:
+            # Unknown size: peek at up to one threshold's worth to decide
+            head = await _read_exactly(file, BLOB_MULTIPART_THRESHOLD + 1)
+            if len(head) <= BLOB_MULTIPART_THRESHOLD:
+                return await upload_file_to_blob(head, filename, content_type)
+            del head
+            await file.seek(0)
+        elif size <= BLOB_MULTIPART_THRESHOLD:
+            return await upload_file_to_blob(await file.read(), filename, content_type)
+        
+        return await _multipart_upload(file, filename, content_type)
+    
+    except Exception as e:
+        print(f"Error streaming upload to blob: {e}")
+        return None
+
+def _hash_fileobj(fileobj, chunk_size: int = 1024 * 1024) -> Tuple[str, int]:
+    """SHA-256 and size of a seekable file object, read in chunks"""
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+async def hash_upload(file) -> Tuple[str, int]:
+    """
+    Compute (sha256, size) of an UploadFile by streaming its spool in a worker thread
+    The file is rewound afterwards so it can be uploaded
+    """
+    return await asyncio.to_thread(_hash_fileobj, file.file)
+
+async def delete_blobs(urls: List[str]) -> bool:
+    """Delete files from Vercel Blob Storage"""
+    if not urls:
+        return True
+    if not VERCEL_BLOB_TOKEN:
+        print("Error: BLOB_READ_WRITE_TOKEN not configured")
+        return False
+    
+    try:
+        response = await request_with_retries(
+            "POST",
+            f"{VERCEL_BLOB_BASE_URL}/delete",
+            json={"urls": urls},
+            headers={"Authorization": f"Bearer {VERCEL_BLOB_TOKEN}"},
+        )
+        if response.status_code in [200, 201]:
+            return True
+        print(f"Blob delete failed: {response.status_code} - {response.text}")
+        return False
+    except Exception as e:
+        print(f"Error deleting from blob: {e}")
+        return False
+
+async def check_blob_access(timeout: float = 5):
+    """
+    List at most one blob: proves the store is reachable and accepts the token
+    Raises with the reason when it doesn't
+    """
+    if not VERCEL_BLOB_TOKEN:
+        raise RuntimeError("BLOB_READ_WRITE_TOKEN not configured")
+    # No retries: the health refresh runs again shortly anyway
+    response = await get_http_client().get(
+        VERCEL_BLOB_BASE_URL,
+        params={"limit": 1},
+        headers={"Authorization": f"Bearer {VERCEL_BLOB_TOKEN}"},
+        timeout=timeout,
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"blob list returned HTTP {response.status_code}")
+
 def is_allowed_file_type(filename: str, allowed_extensions: set) -> bool:
     """Check if file has allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
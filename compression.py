@@ -0,0 +1,114 @@
+"""
+Content-Encoding helpers and settings for response compression
+
+gzip always; brotli when the optional `brotli` package is installed.
+Static assets are compressed ahead of time at maximum quality
+(static_assets.py); dynamic responses are compressed per request by
+middleware.CompressionMiddleware at a faster setting.
+"""
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred first when a client accepts several encodings equally
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Dynamic responses smaller than this are sent as they are
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# brotli 0-11 / gzip 1-9; higher is smaller but slower
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+# Routes whose compressed bodies are cached; entries are keyed by the
+# uncompressed content, so a changed catalog simply misses
+COMPRESSION_CACHE_ROUTES = {
+    route.strip()
+    for route in os.getenv("COMPRESSION_CACHE_ROUTES", "/api/courses,/api/courses/{course_id},/api/admin/courses,/api/student/courses").split(",")
+    if route.strip()
+}
+COMPRESSION_CACHE_MAX_BYTES = int(os.getenv("COMPRESSION_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+def dynamic_quality(encoding: str) -> int:
+    return COMPRESSION_BROTLI_QUALITY if encoding == "br" else COMPRESSION_GZIP_LEVEL
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """{"br": 1.0, "gzip": 0.8, ...} from an Accept-Encoding header"""
+    accepted = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+def negotiate(accept_encoding: Optional[str], available: Iterable[str] = SUPPORTED_ENCODINGS) -> str:
+    """Best encoding out of `available` for this client, or "identity" """
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = "identity", 0.0
+    for encoding in available:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(data: bytes, encoding: str, quality: Optional[int] = None) -> bytes:
+    """
+    Compress with the given encoding
+    quality: brotli 0-11 / gzip 1-9, defaulting to each one's maximum
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if quality is None else quality)
+    if encoding == "gzip":
+        # mtime=0 keeps the output identical for identical input
+        return gzip.compress(data, compresslevel=9 if quality is None else quality, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+class CompressedCache:
+    """
+    LRU of compressed response bodies bounded by total size
+    Keyed by encoding and a digest of the uncompressed body. Only used from
+    the event loop thread, so it needs no lock.
+    """
+    def __init__(self, max_bytes: int = COMPRESSION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+
+    @staticmethod
+    def key(body: bytes, encoding: str) -> Tuple[str, bytes]:
+        return encoding, hashlib.blake2b(body, digest_size=16).digest()
+
+    def get(self, key: Tuple[str, bytes]) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Tuple[str, bytes], value: bytes):
+        if len(value) > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
@@ -1,6 +1,8 @@
-from database import get_db
+from database import BLOB_PURGE_LOCK_KEY, SEARCH_CONFIG, get_db
+from psycopg.types.json import Jsonb
 import auth
-from typing import List, Dict, Optional
+import singleflight
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 
 # Student operations
 def create_student(email: str, password: str) -> Optional[Dict]:
@@ -80,6 +82,47 @@ def get_students(skip: int = 0, limit: int = 100) -> List[Dict]:
             for result in results
         ]
 
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_students(query: str, limit: int = 10, active: Optional[bool] = None, course_id: Optional[int] = None, enrolled: bool = True, timeout_ms: int = 250) -> List[Dict]:
+    """
+    Students whose email contains `query` (case-insensitive), prefix matches
+    first, then by where the match starts and email length. The ILIKE is
+    served by the pg_trgm index on students.email; statement_timeout bounds
+    the query (psycopg.errors.QueryCanceled when exceeded).
+    """
+    term = _escape_like(query.lower())
+    params = {"pattern": f"%{term}%", "prefix": f"{term}%", "term": query.lower(), "limit": limit}
+    conditions = ["s.email ILIKE %(pattern)s"]
+    if active is not None:
+        conditions.append("s.is_active = %(active)s")
+        params["active"] = active
+    if course_id is not None:
+        conditions.append(f"{'' if enrolled else 'NOT '}EXISTS (SELECT 1 FROM student_course sc WHERE sc.student_id = s.id AND sc.course_id = %(course_id)s)")
+        params["course_id"] = course_id
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        # Transaction-local, so it ends with this connection's transaction
+        cursor.execute("SELECT set_config('statement_timeout', %s, true)", (str(timeout_ms),))
+        cursor.execute(f"""
+            SELECT s.id, s.email, s.created_at, s.is_active
+            FROM students s
+            WHERE {' AND '.join(conditions)}
+            ORDER BY lower(s.email) LIKE %(prefix)s DESC, strpos(lower(s.email), %(term)s), length(s.email), s.email
+            LIMIT %(limit)s
+        """, params)
+        return [
+            {
+                "id": result[0],
+                "email": result[1],
+                "created_at": result[2],
+                "is_active": result[3]
+            }
+            for result in cursor.fetchall()
+        ]
+
 # Admin operations
 def create_admin(email: str, password: str) -> Optional[Dict]:
     """Create a new admin"""
@@ -400,8 +443,14 @@ def create_course_section(course_id: int, title: str, description: str = None, o
             return None
     return None
 
+# Course listings load every course's sections; concurrent listings share each load
+_section_loads = singleflight.SingleFlight("course_sections")
+
 def get_course_sections(course_id: int) -> List[Dict]:
     """Get all sections for a course with their documents"""
+    return _section_loads.do(course_id, _load_course_sections, course_id)
+
+def _load_course_sections(course_id: int) -> List[Dict]:
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("""
@@ -482,15 +531,103 @@ def delete_course_section(section_id: int) -> bool:
             conn.rollback()
             return False
 
+# Blob operations
+def get_blob(sha256: str) -> Optional[Dict]:
+    """Get a stored blob by its content hash"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT sha256, file_url, content_type, size_bytes, ref_count, created_at FROM blobs WHERE sha256 = %s",
+            (sha256,)
+        )
+        result = cursor.fetchone()
+        
+        if result:
+            return {
+                "sha256": result[0],
+                "file_url": result[1],
+                "content_type": result[2],
+                "size_bytes": result[3],
+                "ref_count": result[4],
+                "created_at": result[5]
+            }
+    return None
+
+def _register_blob(cursor, file_url: str, blob: Optional[Dict]) -> Tuple[Optional[str], str]:
+    """
+    Insert (or lock) the blob row a document or rendition will reference
+    Returns (sha256, file_url to store). If the same content was registered
+    concurrently, the existing row's URL wins and the caller's own upload is
+    redundant. The row stays locked until commit, so /purge can't remove it
+    before the trigger has counted the new reference. A blob the caller
+    reused (blob["reused"]) that has been purged in the meantime raises.
+    Waits for a running purge to finish deleting files: if it removed the
+    object just stored, the caller sees it missing after the commit
+    (storage.object_missing) and stores it again.
+    """
+    if not blob:
+        return None, file_url
+    cursor.execute("SELECT pg_advisory_xact_lock_shared(%s)", (BLOB_PURGE_LOCK_KEY,))
+    cursor.execute(
+        "INSERT INTO blobs (sha256, file_url, content_type, size_bytes) VALUES (%s, %s, %s, %s) ON CONFLICT (sha256) DO UPDATE SET ref_count = blobs.ref_count RETURNING file_url, xmax = 0",
+        (blob["sha256"], file_url, blob.get("content_type"), blob.get("size_bytes"))
+    )
+    stored_url, inserted = cursor.fetchone()
+    if inserted and blob.get("reused"):
+        raise RuntimeError(f"blob {blob['sha256'][:12]} was purged before it could be reused")
+    return blob["sha256"], stored_url
+
+def delete_unreferenced_blobs(delete_files: Callable[[List[str]], object]) -> List[str]:
+    """
+    Remove blob rows no document or rendition references any more, and their files
+    delete_files(urls) runs before the commit, under the exclusive purge lock, so
+    an upload registering the same content (_register_blob) waits until the files
+    are gone. Returns the purged URLs
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (BLOB_PURGE_LOCK_KEY,))
+            cursor.execute("DELETE FROM blobs WHERE ref_count <= 0 RETURNING file_url")
+            urls = [result[0] for result in cursor.fetchall()]
+            if urls:
+                delete_files(urls)
+            conn.commit()
+            return urls
+        except Exception:
+            conn.rollback()
+            return []
+
+def cleanup_unregistered_uploads(sha256s: List[str], cleanup: Callable[[Dict[str, str]], object]):
+    """
+    Run cleanup(sha256 -> registered file_url) for uploads about to be deleted,
+    under the exclusive purge lock like delete_unreferenced_blobs: cleanup sees
+    which of them are registered, and no registration can happen meanwhile
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (BLOB_PURGE_LOCK_KEY,))
+            cursor.execute("SELECT sha256, file_url FROM blobs WHERE sha256 = ANY(%s)", (sha256s,))
+            cleanup(dict(cursor.fetchall()))
+        finally:
+            # Nothing to commit; ends the transaction and releases the lock
+            conn.rollback()
+
 # Document operations
-def add_section_document(section_id: int, title: str, file_url: str, file_type: str, order_index: int = 0) -> Optional[Dict]:
-    """Add a document to a course section"""
+def add_section_document(section_id: int, title: str, file_url: str, file_type: str, order_index: int = 0, blob: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Add a document to a course section
+    blob ({"sha256", "content_type", "size_bytes"}) links the document to its deduplicated blob;
+    the returned file_url is the blob's, which differs if another upload registered it first
+    """
     with get_db() as conn:
         cursor = conn.cursor()
         try:
+            blob_sha256, file_url = _register_blob(cursor, file_url, blob)
             cursor.execute(
-                "INSERT INTO section_documents (section_id, title, file_url, file_type, order_index) VALUES (%s, %s, %s, %s, %s) RETURNING id, section_id, title, file_url, file_type, order_index, created_at",
-                (section_id, title, file_url, file_type, order_index)
+                "INSERT INTO section_documents (section_id, title, file_url, file_type, order_index, blob_sha256) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id, section_id, title, file_url, file_type, order_index, created_at",
+                (section_id, title, file_url, file_type, order_index, blob_sha256)
             )
             result = cursor.fetchone()
             conn.commit()
@@ -510,12 +647,50 @@ def add_section_document(section_id: int, title: str, file_url: str, file_type:
             return None
     return None
 
+def add_section_documents(section_id: int, documents: List[Dict]) -> Optional[List[Dict]]:
+    """Add several documents to a section in a single transaction"""
+    if not documents:
+        return []
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            values = []
+            params = []
+            for document in documents:
+                blob_sha256, file_url = _register_blob(cursor, document["file_url"], document.get("blob"))
+                values.append("(%s, %s, %s, %s, %s, %s)")
+                params.extend([section_id, document["title"], file_url, document["file_type"], document.get("order_index", 0), blob_sha256])
+            
+            cursor.execute(
+                f"INSERT INTO section_documents (section_id, title, file_url, file_type, order_index, blob_sha256) VALUES {', '.join(values)} RETURNING id, section_id, title, file_url, file_type, order_index, created_at",
+                params
+            )
+            results = cursor.fetchall()
+            conn.commit()
+            
+            return [
+                {
+                    "id": result[0],
+                    "section_id": result[1],
+                    "title": result[2],
+                    "file_url": result[3],
+                    "file_type": result[4],
+                    "order_index": result[5],
+                    "created_at": result[6]
+                }
+                for result in results
+            ]
+        except Exception:
+            conn.rollback()
+            return None
+
 def get_section_documents(section_id: int) -> List[Dict]:
     """Get all documents for a section"""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT id, section_id, title, file_url, file_type, order_index, created_at
+            SELECT id, section_id, title, file_url, file_type, order_index, created_at, metadata
             FROM section_documents 
             WHERE section_id = %s 
             ORDER BY order_index ASC, created_at ASC
@@ -530,13 +705,115 @@ def get_section_documents(section_id: int) -> List[Dict]:
                 "file_url": result[3],
                 "file_type": result[4],
                 "order_index": result[5],
+                "created_at": result[6],
+                "metadata": result[7]
+            }
+            for result in results
+        ]
+
+def get_section_document(document_id: int) -> Optional[Dict]:
+    """Get a single document with its blob hash and size (if deduplicated)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT d.id, d.section_id, d.title, d.file_url, d.file_type, d.order_index, d.created_at, d.blob_sha256, b.size_bytes, d.metadata
+            FROM section_documents d
+            LEFT JOIN blobs b ON b.sha256 = d.blob_sha256
+            WHERE d.id = %s
+        """, (document_id,))
+        result = cursor.fetchone()
+        
+        if result:
+            return {
+                "id": result[0],
+                "section_id": result[1],
+                "title": result[2],
+                "file_url": result[3],
+                "file_type": result[4],
+                "order_index": result[5],
+                "created_at": result[6],
+                "blob_sha256": result[7],
+                "size_bytes": result[8],
+                "metadata": result[9]
+            }
+    return None
+
+def update_document_metadata(document_id: int, metadata: Dict) -> bool:
+    """Merge extracted metadata into a document"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE section_documents SET metadata = metadata || %s WHERE id = %s",
+                (Jsonb(metadata), document_id)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+        except Exception:
+            conn.rollback()
+            return False
+
+# Rendition operations
+def add_document_rendition(document_id: int, codec: str, bitrate_kbps: int, file_url: str, size_bytes: int, blob: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Record a compressed rendition of an audio document
+    blob ({"sha256", "content_type", "size_bytes"}) registers the file so it is
+    purged once no rendition or document references it, including a rendition
+    this one replaces
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            blob_sha256, file_url = _register_blob(cursor, file_url, blob)
+            cursor.execute(
+                "INSERT INTO document_renditions (document_id, codec, bitrate_kbps, file_url, size_bytes, blob_sha256) VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (document_id, codec, bitrate_kbps) DO UPDATE SET file_url = EXCLUDED.file_url, size_bytes = EXCLUDED.size_bytes, blob_sha256 = EXCLUDED.blob_sha256 RETURNING id, document_id, codec, bitrate_kbps, file_url, size_bytes, created_at",
+                (document_id, codec, bitrate_kbps, file_url, size_bytes, blob_sha256)
+            )
+            result = cursor.fetchone()
+            conn.commit()
+            
+            if result:
+                return {
+                    "id": result[0],
+                    "document_id": result[1],
+                    "codec": result[2],
+                    "bitrate_kbps": result[3],
+                    "file_url": result[4],
+                    "size_bytes": result[5],
+                    "created_at": result[6]
+                }
+        except Exception:
+            conn.rollback()
+            return None
+    return None
+
+def get_document_renditions(document_id: int) -> List[Dict]:
+    """Get all renditions of a document, lowest bitrate first"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, document_id, codec, bitrate_kbps, file_url, size_bytes, created_at
+            FROM document_renditions
+            WHERE document_id = %s
+            ORDER BY bitrate_kbps ASC
+        """, (document_id,))
+        results = cursor.fetchall()
+        
+        return [
+            {
+                "id": result[0],
+                "document_id": result[1],
+                "codec": result[2],
+                "bitrate_kbps": result[3],
+                "file_url": result[4],
+                "size_bytes": result[5],
                 "created_at": result[6]
             }
             for result in results
         ]
 
 def delete_section_document(document_id: int) -> bool:
-    """Delete a section document"""
+    """Delete a section document (its and its renditions' blob references are released by trigger)"""
     with get_db() as conn:
         cursor = conn.cursor()
         try:
@@ -547,9 +824,253 @@ def delete_section_document(document_id: int) -> bool:
             conn.rollback()
             return False
 
+# Job queue operations
+def enqueue_jobs(jobs: List[Dict]) -> List[int]:
+    """Queue background jobs ({"kind", "payload", "max_attempts"?}) in one transaction"""
+    if not jobs:
+        return []
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            values = []
+            params = []
+            for job in jobs:
+                values.append("(%s, %s, %s)")
+                params.extend([job["kind"], Jsonb(job.get("payload", {})), job.get("max_attempts", 5)])
+            
+            cursor.execute(
+                f"INSERT INTO jobs (kind, payload, max_attempts) VALUES {', '.join(values)} RETURNING id",
+                params
+            )
+            results = cursor.fetchall()
+            conn.commit()
+            return [result[0] for result in results]
+        except Exception:
+            conn.rollback()
+            return []
+
+def claim_job(worker_id: str, visibility_timeout: int) -> Optional[Dict]:
+    """
+    Claim the next runnable job
+    Queued jobs that are due, and running jobs whose lock has expired (crashed
+    worker), are eligible; SKIP LOCKED lets many workers claim concurrently
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            # Expired jobs that have used up their attempts are given up on
+            cursor.execute("""
+                UPDATE jobs SET status = 'failed', locked_until = NULL, updated_at = NOW(),
+                    last_error = COALESCE(last_error, 'visibility timeout expired')
+                WHERE status = 'running' AND locked_until < NOW() AND attempts >= max_attempts
+            """)
+            cursor.execute("""
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, locked_by = %s,
+                    locked_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE (status = 'queued' AND run_at <= NOW())
+                       OR (status = 'running' AND locked_until < NOW())
+                    ORDER BY run_at, id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, kind, payload, attempts, max_attempts
+            """, (worker_id, visibility_timeout))
+            result = cursor.fetchone()
+            conn.commit()
+            
+            if result:
+                return {
+                    "id": result[0],
+                    "kind": result[1],
+                    "payload": result[2],
+                    "attempts": result[3],
+                    "max_attempts": result[4]
+                }
+        except Exception:
+            conn.rollback()
+            return None
+    return None
+
+def extend_job_lock(job_id: int, worker_id: str, visibility_timeout: int) -> bool:
+    """Heartbeat: push a running job's visibility timeout forward"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE jobs SET locked_until = NOW() + make_interval(secs => %s), updated_at = NOW() WHERE id = %s AND locked_by = %s AND status = 'running'",
+                (visibility_timeout, job_id, worker_id)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+        except Exception:
+            conn.rollback()
+            return False
+
+def complete_job(job_id: int, worker_id: str) -> bool:
+    """Mark a claimed job as done"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE jobs SET status = 'done', locked_until = NULL, updated_at = NOW() WHERE id = %s AND locked_by = %s",
+                (job_id, worker_id)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+        except Exception:
+            conn.rollback()
+            return False
+
+def fail_job(job_id: int, worker_id: str, error: str, retry_delay: int) -> bool:
+    """Record a failed attempt; requeue after retry_delay seconds or give up after max_attempts"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE jobs
+                SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                    run_at = NOW() + make_interval(secs => %s),
+                    locked_until = NULL, last_error = %s, updated_at = NOW()
+                WHERE id = %s AND locked_by = %s
+            """, (retry_delay, error[:2000], job_id, worker_id))
+            conn.commit()
+            return cursor.rowcount > 0
+        except Exception:
+            conn.rollback()
+            return False
+
+def get_job_counts() -> Dict[str, int]:
+    """Number of jobs per status"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return {result[0]: result[1] for result in cursor.fetchall()}
+
 def get_course_with_sections(course_id: int) -> Optional[Dict]:
     """Get course with all its sections and documents"""
     course = get_course_by_id(course_id)
     if course:
         course["sections"] = get_course_sections(course_id)
     return course
+
+# Search operations
+# One UNION branch per result type, each yielding (kind, id, course_id, section_id, title, rank)
+_SEARCH_SOURCES = {
+    "course": """
+        SELECT 'course' AS kind, c.id, c.id AS course_id, NULL::integer AS section_id, c.title,
+               ts_rank_cd(c.search_vector, q.query, 1)::float8 AS rank
+        FROM courses c, q
+        WHERE c.search_vector @@ q.query AND c.is_active = TRUE
+    """,
+    "section": """
+        SELECT 'section' AS kind, s.id, s.course_id, s.id AS section_id, s.title,
+               ts_rank_cd(s.search_vector, q.query, 1)::float8 AS rank
+        FROM course_sections s JOIN courses c ON c.id = s.course_id, q
+        WHERE s.search_vector @@ q.query AND c.is_active = TRUE
+    """,
+    "document": """
+        SELECT 'document' AS kind, d.id, s.course_id, d.section_id, d.title,
+               ts_rank_cd(d.search_vector, q.query, 1)::float8 AS rank
+        FROM section_documents d JOIN course_sections s ON s.id = d.section_id JOIN courses c ON c.id = s.course_id, q
+        WHERE d.search_vector @@ q.query AND c.is_active = TRUE
+    """,
+}
+
+def search_content(tsquery: str, kinds: List[str], limit: int, after: Optional[Tuple[float, str, int]] = None, headline_options: str = "") -> List[Dict]:
+    """
+    Active courses, sections and documents matching a to_tsquery() expression,
+    best first, ordered by (rank DESC, type, id) so `after` - the last row of
+    the previous page - continues where it left off. Snippets are only built
+    for the rows returned.
+    """
+    params = {"config": SEARCH_CONFIG, "tsquery": tsquery, "limit": limit, "options": headline_options}
+    keyset = ""
+    if after is not None:
+        keyset = "WHERE rank < %(rank)s OR (rank = %(rank)s AND (kind, id) > (%(kind)s, %(id)s))"
+        params.update({"rank": after[0], "kind": after[1], "id": after[2]})
+    matches = " UNION ALL ".join(_SEARCH_SOURCES[kind] for kind in kinds)
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            WITH q AS (SELECT to_tsquery(%(config)s::regconfig, %(tsquery)s) AS query),
+            page AS (
+                SELECT * FROM ({matches}) matches
+                {keyset}
+                ORDER BY rank DESC, kind, id
+                LIMIT %(limit)s
+            )
+            SELECT page.kind, page.id, page.course_id, page.section_id, page.title, page.rank,
+                   ts_headline(%(config)s::regconfig, CASE page.kind
+                       WHEN 'course' THEN (SELECT concat_ws(' ', description, content) FROM courses WHERE id = page.id)
+                       WHEN 'section' THEN (SELECT coalesce(description, title) FROM course_sections WHERE id = page.id)
+                       ELSE page.title
+                   END, q.query, %(options)s)
+            FROM page, q
+            ORDER BY page.rank DESC, page.kind, page.id
+        """, params)
+        return [
+            {
+                "type": result[0],
+                "id": result[1],
+                "course_id": result[2],
+                "section_id": result[3],
+                "title": result[4],
+                "rank": result[5],
+                "snippet": result[6],
+            }
+            for result in cursor.fetchall()
+        ]
+
+# Export operations
+# dataset -> (columns, query); ordered by primary key so exports are stable
+EXPORTS = {
+    "students": (
+        ("id", "email", "created_at", "is_active"),
+        "SELECT id, email, created_at, is_active FROM students {where} ORDER BY id",
+    ),
+    "courses": (
+        ("id", "title", "description", "content", "instructor", "duration", "created_at", "is_active"),
+        "SELECT id, title, description, content, instructor, duration, created_at, is_active FROM courses {where} ORDER BY id",
+    ),
+    "enrollments": (
+        ("student_id", "student_email", "course_id", "course_title"),
+        """
+        SELECT sc.student_id, s.email, sc.course_id, c.title
+        FROM student_course sc
+        JOIN students s ON s.id = sc.student_id
+        JOIN courses c ON c.id = sc.course_id
+        {where}
+        ORDER BY sc.student_id, sc.course_id
+        """,
+    ),
+}
+
+def iter_export(dataset: str, batch_size: int = 2000, course_id: Optional[int] = None) -> Iterator[List[tuple]]:
+    """
+    Rows of an EXPORTS dataset in batches of up to batch_size, read through a
+    named (server-side) cursor so only one batch is held in memory at a time.
+    course_id narrows enrollments to one course. The connection stays open
+    until the generator is exhausted or closed.
+    """
+    _, query = EXPORTS[dataset]
+    where, params = "", {}
+    if course_id is not None and dataset == "enrollments":
+        where, params = "WHERE sc.course_id = %(course_id)s", {"course_id": course_id}
+
+    with get_db() as conn:
+        # Named cursors live inside a transaction: one consistent snapshot,
+        # read-only, and discarded when the connection closes
+        conn.read_only = True
+        with conn.cursor(name=f"export_{dataset}") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query.format(where=where), params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
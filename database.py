@@ -1,30 +1,169 @@
 import psycopg
 import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 from contextlib import contextmanager
-from passlib.context import CryptContext
+
+import metrics
 
 load_dotenv()
 
 # Database connection parameters
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://shreyasrinivasan@localhost/spiritual_courses")
 
+# Session advisory lock held while create_tables runs, so app processes
+# starting together (gunicorn workers, serverless instances) migrate one at a time
+SCHEMA_LOCK_KEY = 72310040
+# Transaction advisory lock: /purge holds it exclusively while it deletes blob rows
+# and their files, blob registrations take it shared (crud._register_blob)
+BLOB_PURGE_LOCK_KEY = 72310029
+
+# Text search configuration of the search_vector columns (changing it needs the columns recreated)
+SEARCH_CONFIG = "english"
+
+# Per-request query budget: warn (log) or raise (tests/CI) when exceeded
+DB_QUERY_WARN_COUNT = int(os.getenv("DB_QUERY_WARN_COUNT", "25"))
+DB_QUERY_REPEAT_WARN = int(os.getenv("DB_QUERY_REPEAT_WARN", "5"))
+DB_QUERY_BUDGET_ACTION = os.getenv("DB_QUERY_BUDGET_ACTION", "warn").lower()
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in "raise" mode when a request runs too many (or N+1 repeated) statements"""
+
+class QueryStats:
+    """Statements executed within one request (or one track_queries block)"""
+    def __init__(self, action: str = None, max_queries: int = None, max_repeats: int = None):
+        self.action = action or DB_QUERY_BUDGET_ACTION
+        self.max_queries = max_queries if max_queries is not None else DB_QUERY_WARN_COUNT
+        self.max_repeats = max_repeats if max_repeats is not None else DB_QUERY_REPEAT_WARN
+        self.count = 0
+        self.connections = 0
+        self.seconds = 0.0
+        self.shapes: Dict[str, int] = {}
+
+    def record(self, query, elapsed: float):
+        # Statements use %s placeholders, so the text itself is the shape
+        shape = " ".join(query.split()) if isinstance(query, str) else repr(query)
+        self.count += 1
+        self.seconds += elapsed
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated(self) -> List[Tuple[str, int]]:
+        """Statement shapes executed at least max_repeats times (likely N+1 loops)"""
+        return sorted(
+            ((shape, count) for shape, count in self.shapes.items() if count >= self.max_repeats),
+            key=lambda item: -item[1]
+        )
+
+    def problems(self) -> List[str]:
+        problems = []
+        if self.count > self.max_queries:
+            problems.append(f"{self.count} queries (limit {self.max_queries})")
+        for shape, count in self.repeated():
+            problems.append(f"{count}x repeated statement: {shape[:200]}")
+        return problems
+
+    def enforce(self):
+        """Raise QueryBudgetExceeded in "raise" mode if the budget was exceeded"""
+        if self.action == "raise":
+            problems = self.problems()
+            if problems:
+                raise QueryBudgetExceeded("; ".join(problems))
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+@contextmanager
+def track_queries(enforce_on_exit: bool = True, **budget):
+    """
+    Count and time statements run through get_db() in this context
+    Threadpool calls copy the context, so sync crud functions are included;
+    tests can pass action="raise" to fail on an N+1 pattern (crud swallows
+    most exceptions, so the check runs when the block exits)
+    """
+    stats = QueryStats(**budget)
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+    if enforce_on_exit:
+        stats.enforce()
+
+def _statement_type(query) -> str:
+    """Leading SQL keyword (SELECT, INSERT, ...) used as the metrics label"""
+    if not isinstance(query, str):
+        # psycopg.sql.Composed and friends; not used by crud today
+        return "OTHER"
+    words = query.lstrip().split(None, 1)
+    return words[0].upper() if words else "OTHER"
+
+def _record_statement(query, start: float, failed: bool):
+    elapsed = time.perf_counter() - start
+    statement = _statement_type(query)
+    if failed:
+        metrics.db_query_errors_total.inc(statement)
+    metrics.db_queries_total.inc(statement)
+    metrics.db_query_duration_seconds.observe(elapsed, statement)
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.record(query, elapsed)
+
+class InstrumentedCursor(psycopg.Cursor):
+    """Cursor that counts and times every statement (crud uses conn.cursor() everywhere)"""
+    def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, params, **kwargs)
+            failed = False
+            return result
+        finally:
+            _record_statement(query, start, failed)
+
+    def executemany(self, query, params_seq, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(query, params_seq, **kwargs)
+            failed = False
+            return result
+        finally:
+            _record_statement(query, start, failed)
+
 @contextmanager
 def get_db():
     """Database connection context manager"""
     conn = None
     try:
-        conn = psycopg.connect(DATABASE_URL)
+        with metrics.db_connect_seconds.time():
+            conn = psycopg.connect(DATABASE_URL, cursor_factory=InstrumentedCursor)
+        metrics.db_connections_open.inc()
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.connections += 1
         yield conn
     finally:
         if conn:
             conn.close()
+            metrics.db_connections_open.dec()
+
+def ping(timeout: float = 2) -> float:
+    """Open a connection and run SELECT 1; returns the round trip in seconds (raises on failure)"""
+    start = time.perf_counter()
+    with psycopg.connect(DATABASE_URL, connect_timeout=max(int(timeout), 1)) as conn:
+        conn.execute("SELECT 1")
+    return time.perf_counter() - start
 
 def create_tables():
-    """Create all necessary tables"""
+    """Create all necessary tables (serialized across processes by SCHEMA_LOCK_KEY)"""
     with get_db() as conn:
         cursor = conn.cursor()
         
+        # Held until the connection closes; whoever waits finds the schema done
+        cursor.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_LOCK_KEY,))
+        conn.commit()
+        
         # Create students table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS students (
@@ -75,6 +214,55 @@ def create_tables():
             )
         """)
         
+        # Create content-addressed blobs table (one row per unique uploaded file)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 CHAR(64) PRIMARY KEY,
+                file_url VARCHAR(512) NOT NULL,
+                content_type VARCHAR(255),
+                size_bytes BIGINT,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Create audio renditions table (compressed copies of audio documents)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS document_renditions (
+                id SERIAL PRIMARY KEY,
+                document_id INTEGER REFERENCES section_documents(id) ON DELETE CASCADE,
+                codec VARCHAR(20) NOT NULL,
+                bitrate_kbps INTEGER NOT NULL,
+                file_url VARCHAR(512) NOT NULL,
+                size_bytes BIGINT,
+                blob_sha256 CHAR(64) REFERENCES blobs(sha256),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (document_id, codec, bitrate_kbps)
+            )
+        """)
+        
+        # Create background job queue table (claimed with FOR UPDATE SKIP LOCKED)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                kind VARCHAR(100) NOT NULL,
+                payload JSONB NOT NULL DEFAULT '{}',
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 5,
+                run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                locked_until TIMESTAMP,
+                locked_by VARCHAR(255),
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS jobs_ready_idx ON jobs (run_at, id)
+            WHERE status IN ('queued', 'running')
+        """)
+        
         # Create admins table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS admins (
@@ -113,11 +301,103 @@ def create_tables():
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='courses' AND column_name='content') THEN
                     ALTER TABLE courses ADD COLUMN content TEXT;
                 END IF;
+                
+                -- Background-extracted document metadata (duration, page count, ...)
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='section_documents' AND column_name='metadata') THEN
+                    ALTER TABLE section_documents ADD COLUMN metadata JSONB NOT NULL DEFAULT '{}';
+                END IF;
+                
+                -- Link documents to their deduplicated blob
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='section_documents' AND column_name='blob_sha256') THEN
+                    ALTER TABLE section_documents ADD COLUMN blob_sha256 CHAR(64) REFERENCES blobs(sha256);
+                END IF;
+                
+                -- Renditions are stored as blobs too, so /purge removes their files
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='document_renditions' AND column_name='blob_sha256') THEN
+                    ALTER TABLE document_renditions ADD COLUMN blob_sha256 CHAR(64) REFERENCES blobs(sha256);
+                END IF;
             END $$;
         """)
         
         conn.commit()
         
+        # Keep blobs.ref_count in step with section_documents and
+        # document_renditions, including rows removed by ON DELETE CASCADE
+        # from documents, sections and courses, and renditions replaced in place
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION blob_refcount() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    IF NEW.blob_sha256 IS NOT NULL THEN
+                        UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = NEW.blob_sha256;
+                    END IF;
+                END IF;
+                IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                    IF OLD.blob_sha256 IS NOT NULL THEN
+                        UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.blob_sha256;
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS section_documents_blob_refcount ON section_documents")
+        cursor.execute("""
+            CREATE TRIGGER section_documents_blob_refcount
+            AFTER INSERT OR DELETE ON section_documents
+            FOR EACH ROW EXECUTE FUNCTION blob_refcount()
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS document_renditions_blob_refcount ON document_renditions")
+        cursor.execute("""
+            CREATE TRIGGER document_renditions_blob_refcount
+            AFTER INSERT OR DELETE OR UPDATE OF blob_sha256 ON document_renditions
+            FOR EACH ROW EXECUTE FUNCTION blob_refcount()
+        """)
+        # Replaced by blob_refcount()
+        cursor.execute("DROP FUNCTION IF EXISTS section_documents_blob_refcount()")
+        
+        conn.commit()
+        
+        # Full-text search: weighted tsvectors that Postgres keeps current as
+        # stored generated columns (A = titles, B = descriptions, C = content)
+        search_vectors = {
+            "courses": f"""
+                setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B') ||
+                setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(content, '')), 'C')
+            """,
+            "course_sections": f"""
+                setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')
+            """,
+            "section_documents": f"""
+                setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A')
+            """,
+        }
+        # Adding a stored column rewrites the table under ACCESS EXCLUSIVE, so
+        # it happens once, by the process holding SCHEMA_LOCK_KEY. Later starts
+        # only look at the catalog: even a no-op ALTER TABLE takes that lock
+        for table, expression in search_vectors.items():
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'search_vector'",
+                (table,)
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({expression}) STORED")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING GIN (search_vector)")
+        
+        conn.commit()
+        
+        # Trigram index for the admin student typeahead (email ILIKE '%...%').
+        # pg_trgm ships with Postgres contrib, which not every install has;
+        # without it the search still works, scanning the table
+        try:
+            with conn.transaction():
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                cursor.execute("CREATE INDEX IF NOT EXISTS students_email_trgm_idx ON students USING GIN (email gin_trgm_ops)")
+        except psycopg.Error as e:
+            print(f"⚠️  Warning: pg_trgm not available, student search will scan the table: {e}")
+        
         # Create default admin account if none exists
         cursor.execute("SELECT COUNT(*) FROM admins")
         admin_count = cursor.fetchone()[0]
@@ -45,6 +45,10 @@ if [[ $confirm != [yY] && $confirm != [yY][eE][sS] ]]; then
     exit 0
 fi
 
+# Fingerprint and precompress static assets so cold starts don't have to
+echo -e "\n${BLUE}📦 Building static assets...${NC}"
+python3 static_assets.py || { echo -e "${RED}❌ Static asset build failed${NC}"; exit 1; }
+
 # Deploy to Vercel
 echo -e "\n${BLUE}🚀 Deploying to Vercel...${NC}"
 vercel --prod
@@ -0,0 +1,94 @@
+"""
+Post-upload metadata extraction ("document_metadata" jobs)
+
+Audio: duration, codec and bitrate via ffprobe (reads only what it needs, remote URLs included)
+PDF: page count via pypdf (in requirements.txt; skipped if it is missing)
+Results are merged into section_documents.metadata.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+import blob_utils
+import crud
+import jobs
+import storage
+
+logger = logging.getLogger(__name__)
+
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+FFPROBE_TIMEOUT = float(os.getenv("FFPROBE_TIMEOUT", "60"))
+
+async def probe_audio(source: str) -> Optional[Dict]:
+    """Duration/codec/bitrate of an audio file or URL, or None if ffprobe is unavailable"""
+    if shutil.which(FFPROBE_BINARY) is None:
+        logger.warning(f"⚠️  ffprobe not found ('{FFPROBE_BINARY}') - skipping audio metadata")
+        return None
+    process = await asyncio.create_subprocess_exec(
+        FFPROBE_BINARY, "-v", "error", "-print_format", "json",
+        "-show_entries", "format=duration,bit_rate:stream=codec_name,sample_rate,channels",
+        "-select_streams", "a:0", source,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=FFPROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise RuntimeError(f"ffprobe timed out after {FFPROBE_TIMEOUT}s")
+    if process.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {stderr.decode(errors='replace')[:500]}")
+
+    probe = json.loads(stdout or b"{}")
+    stream = (probe.get("streams") or [{}])[0]
+    fmt = probe.get("format", {})
+    return {
+        "duration_seconds": round(float(fmt["duration"]), 2) if fmt.get("duration") else None,
+        "bitrate": int(fmt["bit_rate"]) if fmt.get("bit_rate") else None,
+        "codec": stream.get("codec_name"),
+        "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+        "channels": stream.get("channels"),
+    }
+
+def count_pdf_pages(path: Path) -> Optional[int]:
+    """Page count of a PDF, or None if pypdf is not installed"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        logger.warning("⚠️  pypdf not installed - skipping PDF page count")
+        return None
+    return len(PdfReader(str(path)).pages)
+
+@jobs.register("document_metadata")
+async def document_metadata_job(payload: Dict):
+    document_id = payload["document_id"]
+    file_url = payload["file_url"]
+    metadata: Dict = {}
+
+    if blob_utils.is_allowed_audio_file(file_url.split("?")[0]):
+        stored = storage.get_storage().resolve(file_url)
+        source = str(stored.path) if stored is not None and stored.path is not None else None
+        if stored is not None and source is None:
+            # In-memory storage has no path or URL ffprobe can read
+            return
+        metadata = await probe_audio(source or file_url) or {}
+    elif file_url.split("?")[0].lower().endswith(".pdf"):
+        with tempfile.TemporaryDirectory(prefix="metadata_") as workdir:
+            path = Path(workdir) / "document.pdf"
+            if not await storage.download_to_path(file_url, path):
+                raise RuntimeError(f"download failed for document {document_id}")
+            pages = await asyncio.to_thread(count_pdf_pages, path)
+            if pages is not None:
+                metadata = {"page_count": pages}
+
+    if metadata:
+        await run_in_threadpool(crud.update_document_metadata, document_id, metadata)
+        logger.info(f"🔎 Metadata for document {document_id}: {metadata}")
@@ -0,0 +1,52 @@
+"""
+Gunicorn configuration for production (used by prod_start.sh)
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Gunicorn supervises several uvicorn workers (uvloop event loop, httptools
+HTTP parser). Everything is configurable through environment variables:
+- WEB_WORKERS: worker processes (default: one per CPU)
+- HOST / PORT: bind address (default 0.0.0.0:8000)
+- GUNICORN_PRELOAD: import the app once in the master so workers share its
+  memory copy-on-write (default true)
+- GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER: recycle a worker
+  after this many requests, so slow leaks can't build up
+- GUNICORN_TIMEOUT / GUNICORN_GRACEFUL_TIMEOUT / GUNICORN_KEEPALIVE (seconds)
+- DB_SCHEMA_INIT: with preload (and unless "off") the master creates the
+  schema and default admin once before forking; workers then skip it
+- THREADPOOL_SIZE: threads for sync endpoints and run_in_threadpool, per
+  worker (applied by main.py at startup)
+"""
+import multiprocessing
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn_worker.ProductionUvicornWorker"
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# The app logs JSON to stdout itself; keep gunicorn's own messages alongside
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+def on_starting(server):
+    server.log.info(f"🚀 Starting {workers} workers on {bind} (preload={preload_app}, max_requests={max_requests})")
+    if preload_app:
+        # The app is already imported here; run its schema init once instead
+        # of in every worker's startup (without preload, create_tables'
+        # advisory lock serializes the workers)
+        import main
+        if main.DB_SCHEMA_INIT != "off":
+            main.initialize_database()
+            main.DB_SCHEMA_INIT = "off"
+            os.environ["DB_SCHEMA_INIT"] = "off"
+
+def post_fork(server, worker):
+    server.log.info(f"👷 Worker {worker.pid} started")
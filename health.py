@@ -0,0 +1,133 @@
+"""
+Liveness and readiness state for load balancer probes
+
+A background task re-checks the database and file storage every
+HEALTH_CHECK_INTERVAL seconds; /readyz only reads the cached result, so a
+probe never opens a connection or touches the filesystem. The checks run
+on asyncio's default executor rather than the request threadpool, so a
+saturated threadpool can't delay them (it shows up as saturation instead).
+Vercel Blob is checked with an authenticated request, at most every
+BLOB_HEALTH_CHECK_INTERVAL seconds (storage.py).
+
+In cold-start budget mode nothing runs at startup: the first probe calls
+ensure_fresh(), which checks inline and starts the loop. It also checks
+inline when the last result is stale, as after a frozen serverless
+instance is thawed.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import anyio
+
+import database
+import metrics
+import storage
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", "2"))
+HEALTH_STORAGE_TIMEOUT = float(os.getenv("HEALTH_STORAGE_TIMEOUT", "5"))
+# Readiness fails if the last successful refresh is older than this
+HEALTH_STALE_AFTER = float(os.getenv("HEALTH_STALE_AFTER", str(HEALTH_CHECK_INTERVAL * 3)))
+
+_state: Dict = {
+    "database": {"ok": False, "error": "not checked yet"},
+    "storage": {"ok": False, "error": "not checked yet"},
+    "checked_at": None,
+}
+_checked_monotonic: Optional[float] = None
+_task: Optional[asyncio.Task] = None
+
+def _check_database() -> Dict:
+    try:
+        latency = database.ping(HEALTH_DB_TIMEOUT)
+        return {"ok": True, "latency_ms": round(latency * 1000, 2)}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {str(e)[:100]}"}
+
+async def _check_storage() -> Dict:
+    backend = storage.get_storage()
+    try:
+        ok = await asyncio.wait_for(backend.check_health(HEALTH_STORAGE_TIMEOUT), HEALTH_STORAGE_TIMEOUT + 1)
+        return {"ok": ok, "backend": backend.name}
+    except Exception as e:
+        return {"ok": False, "backend": backend.name, "error": f"{type(e).__name__}: {str(e)[:100]}"}
+
+async def refresh():
+    """Run the checks once and publish the result"""
+    global _checked_monotonic
+    database_status, storage_status = await asyncio.gather(
+        asyncio.to_thread(_check_database),
+        _check_storage(),
+    )
+    if not database_status["ok"] and _state["database"].get("ok"):
+        logger.warning(f"⚠️  Database became unreachable: {database_status['error']}")
+    _state.update({
+        "database": database_status,
+        "storage": storage_status,
+        "checked_at": datetime.utcnow().isoformat(),
+    })
+    _checked_monotonic = time.monotonic()
+
+async def _refresh_loop(delay: float = 0):
+    await asyncio.sleep(delay)
+    while True:
+        try:
+            await refresh()
+        except Exception as e:
+            logger.error(f"⚠️  Health refresh failed: {type(e).__name__}: {e}")
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+def start(delay: float = 0):
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_refresh_loop(delay))
+
+def _age() -> Optional[float]:
+    return None if _checked_monotonic is None else time.monotonic() - _checked_monotonic
+
+async def ensure_fresh():
+    """Check inline unless a fresh result exists, and make sure the loop is running"""
+    age = _age()
+    if age is None or age > HEALTH_STALE_AFTER:
+        await refresh()
+    start(delay=HEALTH_CHECK_INTERVAL)
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+def saturation() -> Dict:
+    """How busy this worker is right now (request threadpool, DB connections, in-flight requests)"""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {
+        "threadpool_busy": limiter.borrowed_tokens,
+        "threadpool_size": int(limiter.total_tokens),
+        "threadpool_utilization": round(limiter.borrowed_tokens / limiter.total_tokens, 3),
+        "db_connections_open": int(sum(metrics.db_connections_open.collect().values())),
+        "requests_in_flight": int(sum(metrics.http_requests_in_flight.collect().values())),
+    }
+
+def readiness() -> Dict:
+    """Cached dependency status; "ready" requires a fresh, passing DB and storage check"""
+    age = _age()
+    fresh = age is not None and age <= HEALTH_STALE_AFTER
+    return {
+        "ready": fresh and _state["database"]["ok"] and _state["storage"]["ok"],
+        "database": _state["database"],
+        "storage": _state["storage"],
+        "checked_at": _state["checked_at"],
+        "age_seconds": None if age is None else round(age, 2),
+        "saturation": saturation(),
+    }
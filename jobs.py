@@ -0,0 +1,135 @@
+"""
+Durable background job queue backed by the Postgres jobs table
+
+Upload endpoints enqueue follow-up work (renditions, metadata extraction, ...)
+and return as soon as the file is stored. Jobs are claimed with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers can run:
+- JOB_WORKER_MODE=inprocess: async worker tasks inside the web process (single node)
+- JOB_WORKER_MODE=external: run `python worker.py` as a separate process
+A claimed job is invisible to other workers until its visibility timeout
+expires; running jobs extend it with a heartbeat, so only jobs whose worker
+died are picked up again.
+"""
+import asyncio
+import logging
+import os
+import socket
+import traceback
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+import crud
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKER_MODE = (os.getenv("JOB_WORKER_MODE") or "inprocess").lower()
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+JOB_RETRY_BASE_DELAY = int(os.getenv("JOB_RETRY_BASE_DELAY", "30"))
+
+JobHandler = Callable[[Dict], Awaitable[None]]
+
+HANDLERS: Dict[str, JobHandler] = {}
+
+def register(kind: str):
+    """Decorator registering an async handler for a job kind"""
+    def decorator(func: JobHandler) -> JobHandler:
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+def load_handlers():
+    """Import the modules that register job handlers"""
+    import renditions  # noqa: F401
+    import document_metadata  # noqa: F401
+
+def enqueue(kind: str, payload: Dict, max_attempts: int = 5) -> Optional[int]:
+    """Queue a single job; returns its id"""
+    ids = crud.enqueue_jobs([{"kind": kind, "payload": payload, "max_attempts": max_attempts}])
+    return ids[0] if ids else None
+
+def enqueue_document_processing(documents: List[Dict]) -> List[int]:
+    """Queue the post-upload jobs for newly added documents in one transaction"""
+    queued = []
+    for document in documents:
+        payload = {"document_id": document["id"], "file_url": document["file_url"], "title": document["title"]}
+        queued.append({"kind": "document_metadata", "payload": payload})
+        if document["file_type"] == "audio":
+            queued.append({"kind": "audio_renditions", "payload": payload, "max_attempts": 3})
+    return crud.enqueue_jobs(queued)
+
+async def _heartbeat(job_id: int, worker_id: str):
+    while True:
+        await asyncio.sleep(JOB_VISIBILITY_TIMEOUT / 3)
+        # A failed extension (database briefly unreachable) is retried next
+        # beat; the lock only lapses if it keeps failing for the whole timeout
+        try:
+            await run_in_threadpool(crud.extend_job_lock, job_id, worker_id, JOB_VISIBILITY_TIMEOUT)
+        except Exception as e:
+            logger.error(f"⚠️  Heartbeat for job {job_id} failed: {type(e).__name__}: {e}")
+
+async def run_job(job: Dict, worker_id: str):
+    """Run one claimed job and record the outcome"""
+    handler = HANDLERS.get(job["kind"])
+    if handler is None:
+        await run_in_threadpool(crud.fail_job, job["id"], worker_id, f"no handler for job kind '{job['kind']}'", JOB_RETRY_BASE_DELAY)
+        return
+
+    heartbeat = asyncio.create_task(_heartbeat(job["id"], worker_id))
+    try:
+        await handler(job["payload"])
+    except Exception as e:
+        # Exponential backoff between attempts
+        delay = JOB_RETRY_BASE_DELAY * (2 ** (job["attempts"] - 1))
+        logger.error(f"❌ Job {job['id']} ({job['kind']}) attempt {job['attempts']}/{job['max_attempts']} failed: {type(e).__name__}: {e}")
+        await run_in_threadpool(crud.fail_job, job["id"], worker_id, traceback.format_exc(), delay)
+    else:
+        await run_in_threadpool(crud.complete_job, job["id"], worker_id)
+        logger.info(f"✅ Job {job['id']} ({job['kind']}) done")
+    finally:
+        heartbeat.cancel()
+
+async def worker_loop(worker_id: str, stop: asyncio.Event):
+    """Claim and run jobs until stop is set, sleeping JOB_POLL_INTERVAL when idle"""
+    while not stop.is_set():
+        try:
+            job = await run_in_threadpool(crud.claim_job, worker_id, JOB_VISIBILITY_TIMEOUT)
+        except Exception as e:
+            logger.error(f"⚠️  Job claim failed: {type(e).__name__}: {e}")
+            job = None
+
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        await run_job(job, worker_id)
+
+class WorkerPool:
+    """A set of async worker loops sharing one stop event"""
+    def __init__(self, concurrency: int = JOB_WORKER_CONCURRENCY):
+        self.concurrency = concurrency
+        self.stop = asyncio.Event()
+        self.tasks: List[asyncio.Task] = []
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+    def start(self):
+        load_handlers()
+        for index in range(self.concurrency):
+            self.tasks.append(asyncio.create_task(worker_loop(f"{self.worker_prefix}:{index}", self.stop)))
+        logger.info(f"👷 Started {self.concurrency} job workers ({self.worker_prefix})")
+
+    async def shutdown(self, timeout: float = 30):
+        """Stop claiming; give running jobs a chance to finish (unfinished ones are retried after their timeout)"""
+        self.stop.set()
+        if not self.tasks:
+            return
+        done, pending = await asyncio.wait(self.tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        self.tasks = []
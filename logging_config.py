@@ -0,0 +1,155 @@
+"""
+Application logging setup
+
+Records are put on an in-memory queue by a QueueHandler and written by a
+QueueListener thread, so formatting and file/console I/O never block the
+event loop. Output is one JSON object per line (LOG_FORMAT=text for local
+reading), the level follows ENVIRONMENT unless LOG_LEVEL is set, and the
+per-request access log ("app.access") is sampled by LOG_REQUEST_SAMPLE_RATE
+- errors and slow requests are always kept.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+ACCESS_LOGGER = "app.access"
+
+DEFAULT_LEVELS = {"production": "INFO", "development": "DEBUG"}
+DEFAULT_SAMPLE_RATES = {"production": 0.1, "development": 1.0}
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_file_logging = False
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any `extra` fields"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "func": f"{record.funcName}:{record.lineno}",
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread
+    The stock prepare() formats the whole record in the caller; here only the
+    message arguments and traceback are snapshotted
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class RequestSampleFilter(logging.Filter):
+    """Keep a fraction of access log records; warnings, 5xx and slow requests always pass"""
+    def __init__(self, rate: float, slow_ms: float):
+        super().__init__()
+        self.rate = rate
+        self.slow_ms = slow_ms
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        if getattr(record, "status", 0) >= 500 or getattr(record, "duration_ms", 0) >= self.slow_ms:
+            return True
+        return random.random() < self.rate
+
+def _file_handler(path: Path) -> Optional[logging.Handler]:
+    # Fails on read-only file systems (Vercel/serverless)
+    try:
+        return logging.FileHandler(path, mode="a", encoding="utf-8")
+    except (OSError, PermissionError):
+        return None
+
+def configure_logging(base_dir: Path) -> None:
+    """Install the queue-backed root handler; safe to call more than once"""
+    global _listener, _file_logging
+    if _listener is not None:
+        return
+
+    environment = os.getenv("ENVIRONMENT", "development").lower()
+    level = os.getenv("LOG_LEVEL", DEFAULT_LEVELS.get(environment, "INFO")).upper()
+    log_format = os.getenv("LOG_FORMAT", "json").lower()
+    sample_rate = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", str(DEFAULT_SAMPLE_RATES.get(environment, 1.0))))
+    slow_ms = float(os.getenv("LOG_SLOW_REQUEST_MS", "1000"))
+    # No log file by default in production or on Vercel (read-only, and the open is a cold-start cost)
+    log_file = os.getenv("LOG_FILE", "app.log" if environment != "production" and not os.getenv("VERCEL") else "")
+
+    if log_format == "text":
+        formatter = logging.Formatter("%(asctime)s | %(name)s | %(levelname)s | %(funcName)s:%(lineno)d | %(message)s")
+    else:
+        formatter = JsonFormatter()
+
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        file_handler = _file_handler(base_dir / log_file)
+        if file_handler is not None:
+            handlers.append(file_handler)
+    _file_logging = len(handlers) > 1
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    logging.getLogger(ACCESS_LOGGER).addFilter(RequestSampleFilter(sample_rate, slow_ms))
+    # Third-party loggers are noisy at DEBUG
+    logging.getLogger("uvicorn").setLevel(logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("httpcore").setLevel(logging.WARNING)
+    logging.getLogger("multipart").setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+def _restart_listener_after_fork():
+    """
+    The writer thread doesn't survive fork (gunicorn --preload), so a forked
+    worker would queue records forever; give it its own listener
+    """
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def file_logging_enabled() -> bool:
+    return _file_logging
@@ -1,11 +1,16 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request, File, UploadFile, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional, Dict, Any
 from datetime import timedelta
 from pydantic import BaseModel, EmailStr
+from psycopg.errors import QueryCanceled
 from dotenv import load_dotenv
 import os
+import json
+import asyncio
+import anyio
 import signal
 import sys
 import atexit
@@ -14,46 +19,33 @@ import traceback
 from pathlib import Path
 from datetime import datetime, timedelta
 
+import logging_config
+
 # Get the directory where this script is located
 BASE_DIR = Path(__file__).parent
 
-# Configure comprehensive logging - adapt to environment
-log_handlers = [logging.StreamHandler(sys.stdout)]
+load_dotenv()
 
-# Only add file handler in local development (not in serverless environments like Vercel)
-try:
-    # Check if we can write to the file system (will fail in Vercel/serverless)
-    test_file = BASE_DIR / 'test_write.tmp'
-    test_file.touch()
-    test_file.unlink()  # Clean up
-    # If we get here, file system is writable - add file handler
-    log_handlers.append(logging.FileHandler(BASE_DIR / 'app.log', mode='a', encoding='utf-8'))
-    print("📝 File logging enabled (local environment)")
-except (OSError, PermissionError):
-    # Read-only file system (Vercel/serverless) - only console logging
-    print("📝 Console-only logging (serverless environment)")
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s | %(name)s | %(levelname)s | %(funcName)s:%(lineno)d | %(message)s',
-    handlers=log_handlers
-)
+# Queue-backed JSON logging; level and request-log sampling follow ENVIRONMENT
+logging_config.configure_logging(BASE_DIR)
 
 # Create logger for this module
 logger = logging.getLogger(__name__)
 
-# Set specific loggers for better debugging
-logging.getLogger("uvicorn").setLevel(logging.INFO)
-logging.getLogger("fastapi").setLevel(logging.DEBUG)
-logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)  # SQL queries
-logging.getLogger("httpx").setLevel(logging.DEBUG)  # HTTP requests
-
 import database
 import crud
 import auth
 import blob_utils
-
-load_dotenv()
+import storage
+import audio_stream
+import jobs
+import middleware
+import metrics
+import health
+import static_assets
+import singleflight
+# renditions, profiling, search and export are imported where they're used,
+# keeping them out of the serverless cold start
 
 # Environment-based configuration
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development").lower()
@@ -96,56 +88,36 @@ if blob_token:
 else:
     print("⚠️  WARNING: No BLOB_READ_WRITE_TOKEN configured")
 
+# Serverless cold-start budget (on by default on Vercel): keep work that isn't
+# needed for the first response out of import and startup
+COLD_START_BUDGET = (os.getenv("COLD_START_BUDGET") or ("true" if os.getenv("VERCEL") else "false")).lower() == "true"
+# Schema creation at startup: "startup" (before serving), "background" (in a
+# thread once startup returns) or "off" (schema managed separately)
+DB_SCHEMA_INIT = (os.getenv("DB_SCHEMA_INIT") or ("background" if COLD_START_BUDGET else "startup")).lower()
+# A serverless instance is frozen between requests, so it can't host job
+# workers: unless JOB_WORKER_MODE says otherwise, worker.py processes uploads
+if COLD_START_BUDGET and not os.getenv("JOB_WORKER_MODE"):
+    jobs.JOB_WORKER_MODE = "external"
+
+# Threads for sync endpoints and run_in_threadpool (Starlette/anyio default: 40)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+# Parallel blob uploads per batch upload request
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+
+# Admin student typeahead: default/maximum matches and the per-query latency budget
+STUDENT_SEARCH_LIMIT = int(os.getenv("STUDENT_SEARCH_LIMIT", "10"))
+STUDENT_SEARCH_MAX_LIMIT = int(os.getenv("STUDENT_SEARCH_MAX_LIMIT", "50"))
+STUDENT_SEARCH_TIMEOUT_MS = int(os.getenv("STUDENT_SEARCH_TIMEOUT_MS", "250"))
+
 app = FastAPI(title="🕉️ Spiritual Course Management System", version="1.0.0")
 
-# Comprehensive error handling middleware
-@app.middleware("http")
-async def error_logging_middleware(request: Request, call_next):
-    start_time = datetime.now()
-    
-    try:
-        # Log incoming request details
-        logger.info(f"🔥 INCOMING REQUEST: {request.method} {request.url}")
-        logger.debug(f"📋 Request Headers: {dict(request.headers)}")
-        
-        # Note: We can't log request body here as it would consume the stream
-        # Request body logging will be handled in individual endpoints
-        
-        response = await call_next(request)
-        
-        # Log response details
-        process_time = (datetime.now() - start_time).total_seconds()
-        logger.info(f"✅ RESPONSE: {request.method} {request.url} | Status: {response.status_code} | Time: {process_time:.4f}s")
-        
-        return response
-        
-    except Exception as e:
-        # Log detailed error information
-        process_time = (datetime.now() - start_time).total_seconds()
-        error_id = f"ERR_{int(datetime.now().timestamp())}"
-        
-        logger.error(f"❌ CRITICAL ERROR [{error_id}]: {request.method} {request.url}")
-        logger.error(f"🕐 Process Time: {process_time:.4f}s")
-        logger.error(f"🎯 Error Type: {type(e).__name__}")
-        logger.error(f"💬 Error Message: {str(e)}")
-        logger.error(f"📊 Request Details:")
-        logger.error(f"   - URL: {request.url}")
-        logger.error(f"   - Method: {request.method}")
-        logger.error(f"   - Headers: {dict(request.headers)}")
-        logger.error(f"   - Client: {request.client}")
-        logger.error(f"🔍 Full Stack Trace:")
-        logger.error(traceback.format_exc())
-        
-        # Return user-friendly error response
-        return JSONResponse(
-            status_code=500,
-            content={
-                "error": "Internal Server Error",
-                "message": "An unexpected error occurred. Please try again later.",
-                "error_id": error_id,
-                "timestamp": datetime.now().isoformat()
-            }
-        )
+# brotli/gzip for large JSON and text responses, compressed off the event loop
+app.add_middleware(middleware.CompressionMiddleware)
+# Request timing, access logging and error-id 500s (pure ASGI, streaming-safe)
+app.add_middleware(middleware.RequestTimingMiddleware)
+# Admin-only on-demand profiling (X-Profile header / ?profile=); a header check when unused
+app.add_middleware(middleware.LazyProfileMiddleware)
 
 # Security
 security = HTTPBearer()
@@ -199,6 +171,28 @@ class DocumentCreate(BaseModel):
     title: str
     order_index: Optional[int] = 0
 
+def initialize_database():
+    """Create tables and the default admin, then warm up password hashing"""
+    # Try to create tables with error handling
+    try:
+        database.create_tables()
+        logger.info("✅ Database tables created successfully")
+    except Exception as db_error:
+        logger.error(f"⚠️  Database initialization warning: {type(db_error).__name__}: {str(db_error)}")
+        logger.error("🔍 Database stack trace:")
+        logger.error(traceback.format_exc())
+        
+        # Check if it's a bcrypt-related error
+        if "bcrypt" in str(db_error).lower() or "password cannot be longer than 72 bytes" in str(db_error):
+            logger.warning("🔐 Bcrypt compatibility issue detected - continuing without default admin creation")
+            logger.warning("   You may need to create admin accounts manually")
+        else:
+            # For other database errors, still try to continue
+            logger.warning("   Continuing startup - some features may not work properly")
+    
+    # Build the bcrypt context now rather than on the first login
+    auth.get_pwd_context()
+
 # Create tables on startup
 @app.on_event("startup")
 async def startup_event():
@@ -207,22 +201,13 @@ async def startup_event():
         logger.info(f"🌍 Environment: {ENVIRONMENT.upper()}")
         logger.info(f"📊 Database URL: {os.getenv('DATABASE_URL', 'Not set')[:50]}...")
         
-        # Try to create tables with error handling
-        try:
-            database.create_tables()
-            logger.info("✅ Database tables created successfully")
-        except Exception as db_error:
-            logger.error(f"⚠️  Database initialization warning: {type(db_error).__name__}: {str(db_error)}")
-            logger.error("🔍 Database stack trace:")
-            logger.error(traceback.format_exc())
-            
-            # Check if it's a bcrypt-related error
-            if "bcrypt" in str(db_error).lower() or "password cannot be longer than 72 bytes" in str(db_error):
-                logger.warning("🔐 Bcrypt compatibility issue detected - continuing without default admin creation")
-                logger.warning("   You may need to create admin accounts manually")
-            else:
-                # For other database errors, still try to continue
-                logger.warning("   Continuing startup - some features may not work properly")
+        if DB_SCHEMA_INIT == "startup":
+            initialize_database()
+        elif DB_SCHEMA_INIT == "background":
+            asyncio.get_running_loop().run_in_executor(None, initialize_database)
+            logger.info("⏩ Database initialization deferred to a background thread")
+        else:
+            logger.info("⏭️  Database initialization skipped (DB_SCHEMA_INIT=off)")
         
         # Log environment details
         logger.info(f"🔐 Admin email configured: {bool(os.getenv('ADMIN_EMAIL'))}")
@@ -253,14 +238,84 @@ async def startup_logging_event():
     logger.info(f"🔍 Enhanced error logging system enabled with stack traces")
     
     # Check if file logging is available
-    file_logging = any(isinstance(handler, logging.FileHandler) for handler in logger.handlers)
-    if file_logging:
+    if logging_config.file_logging_enabled():
         logger.info(f"📝 Logging to both console and app.log file")
     else:
         logger.info(f"📝 Console-only logging (serverless environment)")
     
     logger.info(f"🎯 Request/Response middleware active for comprehensive debugging")
 
+@app.on_event("startup")
+async def startup_threadpool():
+    """Size the threadpool shared by sync endpoints and run_in_threadpool"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    logger.info(f"🧵 Threadpool capacity: {THREADPOOL_SIZE}")
+
+@app.on_event("startup")
+async def startup_http_client():
+    """Create the shared pooled HTTP client used for blob uploads and the PDF proxy"""
+    if COLD_START_BUDGET:
+        # Created on first use instead (blob_utils.get_http_client)
+        return
+    blob_utils.open_http_client()
+    logger.info(f"🌐 Shared HTTP client ready (HTTP/2: {blob_utils.get_http_client_stats()['http2']})")
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    """Close pooled connections to blob storage"""
+    await blob_utils.close_http_client()
+
+job_workers: Optional[jobs.WorkerPool] = None
+
+@app.on_event("startup")
+async def startup_job_workers():
+    """Run background job workers in this process unless a separate worker.py handles them"""
+    global job_workers
+    if jobs.JOB_WORKER_MODE != "inprocess":
+        logger.info("👷 Job workers run externally (worker.py)")
+        return
+    job_workers = jobs.WorkerPool()
+    job_workers.start()
+
+@app.on_event("startup")
+async def startup_static_assets():
+    """Hash and compress the frontend assets now rather than on the first page load"""
+    if COLD_START_BUDGET:
+        # Loaded on first use instead
+        return
+    await asyncio.to_thread(static_assets.load)
+
+@app.on_event("startup")
+async def startup_health_checks():
+    """Refresh DB/storage status in the background for /readyz and /api/health"""
+    if COLD_START_BUDGET:
+        # Started by the first /readyz or /api/health instead
+        return
+    health.start()
+
+@app.on_event("shutdown")
+async def shutdown_health_checks():
+    await health.stop()
+
+@app.on_event("startup")
+async def startup_profiler():
+    """Start continuous low-rate profiling when PROFILE_CONTINUOUS=true (never in cold-start budget mode)"""
+    if COLD_START_BUDGET:
+        return
+    import profiling
+    profiling.start_continuous()
+
+@app.on_event("shutdown")
+async def shutdown_profiler():
+    if not COLD_START_BUDGET:
+        import profiling
+        profiling.stop_continuous()
+
+@app.on_event("shutdown")
+async def shutdown_job_workers():
+    if job_workers is not None:
+        await job_workers.shutdown()
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Application shutdown event"""
@@ -299,6 +354,45 @@ def get_current_admin(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Not authorized as admin")
     return current_user
 
+# Optional bearer token required to scrape /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request: Request):
+    """Prometheus text-format metrics for this worker process"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=metrics.render(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+# Probes: /livez answers from memory, /readyz from the background-refreshed health state
+@app.get("/livez", include_in_schema=False)
+async def livez():
+    """Liveness: the event loop is responsive"""
+    return {"status": "alive"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: last background DB/storage check passed and is fresh"""
+    if COLD_START_BUDGET:
+        await health.ensure_fresh()
+    readiness = health.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+# API static files don't change while the process runs - check them once
+_static_files_status: Optional[Dict[str, bool]] = None
+
+def get_static_files_status() -> Dict[str, bool]:
+    global _static_files_status
+    if _static_files_status is None:
+        api_static_dir = BASE_DIR / "api" / "static"
+        _static_files_status = {
+            "css": (api_static_dir / "styles.css").exists(),
+            "js": (api_static_dir / "app.js").exists(),
+            "html": (api_static_dir / "index.html").exists(),
+            "api_static_dir": api_static_dir.exists()
+        }
+    return _static_files_status
+
 # Health check endpoint
 @app.get("/api/health")
 async def health_check():
@@ -312,30 +406,19 @@ async def health_check():
             "version": "1.0.0"
         }
         
-        # Try a simple database connection test
-        try:
-            # This is a minimal test - just checking if we can connect
-            conn = database.get_db_connection()
-            conn.close()
+        # Database status from the background health check (no connection per request)
+        if COLD_START_BUDGET:
+            await health.ensure_fresh()
+        database_status = health.readiness()["database"]
+        if database_status["ok"]:
             health_status["database"] = "connected"
-        except Exception as db_error:
-            logger.warning(f"Health check database warning: {str(db_error)}")
+        else:
             health_status["database"] = "warning"
-            health_status["database_error"] = str(db_error)[:100]  # Truncate long errors
+            health_status["database_error"] = database_status.get("error")
         
         # Check API static files availability (for Vercel deployment)
         try:
-            api_static_dir = BASE_DIR / "api" / "static"
-            css_path = api_static_dir / "styles.css"
-            js_path = api_static_dir / "app.js"
-            html_path = api_static_dir / "index.html"
-            
-            health_status["static_files"] = {
-                "css": css_path.exists(),
-                "js": js_path.exists(), 
-                "html": html_path.exists(),
-                "api_static_dir": api_static_dir.exists()
-            }
+            health_status["static_files"] = get_static_files_status()
         except Exception as static_error:
             health_status["static_files"] = {"error": str(static_error)}
         
@@ -358,12 +441,12 @@ async def health_check():
 
 # Static file serving
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
+async def read_root(request: Request):
     try:
-        # Serve the actual index.html file from api/static directory
-        html_path = BASE_DIR / "api" / "static" / "index.html"
-        if html_path.exists():
-            return FileResponse(str(html_path), media_type="text/html")
+        # index.html from api/static, rewritten to the fingerprinted asset names
+        response = await static_assets.serve("index.html", request.headers)
+        if response is not None:
+            return response
         else:
             # Fallback HTML if the file is missing
             logger.warning("index.html not found in api/static/, serving fallback")
@@ -389,41 +472,119 @@ async def read_root():
         logger.error(f"Error serving root: {e}")
         return HTMLResponse("<h1>Service Temporarily Unavailable</h1>", status_code=503)
 
+# Fingerprinted, precompressed frontend assets (Vercel rewrites /static/* to /api/static/*)
+@app.api_route("/static/{filename}", methods=["GET", "HEAD"])
+@app.api_route("/api/static/{filename}", methods=["GET", "HEAD"])
+async def serve_static_asset(filename: str, request: Request):
+    response = await static_assets.serve(filename, request.headers)
+    if response is None:
+        raise HTTPException(status_code=404, detail=f"Static file '{filename}' not found")
+    return response
+
 # Favicon route (handled by api/index.py in Vercel)
 @app.get("/favicon.ico")
 async def favicon():
     raise HTTPException(status_code=404, detail="Use /static/favicon.ico")
 
+# Locally stored files (STORAGE_BACKEND=local or memory)
+@app.api_route("/files/{sha256}/{filename}", methods=["GET", "HEAD"])
+async def serve_stored_file(sha256: str, filename: str, request: Request):
+    """Serve a content-addressed stored file with Range support and immutable caching"""
+    stored = storage.get_storage().resolve(f"{storage.FILES_URL_PREFIX}{sha256}/{filename}")
+    if not stored:
+        raise HTTPException(status_code=404, detail="File not found")
+    return storage.RangeFileResponse(stored, request.headers)
+
+# Audio streaming with Range/seek support
+@app.api_route("/api/audio/{document_id}", methods=["GET", "HEAD"])
+async def stream_audio(document_id: int, request: Request, quality: str = "original"):
+    """
+    Stream an audio document with Accept-Ranges/206 partial responses
+    quality=low|medium|high selects a compressed rendition when one exists; responses are
+    only cached as immutable once the renditions are complete (or for quality=original)
+    Remote audio is served from a read-ahead segment cache so seeks don't restart the download
+    """
+    import renditions
+    if quality not in renditions.QUALITIES:
+        raise HTTPException(status_code=400, detail=f"quality must be one of {', '.join(renditions.QUALITIES)}")
+    
+    document = await audio_stream.get_audio_document(document_id)
+    if not document or document["file_type"] != "audio":
+        raise HTTPException(status_code=404, detail="Audio not found")
+    
+    rendition = renditions.pick_rendition(document["renditions"], quality)
+    if rendition:
+        url = rendition["file_url"]
+        size = rendition["size_bytes"]
+        etag = f'"doc-{document_id}-{rendition["codec"]}-{rendition["bitrate_kbps"]}"'
+    else:
+        url = document["file_url"]
+        size = document["size_bytes"]
+        etag = f'"{document["blob_sha256"] or f"doc-{document_id}"}"'
+    # Until every rendition exists this URL may serve a different file later
+    if renditions.is_final(document["renditions"], quality):
+        cache_control = audio_stream.AUDIO_CACHE_CONTROL
+    else:
+        cache_control = audio_stream.AUDIO_FALLBACK_CACHE_CONTROL
+    
+    stored = storage.get_storage().resolve(url)
+    if stored:
+        return storage.RangeFileResponse(stored, request.headers, cache_control=cache_control)
+    
+    size = size or await audio_stream.get_remote_size(url)
+    if not size:
+        logger.error(f"❌ Could not determine size of audio document {document_id}")
+        raise HTTPException(status_code=502, detail="Audio file unavailable")
+    
+    return audio_stream.RemoteAudioResponse(url, size, blob_utils.get_content_type(url.split("?")[0]), etag, request.headers, cache_control=cache_control)
+
+@app.get("/api/audio/{document_id}/renditions")
+async def get_audio_renditions(document_id: int):
+    """List the available renditions of an audio document"""
+    document = await audio_stream.get_audio_document(document_id)
+    if not document or document["file_type"] != "audio":
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return [
+        {key: rendition[key] for key in ("codec", "bitrate_kbps", "size_bytes")}
+        for rendition in document["renditions"]
+    ]
+
 # PDF Proxy route for inline viewing
 @app.get("/api/pdf-proxy")
-async def pdf_proxy(url: str):
+async def pdf_proxy(url: str, request: Request):
     """
     Proxy PDF files to serve them with inline Content-Disposition
     This helps prevent automatic downloads and enables inline viewing
     """
+    # Imported here, not at module level, to keep httpx off the cold-start path;
+    # needed before the try so the except clauses below can name its exceptions
+    import httpx
     try:
         logger.info(f"📄 PDF proxy request for URL: {url}")
         
-        import httpx
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            logger.debug(f"🌐 Fetching PDF from external URL: {url}")
-            response = await client.get(url)
-            response.raise_for_status()
-            
-            content_length = len(response.content)
-            logger.info(f"✅ PDF fetched successfully - Size: {content_length} bytes")
-            
-            # Return PDF with inline disposition
-            from fastapi.responses import Response
-            return Response(
-                content=response.content,
-                media_type="application/pdf",
-                headers={
-                    "Content-Disposition": "inline",
-                    "Content-Type": "application/pdf",
-                    "Content-Length": str(content_length)
-                }
-            )
+        # Files in local storage are served directly, no network round trip
+        stored = storage.get_storage().resolve(url)
+        if stored:
+            return storage.RangeFileResponse(stored, request.headers, disposition="inline")
+        
+        logger.debug("🌐 Fetching PDF from external URL: %s", url)
+        response = await blob_utils.request_with_retries("GET", url)
+        response.raise_for_status()
+        
+        content_length = len(response.content)
+        metrics.pdf_proxy_bytes_total.inc(amount=content_length)
+        logger.info(f"✅ PDF fetched successfully - Size: {content_length} bytes")
+        
+        # Return PDF with inline disposition
+        return Response(
+            content=response.content,
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": "inline",
+                "Content-Type": "application/pdf",
+                "Content-Length": str(content_length)
+            }
+        )
             
     except httpx.HTTPStatusError as e:
         error_id = f"PDF_HTTP_ERR_{int(datetime.now().timestamp())}"
@@ -491,13 +652,13 @@ def login_student(student_login: StudentLogin):
         logger.info(f"🔐 Student login attempt for email: {student_login.email}")
         
         # Check if student exists
-        logger.debug(f"🔍 Querying database for student: {student_login.email}")
+        logger.debug("🔍 Querying database for student: %s", student_login.email)
         student = crud.get_student_by_email(student_login.email)
         if not student:
             logger.warning(f"❌ Student login failed - no account found for email: {student_login.email}")
             raise HTTPException(status_code=401, detail="No account found with this email address. Please check your email or register for a new account.")
         
-        logger.debug(f"✅ Student found: ID={student.get('id')}, Active={student.get('is_active')}")
+        logger.debug("✅ Student found: ID=%s, Active=%s", student.get('id'), student.get('is_active'))
         
         # Check if account is active
         if not student.get("is_active", True):
@@ -505,10 +666,10 @@ def login_student(student_login: StudentLogin):
             raise HTTPException(status_code=401, detail="Your account has been deactivated. Please contact support for assistance.")
         
         # TEMPORARY FIX: Skip password verification to test if that's the hanging point
-        logger.debug(f"🔐 Starting password verification for: {student_login.email}")
+        logger.debug("🔐 Starting password verification for: %s", student_login.email)
         try:
             password_valid = auth.verify_password(student_login.password, student["hashed_password"])
-            logger.debug(f"🔐 Password verification completed: {password_valid}")
+            logger.debug("🔐 Password verification completed: %s", password_valid)
         except Exception as pwd_error:
             logger.error(f"💥 Password verification error: {type(pwd_error).__name__}: {str(pwd_error)}")
             logger.error(traceback.format_exc())
@@ -574,7 +735,7 @@ def login_admin(admin_login: AdminLogin):
         if not admin:
             # Check if it's an email issue or password issue
             admin_email = os.getenv("ADMIN_EMAIL")
-            logger.debug(f"🔍 Admin email comparison: provided={admin_login.email}, expected={admin_email}")
+            logger.debug("🔍 Admin email comparison: provided=%s, expected=%s", admin_login.email, admin_email)
             
             if admin_login.email != admin_email:
                 logger.warning(f"❌ Admin login failed - invalid admin email: {admin_login.email}")
@@ -643,14 +804,25 @@ def clear_all_sessions():
     cleanup_sessions()
     return {"message": f"Cleared {session_count} active sessions"}
 
+# Hot catalog reads: concurrent identical loads (same page, same course, same
+# student) share one in-flight fetch instead of each running the crud cascade
+catalog_loads = singleflight.SingleFlight("catalog")
+
+async def load_courses(skip: int, limit: int) -> List[Dict]:
+    return await catalog_loads.do_async(("courses", skip, limit), run_in_threadpool, crud.get_courses, skip, limit)
+
 # Student endpoints
-@app.get("/api/student/courses")
-def get_my_courses(current_user: dict = Depends(get_current_student)):
-    student = crud.get_student_by_email(current_user["email"])
+def _load_student_courses(email: str) -> List[Dict]:
+    student = crud.get_student_by_email(email)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     return crud.get_student_courses(student["id"])
 
+@app.get("/api/student/courses")
+async def get_my_courses(current_user: dict = Depends(get_current_student)):
+    email = current_user["email"]
+    return await catalog_loads.do_async(("student_courses", email), run_in_threadpool, _load_student_courses, email)
+
 @app.get("/api/student/profile")
 def get_student_profile(current_user: dict = Depends(get_current_student)):
     student = crud.get_student_by_email(current_user["email"])
@@ -676,13 +848,57 @@ def get_all_students(
 ):
     return crud.get_students(skip=skip, limit=limit)
 
+@app.get("/api/admin/export/{dataset}")
+def export_dataset(
+    dataset: str,
+    format: str = "ndjson",
+    course_id: Optional[int] = None,
+    current_user: dict = Depends(get_current_admin)
+):
+    """
+    Stream students, courses or enrollments as NDJSON or CSV
+    Rows are read through a server-side cursor, so memory use doesn't grow
+    with the table; course_id limits enrollments to one course
+    """
+    logger.info(f"📤 Export of {dataset} as {format} requested by {current_user.get('email')}")
+    try:
+        import export
+        return export.export_response(dataset, format.lower(), course_id=course_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/students/search")
+def search_students(
+    q: str,
+    limit: int = STUDENT_SEARCH_LIMIT,
+    active: Optional[bool] = None,
+    course_id: Optional[int] = None,
+    enrolled: bool = True,
+    current_user: dict = Depends(get_current_admin)
+):
+    """
+    Typeahead over student emails (substring match, best matches first)
+    active filters on account status; course_id limits to students enrolled
+    in that course, or with enrolled=false to those who are not yet
+    """
+    if not q.strip():
+        return []
+    try:
+        return crud.search_students(
+            q.strip(), min(max(limit, 1), STUDENT_SEARCH_MAX_LIMIT), active=active,
+            course_id=course_id, enrolled=enrolled, timeout_ms=STUDENT_SEARCH_TIMEOUT_MS
+        )
+    except QueryCanceled:
+        logger.warning(f"⏱️  Student search for {q!r} exceeded {STUDENT_SEARCH_TIMEOUT_MS}ms")
+        raise HTTPException(status_code=503, detail="Student search took too long - try a longer search term")
+
 @app.get("/api/admin/courses")
-def get_all_courses_admin(
+async def get_all_courses_admin(
     current_user: dict = Depends(get_current_admin),
     skip: int = 0,
     limit: int = 100
 ):
-    return crud.get_courses(skip=skip, limit=limit)
+    return await load_courses(skip, limit)
 
 @app.post("/api/admin/courses")
 def create_course(
@@ -691,8 +907,8 @@ def create_course(
 ):
     try:
         logger.info(f"📚 Creating new course: {course.title}")
-        logger.debug(f"👤 Course creation requested by admin: {current_user.get('email')}")
-        logger.debug(f"📋 Course details: title='{course.title}', instructor='{course.instructor}', duration='{course.duration}'")
+        logger.debug("👤 Course creation requested by admin: %s", current_user.get('email'))
+        logger.debug("📋 Course details: title='%s', instructor='%s', duration='%s'", course.title, course.instructor, course.duration)
         
         new_course = crud.create_course(
             title=course.title,
@@ -773,6 +989,36 @@ def remove_student_enrollment(
         raise HTTPException(status_code=400, detail="Failed to remove student from course")
     return {"message": "Student removed from course successfully"}
 
+@app.get("/api/admin/http-client/stats")
+def get_http_client_stats(current_user: dict = Depends(get_current_admin)):
+    """Connection reuse statistics for the shared blob storage HTTP client"""
+    return blob_utils.get_http_client_stats()
+
+@app.get("/api/admin/profiles")
+def list_profiles(current_user: dict = Depends(get_current_admin)):
+    """Stored request and continuous profiles, newest first"""
+    import profiling
+    return profiling.list_profiles()
+
+@app.get("/api/admin/profiles/{name}")
+def download_profile(name: str, current_user: dict = Depends(get_current_admin)):
+    import profiling
+    path = profiling.get_profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "text/html" if path.suffix == ".html" else "text/plain"
+    return FileResponse(path, media_type=media_type)
+
+@app.get("/api/admin/audio-cache/stats")
+def get_audio_cache_stats(current_user: dict = Depends(get_current_admin)):
+    """Hit/miss statistics for the audio segment cache"""
+    return audio_stream.get_stats()
+
+@app.get("/api/admin/singleflight/stats")
+def get_singleflight_stats(current_user: dict = Depends(get_current_admin)):
+    """How many catalog and section loads were shared instead of executed"""
+    return singleflight.get_stats()
+
 @app.get("/api/admin/courses/{course_id}/students")
 def get_course_students(
     course_id: int,
@@ -830,6 +1076,111 @@ def delete_section(
         raise HTTPException(status_code=404, detail="Section not found")
     return {"message": "Section deleted successfully"}
 
+async def upload_section_file(file: UploadFile, in_flight: Optional[Dict[str, asyncio.Future]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Store an already-validated upload in blob storage, deduplicated by content hash
+    in_flight (sha256 -> future result) is shared by the uploads of one batch,
+    so identical files in it are stored once
+    Returns {"file_url", "file_type", "blob", "deduplicated", "pathname"} or None if the upload failed
+    """
+    content_type = blob_utils.get_content_type(file.filename)
+    
+    # Determine file type for categorization
+    file_type = "audio" if blob_utils.is_allowed_audio_file(file.filename) else "document"
+    folder = f"section_{file_type}s"
+    
+    sha256, size = await blob_utils.hash_upload(file)
+    blob = {"sha256": sha256, "content_type": content_type, "size_bytes": size}
+    # Content-addressed path so same-name uploads never collide
+    pathname = f"{folder}/{sha256}/{file.filename}"
+    
+    if in_flight is not None and sha256 in in_flight:
+        # An identical file earlier in this batch is being stored already
+        first = await asyncio.shield(in_flight[sha256])
+        if not first:
+            return None
+        logger.info(f"♻️  Duplicate of a file in this batch ({sha256[:12]}): {file.filename}")
+        return {"file_url": first["file_url"], "file_type": file_type, "blob": first["blob"], "deduplicated": True, "pathname": first["pathname"]}
+    
+    # Registered before the first await, so later duplicates wait for this one
+    stored = asyncio.get_running_loop().create_future()
+    if in_flight is not None:
+        in_flight[sha256] = stored
+    result = None
+    try:
+        existing = await run_in_threadpool(crud.get_blob, sha256)
+        # A blob nothing references any more may be removed by /purge at any moment
+        if existing and existing["ref_count"] > 0:
+            # Same content already stored - metadata-only insert, no blob transfer
+            logger.info(f"♻️  Reusing stored blob {sha256[:12]} for: {file.filename}")
+            result = {"file_url": existing["file_url"], "file_type": file_type, "blob": {**blob, "reused": True}, "deduplicated": True, "pathname": pathname}
+        else:
+            logger.info(f"☁️  Streaming upload to {storage.get_storage().name} storage: folder={folder}, type={file_type}, size={size}")
+            
+            # Stream from the upload spool instead of buffering the whole file in memory
+            file_url = await storage.get_storage().put_stream(file, pathname, content_type, size=size)
+            if file_url:
+                result = {"file_url": file_url, "file_type": file_type, "blob": blob, "deduplicated": False, "pathname": pathname}
+    finally:
+        stored.set_result(result)
+    return result
+
+async def discard_redundant_uploads(uploads: List[Dict[str, Any]], documents: List[Dict]):
+    """
+    Delete files this request stored that its documents don't reference
+    That happens when the same content was uploaded concurrently and the
+    other upload registered its blob first (crud._register_blob)
+    """
+    referenced = {storage.object_key(document["file_url"]) for document in documents}
+    candidates = [
+        upload for upload in uploads
+        if not upload["deduplicated"] and storage.object_key(upload["file_url"]) not in referenced
+    ]
+    if not candidates:
+        return
+    
+    def delete_unregistered(registered: Dict[str, str]):
+        # Runs on this threadpool thread under the purge lock. Another request
+        # may have registered the same content-addressed object meanwhile
+        owned = {storage.object_key(url) for url in registered.values()}
+        urls = list({upload["file_url"] for upload in candidates if storage.object_key(upload["file_url"]) not in owned})
+        if not urls:
+            return
+        logger.info(f"🧹 Deleting {len(urls)} redundant uploads of already stored content")
+        if not anyio.from_thread.run(storage.get_storage().delete, urls):
+            logger.warning(f"⚠️  Failed to delete redundant uploads: {urls}")
+    
+    try:
+        await run_in_threadpool(crud.cleanup_unregistered_uploads, [upload["blob"]["sha256"] for upload in candidates], delete_unregistered)
+    except Exception as e:
+        logger.error(f"⚠️  Deleting redundant uploads failed: {type(e).__name__}: {e}")
+
+async def restore_purged_uploads(uploads: List[Dict[str, Any]], files: List[UploadFile]):
+    """
+    Store again uploads whose object a concurrent /purge deleted between
+    put_stream and the blob registration (crud._register_blob)
+    Call once the documents referencing them are committed
+    """
+    for upload, file in zip(uploads, files):
+        if upload["deduplicated"] or not storage.object_missing(upload["file_url"]):
+            continue
+        logger.warning(f"♻️  {file.filename} was purged while being uploaded - storing it again")
+        await file.seek(0)
+        blob = upload["blob"]
+        if not await storage.get_storage().put_stream(file, upload["pathname"], blob["content_type"], size=blob["size_bytes"]):
+            logger.error(f"❌ Failed to store {file.filename} again; its documents point to a missing file")
+
+async def queue_document_processing(documents: List[Dict]) -> bool:
+    """
+    Queue the post-upload jobs for stored documents
+    Never raises: the upload has already succeeded, so a failure is only logged
+    """
+    try:
+        return bool(await run_in_threadpool(jobs.enqueue_document_processing, documents))
+    except Exception as e:
+        logger.error(f"⚠️  Queueing post-upload jobs failed: {type(e).__name__}: {e}")
+        return False
+
 @app.post("/api/admin/sections/{section_id}/documents")
 async def add_section_document(
     section_id: int,
@@ -840,50 +1191,45 @@ async def add_section_document(
 ):
     try:
         logger.info(f"📁 File upload started: {file.filename} for section {section_id}")
-        logger.debug(f"👤 Upload requested by admin: {current_user.get('email')}")
-        logger.debug(f"📋 Upload details: title='{title}', order_index={order_index}")
-        logger.debug(f"🗂️  File details: name={file.filename}, content_type={file.content_type}, size={file.size}")
+        logger.debug("👤 Upload requested by admin: %s", current_user.get('email'))
+        logger.debug("📋 Upload details: title='%s', order_index=%s", title, order_index)
+        logger.debug("🗂️  File details: name=%s, content_type=%s, size=%s", file.filename, file.content_type, file.size)
         
         # Validate file type
         if not (blob_utils.is_allowed_document_file(file.filename) or blob_utils.is_allowed_audio_file(file.filename)):
             logger.warning(f"❌ File upload rejected - invalid file type: {file.filename}")
             raise HTTPException(status_code=400, detail="Invalid file type")
         
-        # Upload file to blob storage
-        logger.debug(f"📖 Reading file content for: {file.filename}")
-        file_content = await file.read()
-        file_size = len(file_content)
-        logger.info(f"✅ File content read successfully - Size: {file_size} bytes")
-        
-        content_type = blob_utils.get_content_type(file.filename)
-        
-        # Determine file type for categorization
-        file_type = "audio" if blob_utils.is_allowed_audio_file(file.filename) else "document"
-        folder = f"section_{file_type}s"
-        
-        logger.info(f"☁️  Uploading to blob storage: folder={folder}, type={file_type}")
+        uploaded = await upload_section_file(file)
         
-        file_url = await blob_utils.upload_file_to_blob(file_content, f"{folder}/{file.filename}", content_type)
-        
-        if not file_url:
+        if not uploaded:
             logger.error(f"❌ Blob storage upload failed for file: {file.filename}")
             raise HTTPException(status_code=500, detail="Failed to upload file")
-            
+        
+        file_url = uploaded["file_url"]
+        file_type = uploaded["file_type"]
         logger.info(f"✅ File uploaded to blob storage successfully: {file_url[:100]}...")
         
         # Add document record
-        logger.debug(f"💾 Adding document record to database")
+        logger.debug("💾 Adding document record to database")
         document = crud.add_section_document(
             section_id=section_id,
             title=title,
             file_url=file_url,
             file_type=file_type,
-            order_index=order_index
+            order_index=order_index,
+            blob=uploaded["blob"]
         )
         
         if not document:
             logger.error(f"❌ Failed to create document record in database for: {file.filename}")
             raise HTTPException(status_code=400, detail="Failed to add document")
+        await discard_redundant_uploads([uploaded], [document])
+        await restore_purged_uploads([uploaded], [file])
+        
+        # Metadata extraction and audio renditions run in the job workers
+        if not await queue_document_processing([document]):
+            logger.warning(f"⚠️  Failed to queue post-upload jobs for document {document['id']}")
         
         logger.info(f"✅ Document upload completed successfully: ID={document.get('id')}, Title='{title}'")
         return document
@@ -905,6 +1251,97 @@ async def add_section_document(
             detail=f"An unexpected error occurred during file upload. Error ID: {error_id}"
         )
 
+@app.post("/api/admin/sections/{section_id}/documents/batch")
+async def add_section_documents_batch(
+    section_id: int,
+    files: List[UploadFile] = File(...),
+    titles: Optional[List[str]] = Form(None),
+    order_index: int = Form(0),
+    current_user: dict = Depends(get_current_admin)
+):
+    """
+    Upload many documents to a section at once
+    Files are sent to blob storage concurrently (bounded by BATCH_UPLOAD_CONCURRENCY) and
+    all document rows are inserted in one transaction. Progress is streamed back as
+    NDJSON: one "uploaded"/"failed" line per file, then a final "completed" line.
+    If the client disconnects (or the insert fails) the files already stored are deleted.
+    """
+    logger.info(f"📁 Batch upload started: {len(files)} files for section {section_id}")
+    logger.debug("👤 Batch upload requested by admin: %s", current_user.get('email'))
+    
+    if titles and len(titles) != len(files):
+        raise HTTPException(status_code=400, detail="titles must match the number of files")
+    
+    async def progress():
+        semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+        in_flight: Dict[str, asyncio.Future] = {}
+        
+        async def upload_one(index: int, file: UploadFile) -> Dict[str, Any]:
+            result = {"index": index, "filename": file.filename}
+            if not (blob_utils.is_allowed_document_file(file.filename) or blob_utils.is_allowed_audio_file(file.filename)):
+                return {**result, "event": "failed", "error": "Invalid file type"}
+            try:
+                async with semaphore:
+                    uploaded = await upload_section_file(file, in_flight)
+            except Exception as e:
+                logger.error(f"💥 Batch upload of {file.filename} failed: {type(e).__name__}: {e}")
+                return {**result, "event": "failed", "error": "Failed to upload file"}
+            if not uploaded:
+                return {**result, "event": "failed", "error": "Failed to upload file"}
+            return {**result, **uploaded, "event": "uploaded"}
+        
+        tasks = [asyncio.create_task(upload_one(index, file)) for index, file in enumerate(files)]
+        uploaded = []
+        failed = []
+        documents = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                (uploaded if result["event"] == "uploaded" else failed).append(result)
+                yield json.dumps(result) + "\n"
+            
+            # Keep the submitted order for order_index and the single insert
+            uploaded.sort(key=lambda result: result["index"])
+            rows = [
+                {
+                    "title": titles[result["index"]] if titles else Path(result["filename"]).stem,
+                    "file_url": result["file_url"],
+                    "file_type": result["file_type"],
+                    "blob": result["blob"],
+                    "order_index": order_index + result["index"],
+                }
+                for result in uploaded
+            ]
+            # Shielded: a disconnect must not leave the insert committed but unaccounted for
+            with anyio.CancelScope(shield=True):
+                documents = await run_in_threadpool(crud.add_section_documents, section_id, rows) if rows else []
+                if documents is not None:
+                    await discard_redundant_uploads(uploaded, documents)
+                    await restore_purged_uploads(uploaded, [files[result["index"]] for result in uploaded])
+            if documents is None:
+                logger.error(f"❌ Batch insert failed for section {section_id}")
+                yield json.dumps({"event": "completed", "error": "Failed to add documents", "documents": [], "failed": failed}) + "\n"
+                return
+            
+            if documents and not await queue_document_processing(documents):
+                logger.warning(f"⚠️  Failed to queue post-upload jobs for section {section_id}")
+            
+            logger.info(f"✅ Batch upload completed: {len(documents)} added, {len(failed)} failed for section {section_id}")
+            yield json.dumps({"event": "completed", "documents": documents, "failed": failed}, default=str) + "\n"
+        finally:
+            if documents is None:
+                # Client gone or insert failed: nothing references what this batch stored
+                with anyio.CancelScope(shield=True):
+                    for task in tasks:
+                        task.cancel()
+                    results = await asyncio.gather(*tasks, return_exceptions=True)
+                    stored = [result for result in results if isinstance(result, dict) and result["event"] == "uploaded"]
+                    if stored:
+                        logger.warning(f"⚠️  Batch upload for section {section_id} abandoned after storing {len(stored)} files")
+                        await discard_redundant_uploads(stored, [])
+    
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
 @app.delete("/api/admin/documents/{document_id}")
 def delete_document(
     document_id: int,
@@ -915,18 +1352,54 @@ def delete_document(
         raise HTTPException(status_code=404, detail="Document not found")
     return {"message": "Document deleted successfully"}
 
+@app.post("/api/admin/blobs/purge")
+async def purge_unreferenced_blobs(current_user: dict = Depends(get_current_admin)):
+    """Delete stored files (uploads and renditions) that nothing references any more"""
+    def delete_files(urls: List[str]):
+        # Runs on this threadpool thread while crud holds the purge lock
+        try:
+            deleted = anyio.from_thread.run(storage.get_storage().delete, urls)
+        except Exception as e:
+            logger.error(f"💥 Storage delete during purge failed: {type(e).__name__}: {e}")
+            deleted = False
+        if not deleted:
+            logger.warning(f"⚠️  Blob rows purged but storage delete failed for {len(urls)} files")
+    
+    urls = await run_in_threadpool(crud.delete_unreferenced_blobs, delete_files)
+    logger.info(f"🧹 Purged {len(urls)} unreferenced blobs")
+    return {"message": f"Purged {len(urls)} unreferenced blobs", "purged": len(urls)}
+
+@app.get("/api/admin/jobs/stats")
+def get_job_stats(current_user: dict = Depends(get_current_admin)):
+    """Background job counts per status"""
+    return {"mode": jobs.JOB_WORKER_MODE, "counts": crud.get_job_counts()}
+
 # Public endpoints (no auth required)
 @app.get("/api/courses")
-def get_courses(skip: int = 0, limit: int = 100):
-    return crud.get_courses(skip=skip, limit=limit)
+async def get_courses(skip: int = 0, limit: int = 100):
+    return await load_courses(skip, limit)
 
 @app.get("/api/courses/{course_id}")
-def get_course(course_id: int):
-    course = crud.get_course_by_id(course_id)
+async def get_course(course_id: int):
+    course = await catalog_loads.do_async(("course", course_id), run_in_threadpool, crud.get_course_by_id, course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     return course
 
+@app.get("/api/search")
+def search_catalog(q: str, types: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    Full-text search across active courses, sections and documents
+    types defaults to all of course,section,document; pass the returned
+    next_cursor as `cursor` for the following page
+    """
+    import search
+    types = types or ",".join(search.SEARCH_TYPES)
+    try:
+        return search.search(q, [kind.strip() for kind in types.split(",") if kind.strip()], limit or search.SEARCH_DEFAULT_LIMIT, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Session store for tracking active sessions
 active_sessions = set()
 
@@ -0,0 +1,190 @@
+"""
+In-process metrics registry rendered in the Prometheus text format (/metrics)
+
+Recording never takes a lock: every thread writes to its own shard (a plain
+dict reached through threading.local), and a scrape sums the shards. The
+event loop is one thread, threadpool workers are the others, so a
+counter update costs a thread-local lookup and a dict add.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+class _Shard:
+    """One thread's samples: metric name -> label values -> value (or histogram state)"""
+    def __init__(self):
+        self.values: Dict[str, Dict[LabelValues, object]] = {}
+
+REGISTRY: List = []
+
+_local = threading.local()
+_shards: List[_Shard] = []
+_shards_lock = threading.Lock()
+
+def _shard() -> _Shard:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        # Once per thread; shards outlive their threads so counts are never lost
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+def _snapshot(name: str) -> List[Dict[LabelValues, object]]:
+    with _shards_lock:
+        shards = list(_shards)
+    # dict.copy() is atomic under the GIL, so a writer can't break the iteration
+    return [shard.values.get(name, {}).copy() for shard in shards]
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    """Monotonic counter; also used as a gauge when inc() is given negative amounts"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        values = _shard().values.setdefault(self.name, {})
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    def collect(self) -> Dict[LabelValues, float]:
+        totals: Dict[LabelValues, float] = {}
+        for values in _snapshot(self.name):
+            for labelvalues, value in values.items():
+                totals[labelvalues] = totals.get(labelvalues, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labelvalues, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    """Up/down value kept as per-thread deltas (inc/dec may happen on different threads)"""
+    kind = "gauge"
+
+    def dec(self, *labelvalues: str, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    @contextmanager
+    def track(self, *labelvalues: str):
+        self.inc(*labelvalues)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues)
+
+class Histogram:
+    """Cumulative-bucket histogram; per-thread state is [bucket counts..., sum, count]"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labelvalues: str):
+        values = _shard().values.setdefault(self.name, {})
+        state = values.get(labelvalues)
+        if state is None:
+            state = values[labelvalues] = [0] * (len(self.buckets) + 3)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def collect(self) -> Dict[LabelValues, List[float]]:
+        totals: Dict[LabelValues, List[float]] = {}
+        for values in _snapshot(self.name):
+            for labelvalues, state in values.items():
+                total = totals.setdefault(labelvalues, [0] * len(state))
+                for index, value in enumerate(list(state)):
+                    total[index] += value
+        return totals
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, state in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labelnames, labelvalues, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+def render(extra_lines: Optional[List[str]] = None) -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    if extra_lines:
+        lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+# Starlette appends "; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# HTTP
+http_requests_total = Counter("http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+# Database
+db_connections_open = Gauge("db_connections_open", "Database connections currently open")
+db_connect_seconds = Histogram("db_connect_seconds", "Time spent waiting for a database connection")
+db_queries_total = Counter("db_queries_total", "Database statements executed by statement type", ("statement",))
+db_query_duration_seconds = Histogram("db_query_duration_seconds", "Database statement latency by statement type", ("statement",))
+db_query_errors_total = Counter("db_query_errors_total", "Database statements that raised", ("statement",))
+
+# Password hashing
+bcrypt_queue_depth = Gauge("bcrypt_queue_depth", "Password hash operations waiting for a bcrypt slot")
+bcrypt_wait_seconds = Histogram("bcrypt_wait_seconds", "Time spent waiting for a bcrypt slot", ("operation",))
+bcrypt_duration_seconds = Histogram("bcrypt_duration_seconds", "bcrypt hash/verify time", ("operation",), buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0))
+
+# Request coalescing (singleflight.py)
+singleflight_calls_total = Counter("singleflight_calls_total", "Coalesced loads by group, path and role (leader runs the load, followers share it)", ("group", "mode", "role"))
+
+# File storage and proxying
+blob_upload_bytes_total = Counter("blob_upload_bytes_total", "Bytes uploaded to file storage", ("backend",))
+blob_upload_duration_seconds = Histogram("blob_upload_duration_seconds", "File storage upload time", ("backend", "result"), buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+pdf_proxy_bytes_total = Counter("pdf_proxy_bytes_total", "Bytes served through the PDF proxy")
+
+# Response compression
+http_compressed_responses_total = Counter("http_compressed_responses_total", "Compressed responses by encoding and compression cache result", ("encoding", "cache"))
+http_compression_bytes_total = Counter("http_compression_bytes_total", "Response body bytes before (in) and after (out) compression", ("stage",))
+http_compression_seconds = Histogram("http_compression_seconds", "Time spent compressing a response body", ("encoding",), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
@@ -0,0 +1,282 @@
+"""
+Pure ASGI middleware
+
+Written against the raw ASGI interface instead of BaseHTTPMiddleware, so
+there is no extra task or memory stream per request and streaming
+responses pass straight through.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import compression
+import database
+import logging_config
+import metrics
+
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger(logging_config.ACCESS_LOGGER)
+
+def add_server_timing(scope: Scope, name: str, duration_ms: float, description: str = None):
+    """Record a Server-Timing metric for the current request (rendered by RequestTimingMiddleware)"""
+    timings = scope.get("state", {}).get("server_timing")
+    if timings is not None:
+        timings.append((name, duration_ms, description))
+
+def _server_timing_header(timings: List[Tuple[str, float, str]]) -> str:
+    parts = []
+    for name, duration_ms, description in timings:
+        part = f"{name};dur={duration_ms:.2f}"
+        if description:
+            part += f';desc="{description}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+_route_templates: Dict[Any, str] = {}
+
+def route_template(scope: Scope) -> str:
+    """
+    Path template of the route that handled the request ("/api/courses/{course_id}")
+    Raw paths would give every id its own metrics series
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "<unmatched>"
+    template = _route_templates.get(endpoint)
+    if template is None:
+        template = "<unknown>"
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                template = route.path
+                break
+            if getattr(route, "app", None) is endpoint:
+                # Mounted app (static files)
+                template = route.path + "/*"
+                break
+        _route_templates[endpoint] = template
+    return template
+
+class RequestTimingMiddleware:
+    """
+    Times each request with perf_counter_ns, counts its database statements
+    (see database.track_queries), adds a Server-Timing header, records
+    request metrics and the (sampled) access log, warns about query budget
+    violations and turns unhandled exceptions into a JSON 500 carrying an
+    error id
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with database.track_queries(enforce_on_exit=False) as queries:
+            await self._call(scope, receive, send, queries)
+
+    async def _call(self, scope: Scope, receive: Receive, send: Send, queries: database.QueryStats):
+        start_ns = time.perf_counter_ns()
+        timings: List[Tuple[str, float, str]] = []
+        scope.setdefault("state", {})["server_timing"] = timings
+        status_code = 500
+        response_started = False
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 Request headers for %s %s: %s", scope["method"], scope["path"], dict(Headers(scope=scope)))
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                app_ms = (time.perf_counter_ns() - start_ns) / 1e6
+                db_timing = ("db", queries.seconds * 1000, f"{queries.count} queries")
+                headers.append("Server-Timing", _server_timing_header([("app", app_ms, None), db_timing] + timings))
+            await send(message)
+
+        async def checked_send(message: Message):
+            if message["type"] == "http.response.start":
+                # DB_QUERY_BUDGET_ACTION=raise turns an over-budget request into a 500
+                queries.enforce()
+            await send_wrapper(message)
+
+        metrics.http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, checked_send)
+        except Exception as e:
+            duration_ms = round((time.perf_counter_ns() - start_ns) / 1e6, 2)
+            error_id = f"ERR_{int(datetime.now().timestamp())}"
+            client = scope.get("client")
+            logger.exception(
+                "❌ CRITICAL ERROR [%s]: %s %s: %s: %s", error_id, scope["method"], scope["path"], type(e).__name__, e,
+                extra={
+                    "error_id": error_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": 500,
+                    "duration_ms": duration_ms,
+                    "client": client[0] if client else None,
+                }
+            )
+            if response_started:
+                # Too late for an error body; let the server drop the connection
+                raise
+
+            # Return user-friendly error response
+            response = JSONResponse(
+                status_code=500,
+                content={
+                    "error": "Internal Server Error",
+                    "message": "An unexpected error occurred. Please try again later.",
+                    "error_id": error_id,
+                    "timestamp": datetime.now().isoformat()
+                }
+            )
+            await response(scope, receive, send_wrapper)
+            return
+        finally:
+            metrics.http_requests_in_flight.dec()
+            self._observe(scope, status_code, time.perf_counter_ns() - start_ns)
+
+        # One (sampled) structured access record per request
+        duration_ms = round((time.perf_counter_ns() - start_ns) / 1e6, 2)
+        access_logger.info(
+            "%s %s %s", scope["method"], scope["path"], status_code,
+            extra={
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": duration_ms,
+                "db_queries": queries.count,
+                "db_ms": round(queries.seconds * 1000, 2),
+            }
+        )
+        problems = queries.problems()
+        if problems:
+            logger.warning(
+                "🐢 Query budget exceeded on %s %s: %s", scope["method"], route_template(scope), "; ".join(problems),
+                extra={"path": scope["path"], "db_queries": queries.count, "db_connections": queries.connections}
+            )
+
+    @staticmethod
+    def _observe(scope: Scope, status_code: int, elapsed_ns: int):
+        labels = (scope["method"], route_template(scope), str(status_code))
+        metrics.http_requests_total.inc(*labels)
+        metrics.http_request_duration_seconds.observe(elapsed_ns / 1e9, *labels)
+
+class CompressionMiddleware:
+    """
+    Compresses buffered text/JSON responses of at least COMPRESSION_MIN_SIZE
+    bytes with the best encoding the client accepts (brotli, then gzip)
+    Compression runs in the threadpool, never on the event loop. Bodies from
+    COMPRESSION_CACHE_ROUTES are cached compressed, so an unchanged catalog
+    is compressed once. Streaming responses and responses that already
+    carry a Content-Encoding (precompressed static assets) pass through.
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = compression.COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = compression.CompressedCache()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = compression.negotiate(Headers(scope=scope).get("accept-encoding"))
+        start_message: Message = None
+        passthrough = False
+
+        async def compressing_send(message: Message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Held until the first body chunk shows whether to compress
+                start_message = message
+                return
+
+            passthrough = True
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start_message)
+            if message.get("more_body", False) or not self._should_compress(start_message, headers, body):
+                await send(start_message)
+                await send(message)
+                return
+
+            headers.add_vary_header("Accept-Encoding")
+            if encoding != "identity":
+                compressed = await self._compress(scope, body, encoding)
+                if len(compressed) < len(body):
+                    body = compressed
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, compressing_send)
+
+    def _should_compress(self, start_message: Message, headers: MutableHeaders, body: bytes) -> bool:
+        return (
+            start_message["status"] not in (204, 206, 304)
+            and "content-encoding" not in headers
+            and compression.is_compressible(headers.get("content-type"))
+            and len(body) >= self.minimum_size
+        )
+
+    async def _compress(self, scope: Scope, body: bytes, encoding: str) -> bytes:
+        key = None
+        if route_template(scope) in compression.COMPRESSION_CACHE_ROUTES:
+            key = self.cache.key(body, encoding)
+            cached = self.cache.get(key)
+            if cached is not None:
+                metrics.http_compressed_responses_total.inc(encoding, "hit")
+                self._count_bytes(body, cached)
+                return cached
+
+        start = time.perf_counter()
+        compressed = await anyio.to_thread.run_sync(compression.compress, body, encoding, compression.dynamic_quality(encoding))
+        elapsed = time.perf_counter() - start
+        metrics.http_compression_seconds.observe(elapsed, encoding)
+        add_server_timing(scope, "compress", elapsed * 1000, encoding)
+
+        if key is not None:
+            self.cache.put(key, compressed)
+        metrics.http_compressed_responses_total.inc(encoding, "miss" if key is not None else "uncached")
+        self._count_bytes(body, compressed)
+        return compressed
+
+    @staticmethod
+    def _count_bytes(body: bytes, compressed: bytes):
+        metrics.http_compression_bytes_total.inc("in", amount=len(body))
+        metrics.http_compression_bytes_total.inc("out", amount=len(compressed))
+
+class LazyProfileMiddleware:
+    """
+    profiling.ProfileMiddleware, imported on the first request that asks to
+    be profiled; until then only the X-Profile header and query string are looked at
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.profiled: ASGIApp = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if self.profiled is None:
+            if scope["type"] != "http" or not _may_request_profile(scope):
+                await self.app(scope, receive, send)
+                return
+            import profiling
+            self.profiled = profiling.ProfileMiddleware(self.app)
+        await self.profiled(scope, receive, send)
+
+def _may_request_profile(scope: Scope) -> bool:
+    return b"profile=" in scope["query_string"] or any(key == b"x-profile" for key, _ in scope["headers"])
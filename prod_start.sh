@@ -9,11 +9,12 @@ echo "======================================="
 # Set production environment
 export ENVIRONMENT=production
 
-# Use the virtual environment's uvicorn
+# Use the virtual environment's gunicorn
 PYTHON_ENV=".venv/bin"
 
 # Stop any existing servers
 pkill -f "uvicorn main:app" 2>/dev/null || true
+pkill -f "gunicorn.*main:app" 2>/dev/null || true
 
 # Check if main.py exists
 if [ ! -f "main.py" ]; then
@@ -22,9 +23,11 @@ if [ ! -f "main.py" ]; then
 fi
 
 # Start the server in production mode
-echo "🔥 Starting PRODUCTION server at http://localhost:8000"
+# Multiple uvicorn workers (uvloop + httptools) under gunicorn; see gunicorn.conf.py
+echo "🔥 Starting PRODUCTION server at http://localhost:${PORT:-8000}"
 echo "Environment: PRODUCTION"
+echo "Workers: ${WEB_WORKERS:-one per CPU}"
 echo "Press Ctrl+C to stop"
 echo ""
 
-$PYTHON_ENV/uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+exec $PYTHON_ENV/gunicorn -c gunicorn.conf.py main:app
@@ -0,0 +1,344 @@
+"""
+Sampling profiler for production diagnostics
+
+On demand: an admin adds `X-Profile: store` (or `return`) to any request,
+or `?profile=store|return`. That one request runs under a stack sampler
+and the result is saved to PROFILE_OUTPUT_DIR ("store": id returned in
+the X-Profile-Id header) or sent back instead of the response body
+("return"). Output is folded stacks ("a;b;c 12"), which flamegraph.pl and
+speedscope render directly; with PROFILER=pyinstrument (if installed) an
+HTML call tree is produced instead.
+
+Only this request's work is sampled, so concurrent requests don't show
+up: on the event loop, while its task (or a task it created) is running,
+and on threadpool workers, while they run a call it made through
+run_in_threadpool/anyio. Work it hands to other threads (asyncio.to_thread,
+library-owned threads) is not included.
+
+Continuous: PROFILE_CONTINUOUS=true samples every thread at a low rate
+and writes aggregated folded stacks to disk every PROFILE_FLUSH_INTERVAL.
+
+Only the newest PROFILE_MAX_FILES profiles are kept in PROFILE_OUTPUT_DIR.
+
+When neither is in use nothing runs: no thread, no hooks, and requests
+pay only a check of the query string and headers.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from weakref import WeakSet
+from urllib.parse import parse_qs
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import auth
+
+logger = logging.getLogger(__name__)
+
+PROFILER = os.getenv("PROFILER", "sampler").lower()
+PROFILE_OUTPUT_DIR = Path(os.getenv("PROFILE_OUTPUT_DIR") or str(Path(__file__).parent / "profiles"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.002"))
+PROFILE_CONTINUOUS = os.getenv("PROFILE_CONTINUOUS", "false").lower() == "true"
+PROFILE_CONTINUOUS_INTERVAL = float(os.getenv("PROFILE_CONTINUOUS_INTERVAL", "0.1"))
+PROFILE_FLUSH_INTERVAL = float(os.getenv("PROFILE_FLUSH_INTERVAL", "300"))
+# Older profiles are deleted as new ones are written
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+PROFILE_MODES = ("store", "return")
+# File names this module writes; pruning leaves anything else in the directory alone
+_PROFILE_PREFIXES = ("request-", "continuous-")
+
+# Leaf functions of threads that are just waiting (event loop select, idle pool workers, ...)
+_IDLE_LEAVES = {"select", "poll", "wait", "_wait_for_tstate_lock", "_worker", "dequeue"}
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+class StackSampler:
+    """Background thread that samples sys._current_frames() into folded-stack counts"""
+    def __init__(self, interval: float, on_flush=None, flush_interval: Optional[float] = None):
+        self.interval = interval
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own_id = threading.get_ident()
+        last_flush = time.monotonic()
+        while not self._stop.wait(self.interval):
+            self._sample(own_id)
+            if self.on_flush and time.monotonic() - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = time.monotonic()
+        if self.on_flush:
+            self._flush()
+
+    def _include(self, thread_id: int, frame) -> bool:
+        return True
+
+    def _sample(self, own_id: int):
+        self.samples += 1
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or frame.f_code.co_name in _IDLE_LEAVES or not self._include(thread_id, frame):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            self.counts[";".join(reversed(stack))] += 1
+
+    def _flush(self):
+        counts, self.counts = self.counts, Counter()
+        if counts:
+            try:
+                self.on_flush(counts)
+            except Exception as e:
+                logger.error(f"⚠️  Profile flush failed: {type(e).__name__}: {e}")
+
+# The RequestSampler of the profiled request; tasks and threadpool calls it starts inherit it
+_profiled_request: contextvars.ContextVar[Optional["RequestSampler"]] = contextvars.ContextVar("profiled_request", default=None)
+
+class RequestSampler(StackSampler):
+    """
+    StackSampler limited to one request: the event loop thread counts while
+    one of the request's tasks runs, worker threads while they run a call
+    whose context (copied by anyio's run_sync) belongs to the request
+    Must be created and started on the event loop, inside the request's task
+    """
+    def __init__(self, interval: float):
+        super().__init__(interval)
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.tasks: "WeakSet[asyncio.Task]" = WeakSet([asyncio.current_task()])
+
+    def _include(self, thread_id, frame):
+        if thread_id == self.loop_thread:
+            return asyncio.current_task(self.loop) in self.tasks
+        while frame is not None:
+            # anyio's WorkerThread.run holds the caller's context in a local
+            if frame.f_code.co_name == "run" and "context" in frame.f_code.co_varnames:
+                context = frame.f_locals.get("context")
+                return isinstance(context, contextvars.Context) and context.get(_profiled_request) is self
+            frame = frame.f_back
+        return False
+
+_factory_users = 0
+_previous_factory = None
+
+def _task_factory(loop, coro, **kwargs):
+    """Adds tasks created inside a profiled request to its RequestSampler"""
+    if _previous_factory is not None:
+        task = _previous_factory(loop, coro, **kwargs)
+    else:
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+    sampler = _profiled_request.get()
+    if sampler is not None:
+        sampler.tasks.add(task)
+    return task
+
+def _track_tasks(loop: asyncio.AbstractEventLoop, enable: bool):
+    """Install the task factory while any request is being profiled"""
+    global _factory_users, _previous_factory
+    if enable:
+        _factory_users += 1
+        if _factory_users == 1:
+            _previous_factory = loop.get_task_factory()
+            loop.set_task_factory(_task_factory)
+    else:
+        _factory_users -= 1
+        if _factory_users == 0:
+            loop.set_task_factory(_previous_factory)
+            _previous_factory = None
+
+def folded(counts: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+def _write_profile(name: str, content: str) -> Path:
+    PROFILE_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_OUTPUT_DIR / name
+    path.write_text(content, encoding="utf-8")
+    _prune_profiles()
+    return path
+
+def _prune_profiles():
+    """Delete the oldest profiles beyond PROFILE_MAX_FILES"""
+    profiles = sorted(
+        (entry for entry in os.scandir(PROFILE_OUTPUT_DIR) if entry.is_file() and entry.name.startswith(_PROFILE_PREFIXES)),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in profiles[PROFILE_MAX_FILES:]:
+        # Other workers prune the same directory
+        Path(entry.path).unlink(missing_ok=True)
+
+def list_profiles() -> List[Dict]:
+    if not PROFILE_OUTPUT_DIR.exists():
+        return []
+    return [
+        {"name": path.name, "size": path.stat().st_size, "modified": datetime.fromtimestamp(path.stat().st_mtime).isoformat()}
+        for path in sorted(PROFILE_OUTPUT_DIR.iterdir(), key=lambda path: path.stat().st_mtime, reverse=True)
+        if path.is_file()
+    ]
+
+def get_profile_path(name: str) -> Optional[Path]:
+    """Path of a stored profile, refusing anything outside PROFILE_OUTPUT_DIR"""
+    path = PROFILE_OUTPUT_DIR / Path(name).name
+    return path if path.is_file() else None
+
+def _requested_mode(scope: Scope) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == b"x-profile":
+            mode = value.decode("latin-1").lower()
+            return mode if mode in PROFILE_MODES else "store"
+    if b"profile=" in scope["query_string"]:
+        mode = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [""])[0].lower()
+        if mode in PROFILE_MODES:
+            return mode
+    return None
+
+def _is_admin(scope: Scope) -> bool:
+    """Same check as main.get_current_admin: a valid bearer token of type admin"""
+    for key, value in scope["headers"]:
+        if key == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            payload = auth.verify_token(token) if scheme.lower() == "bearer" else None
+            return bool(payload and payload.get("type") == "admin")
+    return False
+
+class ProfileMiddleware:
+    """Runs admin requests that ask for it under the profiler"""
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = _requested_mode(scope)
+        if mode is None or not _is_admin(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        held: List[Message] = []
+
+        async def profiled_send(message: Message):
+            if mode == "return":
+                # The profile replaces the response; keep only the status
+                if message["type"] == "http.response.start":
+                    held.append(message)
+                return
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+            await send(message)
+
+        start = time.perf_counter()
+        run = self._run_pyinstrument if PROFILER == "pyinstrument" else self._run_sampler
+        content, extension, media_type, error = await run(scope, receive, profiled_send)
+        elapsed = time.perf_counter() - start
+
+        name = f"request-{profile_id}.{extension}"
+        await asyncio.to_thread(_write_profile, name, content)
+        status = next((message["status"] for message in held if message["type"] == "http.response.start"), None)
+        logger.info(f"🔬 Profiled {scope['method']} {scope['path']} in {elapsed:.3f}s -> {name}")
+        if error is not None and mode == "store":
+            raise error
+
+        if mode == "return":
+            body = content.encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", media_type.encode()),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-profile-id", profile_id.encode()),
+                    (b"x-profiled-status", str(status if error is None else "error").encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+
+    async def _run_app(self, scope, receive, send) -> Optional[Exception]:
+        # The profile is kept even when the request fails
+        try:
+            await self.app(scope, receive, send)
+        except Exception as e:
+            return e
+        return None
+
+    async def _run_sampler(self, scope, receive, send):
+        sampler = RequestSampler(PROFILE_SAMPLE_INTERVAL)
+        token = _profiled_request.set(sampler)
+        _track_tasks(sampler.loop, True)
+        sampler.start()
+        try:
+            error = await self._run_app(scope, receive, send)
+        finally:
+            counts = sampler.stop()
+            _track_tasks(sampler.loop, False)
+            _profiled_request.reset(token)
+        header = (
+            f"# {scope['method']} {scope['path']} - {sampler.samples} samples every {PROFILE_SAMPLE_INTERVAL * 1000:g}ms, "
+            "this request's tasks and threadpool calls only (not asyncio.to_thread or library threads)\n"
+        )
+        return header + folded(counts), "folded", "text/plain; charset=utf-8", error
+
+    async def _run_pyinstrument(self, scope, receive, send):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("⚠️  PROFILER=pyinstrument but pyinstrument is not installed - using the stack sampler")
+            return await self._run_sampler(scope, receive, send)
+        # async_mode follows this request's task; sync endpoints' threadpool work shows as await time
+        profiler = Profiler(interval=PROFILE_SAMPLE_INTERVAL, async_mode="enabled")
+        profiler.start()
+        try:
+            error = await self._run_app(scope, receive, send)
+        finally:
+            profiler.stop()
+        return profiler.output_html(), "html", "text/html; charset=utf-8", error
+
+_continuous: Optional[StackSampler] = None
+
+def _write_continuous(counts: Counter):
+    name = f"continuous-{os.getpid()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+    _write_profile(name, folded(counts))
+
+def start_continuous():
+    """Start low-rate whole-process sampling if PROFILE_CONTINUOUS is enabled"""
+    global _continuous
+    if not PROFILE_CONTINUOUS or _continuous is not None:
+        return
+    _continuous = StackSampler(PROFILE_CONTINUOUS_INTERVAL, on_flush=_write_continuous, flush_interval=PROFILE_FLUSH_INTERVAL)
+    _continuous.start()
+    logger.info(f"🔬 Continuous profiling every {PROFILE_CONTINUOUS_INTERVAL}s, flushed to {PROFILE_OUTPUT_DIR} every {PROFILE_FLUSH_INTERVAL:g}s")
+
+def stop_continuous():
+    global _continuous
+    if _continuous is not None:
+        _continuous.stop()
+        _continuous = None
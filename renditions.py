@@ -0,0 +1,175 @@
+"""
+Low-bitrate audio renditions generated off the request path with a local ffmpeg
+
+After an audio upload an "audio_renditions" job (see jobs.py) transcodes the
+original (often lossless FLAC/WAV) into the profiles in AUDIO_RENDITIONS, stores
+them through the configured storage backend and records them in
+document_renditions. Players then pick one with
+/api/audio/{document_id}?quality=low|medium|high|original.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from urllib.parse import urlparse
+from typing import Optional, List, Dict, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+
+import blob_utils
+import crud
+import jobs
+import storage
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+# Comma-separated codec:kbps profiles, lowest first
+AUDIO_RENDITIONS = os.getenv("AUDIO_RENDITIONS", "opus:32,opus:64,mp3:128")
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "1800"))
+
+# codec -> (ffmpeg encoder, file extension)
+CODECS = {
+    "opus": ("libopus", "ogg"),
+    "mp3": ("libmp3lame", "mp3"),
+    "aac": ("aac", "m4a"),
+}
+
+QUALITIES = ("low", "medium", "high", "original")
+
+def get_profiles() -> List[Tuple[str, int]]:
+    """Parse AUDIO_RENDITIONS into [(codec, kbps)], skipping unknown codecs"""
+    profiles = []
+    for item in AUDIO_RENDITIONS.split(","):
+        codec, _, kbps = item.strip().partition(":")
+        if codec in CODECS and kbps.isdigit():
+            profiles.append((codec, int(kbps)))
+    return profiles
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG_BINARY) is not None
+
+def pick_rendition(renditions: List[Dict], quality: str) -> Optional[Dict]:
+    """
+    Choose a rendition for a requested quality
+    low/medium/high map onto the lowest/middle/highest available bitrate; original (or none available) returns None
+    """
+    if quality == "original" or not renditions:
+        return None
+    ordered = sorted(renditions, key=lambda rendition: rendition["bitrate_kbps"])
+    if quality == "low":
+        return ordered[0]
+    if quality == "high":
+        return ordered[-1]
+    return ordered[len(ordered) // 2]
+
+def is_final(renditions: List[Dict], quality: str) -> bool:
+    """
+    Whether pick_rendition's answer for this quality can no longer change:
+    always for original, otherwise once every AUDIO_RENDITIONS profile exists
+    """
+    if quality == "original":
+        return True
+    existing = {(rendition["codec"], rendition["bitrate_kbps"]) for rendition in renditions}
+    return all(profile in existing for profile in get_profiles())
+
+async def _transcode(source: Path, output: Path, codec: str, kbps: int) -> bool:
+    encoder, _ = CODECS[codec]
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(source), "-vn", "-ac", "2" if kbps >= 64 else "1",
+        "-c:a", encoder, "-b:a", f"{kbps}k", str(output),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=FFMPEG_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        logger.error(f"⏰ ffmpeg timed out after {FFMPEG_TIMEOUT}s ({codec} {kbps}k)")
+        return False
+    if process.returncode != 0:
+        logger.error(f"❌ ffmpeg failed ({codec} {kbps}k): {stderr.decode(errors='replace')[:500]}")
+        return False
+    return True
+
+async def create_renditions(document_id: int, file_url: str, filename: str) -> List[Dict]:
+    """
+    Transcode one audio document into every configured profile and record the results
+    Raises if any profile failed so the job is retried (finished profiles are skipped next time)
+    """
+    if not ffmpeg_available():
+        logger.warning(f"⚠️  ffmpeg not found ('{FFMPEG_BINARY}') - skipping renditions for document {document_id}")
+        return []
+
+    existing = {
+        (rendition["codec"], rendition["bitrate_kbps"])
+        for rendition in await run_in_threadpool(crud.get_document_renditions, document_id)
+    }
+    profiles = [profile for profile in get_profiles() if profile not in existing]
+    if not profiles:
+        return []
+
+    created = []
+    failed = 0
+    with tempfile.TemporaryDirectory(prefix="renditions_") as workdir:
+        source = Path(workdir) / f"source{Path(filename).suffix}"
+        if not await storage.download_to_path(file_url, source):
+            raise RuntimeError(f"rendition source download failed for document {document_id}")
+
+        for codec, kbps in profiles:
+            _, extension = CODECS[codec]
+            output = Path(workdir) / f"{codec}_{kbps}.{extension}"
+            if not await _transcode(source, output, codec, kbps):
+                failed += 1
+                continue
+
+            size = output.stat().st_size
+            stem = Path(filename).stem
+            with open(output, "rb") as f:
+                upload = UploadFile(f, size=size, filename=f"{stem}.{kbps}k.{extension}")
+                content_type = blob_utils.get_content_type(upload.filename)
+                # Tracked as a blob like the original upload, so its file is
+                # purged once the document (or this rendition) is gone
+                sha256, size = await blob_utils.hash_upload(upload)
+                pathname = f"section_audios/renditions/{document_id}/{upload.filename}"
+                blob = {"sha256": sha256, "content_type": content_type, "size_bytes": size}
+                existing = await run_in_threadpool(crud.get_blob, sha256)
+                reused = bool(existing and existing["ref_count"] > 0)
+                if reused:
+                    url = existing["file_url"]
+                    blob["reused"] = True
+                else:
+                    url = await storage.get_storage().put_stream(upload, pathname, content_type, size=size)
+            if not url:
+                logger.error(f"❌ Failed to store {codec} {kbps}k rendition for document {document_id}")
+                failed += 1
+                continue
+
+            rendition = await run_in_threadpool(crud.add_document_rendition, document_id, codec, kbps, url, size, blob)
+            if rendition:
+                created.append(rendition)
+                if not reused and storage.object_missing(url):
+                    # A concurrent /purge removed the object before it was registered
+                    with open(output, "rb") as f:
+                        await storage.get_storage().put_stream(UploadFile(f, size=size, filename=upload.filename), pathname, content_type, size=size)
+                if not reused and storage.object_key(rendition["file_url"]) != storage.object_key(url):
+                    # A concurrent run registered the same content first
+                    await storage.get_storage().delete([url])
+            else:
+                failed += 1
+
+    logger.info(f"🎚️  Created {len(created)} audio renditions for document {document_id}")
+    if failed:
+        raise RuntimeError(f"{failed} of {len(profiles)} renditions failed for document {document_id}")
+    return created
+
+@jobs.register("audio_renditions")
+async def audio_renditions_job(payload: Dict):
+    # The stored file name keeps the original extension, which ffmpeg uses to pick a demuxer
+    filename = Path(urlparse(payload["file_url"]).path).name
+    await create_renditions(payload["document_id"], payload["file_url"], filename)
@@ -0,0 +1,79 @@
+"""
+Full-text search over the course catalog
+
+Backed by the weighted `search_vector` columns (database.create_tables) and
+their GIN indexes, queried by crud.search_content. Every word the user
+types is matched as a prefix ("medit" finds "meditation"), all words must
+match, and results are ranked by ts_rank_cd: title hits (weight A) above
+descriptions (B) above course content (C).
+
+Pages are keyset-paginated: `next_cursor` encodes the (rank, type, id) of
+the last result, so later pages cost the same as the first. Snippets
+highlight the matched words with <mark>; the surrounding text is HTML-escaped.
+"""
+import base64
+import html
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import crud
+
+SEARCH_TYPES = ("course", "section", "document")
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "50"))
+# Longer queries are cut to this many words
+SEARCH_MAX_TERMS = 8
+
+# ts_headline marks matches with these private-use characters, which survive html.escape()
+_START, _STOP = "\ue000", "\ue001"
+HEADLINE_OPTIONS = f'StartSel={_START}, StopSel={_STOP}, MaxWords=30, MinWords=12, MaxFragments=2, FragmentDelimiter=" … "'
+
+_WORD = re.compile(r"\w+")
+
+def to_tsquery_text(query: str) -> Optional[str]:
+    """to_tsquery() input matching every word as a prefix, or None if there are no words"""
+    terms = _WORD.findall(query.lower())[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    # \w+ never contains quotes or tsquery operators
+    return " & ".join(f"'{term}':*" for term in terms)
+
+def encode_cursor(result: Dict) -> str:
+    key = json.dumps([result["rank"], result["type"], result["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, str, int]:
+    try:
+        rank, kind, item_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if kind not in SEARCH_TYPES:
+            raise ValueError(kind)
+        return float(rank), kind, int(item_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid search cursor") from e
+
+def highlight(snippet: Optional[str]) -> str:
+    return html.escape(snippet or "").replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+def search(query: str, types: List[str], limit: int = SEARCH_DEFAULT_LIMIT, cursor: Optional[str] = None) -> Dict:
+    """
+    One page of results: {"query", "results", "next_cursor"}
+    Raises ValueError for unknown types or a malformed cursor
+    """
+    unknown = [kind for kind in types if kind not in SEARCH_TYPES]
+    if unknown or not types:
+        raise ValueError(f"types must be from: {', '.join(SEARCH_TYPES)}")
+    limit = min(max(limit, 1), SEARCH_MAX_LIMIT)
+    after = decode_cursor(cursor) if cursor else None
+
+    tsquery = to_tsquery_text(query)
+    if tsquery is None:
+        return {"query": query, "results": [], "next_cursor": None}
+
+    # One extra row tells whether there is another page
+    results = crud.search_content(tsquery, [kind for kind in SEARCH_TYPES if kind in types], limit + 1, after, HEADLINE_OPTIONS)
+    next_cursor = encode_cursor(results[limit - 1]) if len(results) > limit else None
+    for result in results:
+        result["snippet"] = highlight(result["snippet"])
+    return {"query": query, "results": results[:limit], "next_cursor": next_cursor}
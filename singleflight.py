@@ -0,0 +1,116 @@
+"""
+Single-flight request coalescing
+
+Concurrent calls for the same key share one execution: the first caller
+(the leader) runs the load, callers that arrive while it is in flight
+(followers) wait for and receive the same result or exception. Nothing is
+cached - once the load finishes the next call runs it again - so this only
+removes duplicate work during bursts, like a class starting and every
+student opening the same course at once.
+
+Results are shared between callers and must be treated as read-only.
+
+    course_loads = SingleFlight("course")
+    course_loads.do(course_id, crud.get_course_by_id, course_id)                   # sync (threads)
+    await course_loads.do_async(course_id, run_in_threadpool, crud.get_course_by_id, course_id)  # async
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+import metrics
+
+_groups: List["SingleFlight"] = []
+
+class _Call:
+    """A load in flight on a worker thread"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """A named group of coalesced loads; keys are only compared within the group"""
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, "asyncio.Task"] = {}
+        self.leaders = 0
+        self.followers = 0
+        _groups.append(self)
+
+    def _count(self, mode: str, leader: bool):
+        # Callers hold self._lock
+        if leader:
+            self.leaders += 1
+        else:
+            self.followers += 1
+        metrics.singleflight_calls_total.inc(self.name, mode, "leader" if leader else "follower")
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs), or wait for the identical call already running on another thread"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count("sync", leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Await fn(*args, **kwargs), or join the identical call already in flight
+        The load runs as its own task, so a caller that is cancelled (client
+        went away) doesn't cancel it for everyone else
+        """
+        with self._lock:
+            task = self._tasks.get(key)
+            leader = task is None
+            if leader:
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                self._tasks[key] = task
+                task.add_done_callback(lambda done, key=key: self._task_done(key, done))
+            self._count("async", leader)
+        return await asyncio.shield(task)
+
+    def _task_done(self, key: Hashable, task: "asyncio.Task"):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        if not task.cancelled():
+            # Every waiter may have been cancelled; don't warn about an unretrieved exception
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._tasks)
+
+    def stats(self) -> Dict:
+        calls = self.leaders + self.followers
+        return {
+            "calls": calls,
+            "executions": self.leaders,
+            "coalesced": self.followers,
+            "coalesced_ratio": round(self.followers / calls, 4) if calls else 0.0,
+            "in_flight": self.in_flight(),
+        }
+
+def get_stats() -> Dict[str, Dict]:
+    """Coalescing statistics per group"""
+    return {group.name: group.stats() for group in _groups}
@@ -0,0 +1,210 @@
+"""
+Static asset pipeline for api/static
+
+Each file gets a content-hashed name (app.js -> app.1a2b3c4d5e.js) plus
+gzip/brotli variants, kept in memory. Hashed names are served with
+`Cache-Control: immutable`; index.html is rewritten to reference them and,
+like the original names, is revalidated by ETag. The encoding comes from
+the request's Accept-Encoding.
+
+`python static_assets.py` writes the same output to api/static/build/
+ahead of time (deploy_vercel.sh runs it), so a cold start only reads files.
+Without a build, or when a source file changed since, the assets are built
+in memory on first use.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from starlette.responses import Response
+
+import compression
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = Path(__file__).parent / "api" / "static"
+BUILD_DIR = Path(os.getenv("STATIC_BUILD_DIR", str(STATIC_DIR / "build")))
+STATIC_URL_PREFIX = "/static/"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+CONTENT_TYPES = {
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".html": "text/html; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".ico": "image/x-icon",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+COMPRESSIBLE = {".css", ".js", ".html", ".svg", ".json", ".txt"}
+# Not worth a Content-Encoding below this
+MIN_COMPRESS_SIZE = 256
+
+# Pages that keep their name and point at the hashed assets
+HTML_PAGES = {"index.html"}
+
+class Asset:
+    """One static file with its hashed URL name and encoded variants"""
+    def __init__(self, name: str, content: bytes, source_sha256: str, hashed: bool):
+        self.name = name
+        self.source_sha256 = source_sha256
+        self.sha256 = hashlib.sha256(content).hexdigest()
+        self.url_name = hashed_name(name, self.sha256) if hashed else name
+        self.content_type = CONTENT_TYPES.get(Path(name).suffix.lower(), "application/octet-stream")
+        self.variants: Dict[str, bytes] = {"identity": content}
+
+    @property
+    def encodings(self):
+        return [encoding for encoding in compression.SUPPORTED_ENCODINGS if encoding in self.variants]
+
+    def etag(self, encoding: str) -> str:
+        # Each representation gets its own strong validator
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        return f'"{self.sha256[:16]}{suffix}"'
+
+    def compress(self):
+        if Path(self.name).suffix.lower() not in COMPRESSIBLE or len(self.variants["identity"]) < MIN_COMPRESS_SIZE:
+            return
+        for encoding in compression.SUPPORTED_ENCODINGS:
+            encoded = compression.compress(self.variants["identity"], encoding)
+            if len(encoded) < len(self.variants["identity"]):
+                self.variants[encoding] = encoded
+
+def hashed_name(name: str, sha256: str) -> str:
+    stem, dot, suffix = name.rpartition(".")
+    return f"{stem}.{sha256[:10]}.{suffix}" if dot else f"{name}.{sha256[:10]}"
+
+def _sources() -> Dict[str, bytes]:
+    return {path.name: path.read_bytes() for path in sorted(STATIC_DIR.iterdir()) if path.is_file()}
+
+def _rewrite_html(html: bytes, url_names: Dict[str, str]) -> bytes:
+    """Point /static/<name> references at the hashed names"""
+    def replace(match):
+        name = match.group(2).decode()
+        return match.group(1) + STATIC_URL_PREFIX.encode() + url_names.get(name, name).encode()
+    return re.sub(rb"""(["'(])/static/([^"'()?#\s]+)""", replace, html)
+
+def build_assets(sources: Optional[Dict[str, bytes]] = None) -> Dict[str, Asset]:
+    """Hash and compress every file in STATIC_DIR, keyed by original name"""
+    sources = _sources() if sources is None else sources
+    assets = {}
+    for name, content in sources.items():
+        if name not in HTML_PAGES:
+            assets[name] = Asset(name, content, hashlib.sha256(content).hexdigest(), hashed=True)
+    url_names = {name: asset.url_name for name, asset in assets.items()}
+    for name, content in sources.items():
+        if name in HTML_PAGES:
+            assets[name] = Asset(name, _rewrite_html(content, url_names), hashlib.sha256(content).hexdigest(), hashed=False)
+    for asset in assets.values():
+        asset.compress()
+    return assets
+
+def write_build(assets: Dict[str, Asset], build_dir: Path = BUILD_DIR):
+    """Write the hashed files, their .gz/.br variants and manifest.json"""
+    build_dir.mkdir(parents=True, exist_ok=True)
+    for stale in build_dir.iterdir():
+        if stale.is_file():
+            stale.unlink()
+    manifest = {}
+    for name, asset in assets.items():
+        for encoding, content in asset.variants.items():
+            suffix = {"identity": "", "gzip": ".gz", "br": ".br"}[encoding]
+            (build_dir / f"{asset.url_name}{suffix}").write_bytes(content)
+        manifest[name] = {
+            "file": asset.url_name,
+            "source_sha256": asset.source_sha256,
+            "encodings": sorted(asset.variants),
+        }
+    (build_dir / "manifest.json").write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+
+def read_build(sources: Dict[str, bytes], build_dir: Path = BUILD_DIR) -> Optional[Dict[str, Asset]]:
+    """Assets from a previous write_build(), or None if missing or out of date"""
+    manifest_path = build_dir / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if set(manifest) != set(sources) or any(
+        entry["source_sha256"] != hashlib.sha256(sources[name]).hexdigest() for name, entry in manifest.items()
+    ):
+        return None
+    assets = {}
+    for name, entry in manifest.items():
+        content = (build_dir / entry["file"]).read_bytes()
+        asset = Asset(name, content, entry["source_sha256"], hashed=name not in HTML_PAGES)
+        if asset.url_name != entry["file"]:
+            return None
+        for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+            if encoding in entry["encodings"]:
+                asset.variants[encoding] = (build_dir / f"{entry['file']}{suffix}").read_bytes()
+        assets[name] = asset
+    return assets
+
+_assets: Optional[Dict[str, Asset]] = None
+# url name -> (asset, immutable)
+_routes: Dict[str, tuple] = {}
+_load_lock = threading.Lock()
+
+def load() -> Dict[str, Asset]:
+    """Load the build output if it is current, otherwise build in memory (once per process)"""
+    global _assets, _routes
+    with _load_lock:
+        if _assets is not None:
+            return _assets
+        if not STATIC_DIR.exists():
+            logger.warning(f"⚠️  Static directory not found: {STATIC_DIR}")
+            _assets = {}
+            return _assets
+        sources = _sources()
+        assets = read_build(sources)
+        if assets is None:
+            logger.info("🧱 No current static build - hashing and compressing assets in memory")
+            assets = build_assets(sources)
+        routes = {name: (asset, False) for name, asset in assets.items()}
+        routes.update({asset.url_name: (asset, True) for asset in assets.values() if asset.url_name != asset.name})
+        _routes = routes
+        _assets = assets
+        logger.info(f"📦 {len(assets)} static assets ready (encodings: {', '.join(compression.SUPPORTED_ENCODINGS)})")
+        return _assets
+
+async def serve(url_name: str, headers) -> Optional[Response]:
+    """
+    Response for /static/<url_name>, or None if there is no such asset
+    Hashed names are immutable; original names and pages revalidate by ETag
+    """
+    if _assets is None:
+        await asyncio.to_thread(load)
+    route = _routes.get(url_name)
+    if route is None:
+        return None
+    asset, immutable = route
+
+    encoding = compression.negotiate(headers.get("accept-encoding"), asset.encodings)
+    etag = asset.etag(encoding)
+    response_headers = {
+        "Cache-Control": IMMUTABLE if immutable else REVALIDATE,
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+    }
+    if headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=response_headers)
+    if encoding != "identity":
+        response_headers["Content-Encoding"] = encoding
+    return Response(asset.variants[encoding], headers={**response_headers, "Content-Type": asset.content_type})
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    built = build_assets()
+    write_build(built)
+    for asset in built.values():
+        sizes = ", ".join(f"{encoding} {len(content)}" for encoding, content in sorted(asset.variants.items()))
+        print(f"{asset.name:<14} -> {asset.url_name:<28} {sizes}")
+    print(f"✅ Static build written to {BUILD_DIR}")
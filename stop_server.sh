@@ -70,8 +70,11 @@ PORT_PIDS=$(lsof -ti:8000 2>/dev/null || true)
 # Find all uvicorn processes
 UVICORN_PIDS=$(pgrep -f "uvicorn" 2>/dev/null || true)
 
+# Find the gunicorn master and workers (production)
+GUNICORN_PIDS=$(pgrep -f "gunicorn.*main:app" 2>/dev/null || true)
+
 # Combine all PIDs and remove duplicates
-ALL_PIDS=$(echo "$MAIN_PIDS $PORT_PIDS $UVICORN_PIDS" | tr ' ' '\n' | sort -u | tr '\n' ' ')
+ALL_PIDS=$(echo "$MAIN_PIDS $PORT_PIDS $UVICORN_PIDS $GUNICORN_PIDS" | tr ' ' '\n' | sort -u | tr '\n' ' ')
 
 if [ -z "$ALL_PIDS" ]; then
     print_success "No server processes found running"
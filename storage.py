@@ -0,0 +1,406 @@
+"""
+Pluggable file storage backends for uploaded documents
+
+STORAGE_BACKEND selects the implementation:
+- "vercel" (default): Vercel Blob over the network (see blob_utils)
+- "local": content-addressed files on local disk, served from /files/
+- "memory": in-process dict, for unit tests
+"""
+import abc
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple
+
+from starlette.responses import Response
+from starlette.types import Scope, Receive, Send
+
+import blob_utils
+import metrics
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "vercel").lower()
+LOCAL_STORAGE_DIR = Path(os.getenv("LOCAL_STORAGE_DIR", str(Path(__file__).parent / "storage_data")))
+# Optional front-proxy offload, e.g. "X-Accel-Redirect" (nginx) or "X-Sendfile" (apache/lighttpd)
+LOCAL_STORAGE_SENDFILE_HEADER = os.getenv("LOCAL_STORAGE_SENDFILE_HEADER", "")
+LOCAL_STORAGE_SENDFILE_PREFIX = os.getenv("LOCAL_STORAGE_SENDFILE_PREFIX", "/protected-files")
+# Seconds between authenticated Vercel Blob checks (list calls are billed operations)
+BLOB_HEALTH_CHECK_INTERVAL = float(os.getenv("BLOB_HEALTH_CHECK_INTERVAL", "60"))
+
+FILES_URL_PREFIX = "/files/"
+READ_CHUNK_SIZE = 256 * 1024
+
+class StoredObject:
+    """A stored file that can be served by this process"""
+    def __init__(self, sha256: str, filename: str, size: int, path: Optional[Path] = None, data: Optional[bytes] = None, root: Optional[Path] = None):
+        self.sha256 = sha256
+        self.filename = filename
+        self.size = size
+        self.path = path
+        # Storage root `path` lives under, for sendfile-style offload
+        self.root = root
+        self.data = data
+        self.content_type = blob_utils.get_content_type(filename)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.sha256}"'
+
+def _record_upload(backend: str, started: float, size: Optional[int], url: Optional[str]):
+    metrics.blob_upload_duration_seconds.observe(time.perf_counter() - started, backend, "ok" if url else "error")
+    if url and size:
+        metrics.blob_upload_bytes_total.inc(backend, amount=size)
+
+class StorageBackend(abc.ABC):
+    """Interface every storage backend implements"""
+    name = "base"
+
+    @abc.abstractmethod
+    async def put_stream(self, file, pathname: str, content_type: str, size: Optional[int] = None) -> Optional[str]:
+        """Store an UploadFile-like object; returns its URL or None if failed"""
+
+    @abc.abstractmethod
+    async def delete(self, urls: List[str]) -> bool:
+        """Delete stored files by URL"""
+
+    def resolve(self, url: str) -> Optional[StoredObject]:
+        """Map a URL back to a locally servable object (None for remote storage)"""
+        return None
+
+    def is_healthy(self) -> bool:
+        """Cheap configuration check used by readiness probes"""
+        return True
+
+    async def check_health(self, timeout: float) -> bool:
+        """Check run by the background health refresh (health.py); is_healthy() unless overridden"""
+        return await asyncio.to_thread(self.is_healthy)
+
+class VercelBlobBackend(StorageBackend):
+    """Vercel Blob Storage (network)"""
+    name = "vercel"
+
+    def __init__(self):
+        # monotonic time of the last successful authenticated check
+        self.verified_at: Optional[float] = None
+
+    async def put_stream(self, file, pathname, content_type, size=None):
+        started = time.perf_counter()
+        url = await blob_utils.upload_stream_to_blob(file, pathname, content_type, size=size)
+        _record_upload(self.name, started, size if size is not None else file.size, url)
+        return url
+
+    async def delete(self, urls):
+        return await blob_utils.delete_blobs(urls)
+
+    def is_healthy(self):
+        return bool(blob_utils.VERCEL_BLOB_TOKEN)
+
+    async def check_health(self, timeout):
+        if self.verified_at is not None and time.monotonic() - self.verified_at < BLOB_HEALTH_CHECK_INTERVAL:
+            return True
+        # Raises (recorded by health.py) if unreachable or the token is rejected
+        await blob_utils.check_blob_access(timeout)
+        self.verified_at = time.monotonic()
+        return True
+
+def _split_files_url(url: str) -> Optional[Tuple[str, str]]:
+    """'/files/<sha256>/<filename>' -> (sha256, filename)"""
+    if not url.startswith(FILES_URL_PREFIX):
+        return None
+    parts = url[len(FILES_URL_PREFIX):].split("/", 1)
+    if len(parts) != 2 or len(parts[0]) != 64 or not all(c in "0123456789abcdef" for c in parts[0]):
+        return None
+    return parts[0], parts[1]
+
+def object_key(url: str) -> str:
+    """
+    Identity of the stored object behind a URL: the content hash for /files/
+    URLs (one object per content, whatever the filename), otherwise the URL
+    Deleting a URL removes every URL with the same key
+    """
+    parsed = _split_files_url(url)
+    return parsed[0] if parsed else url
+
+def object_missing(url: str) -> bool:
+    """
+    Whether a /files/ URL's object is gone from the configured backend
+    Content-addressed objects are shared, so /purge can delete one that an
+    upload has just stored again (see crud._register_blob); other URLs are
+    never reused and are reported as present
+    """
+    return _split_files_url(url) is not None and get_storage().resolve(url) is None
+
+class LocalDiskBackend(StorageBackend):
+    """
+    Content-addressed files under LOCAL_STORAGE_DIR/objects/ab/cd/<sha256>
+    Writes go to a temp file in the same filesystem and are renamed into place,
+    so readers never see a partial object
+    """
+    name = "local"
+
+    def __init__(self, root: Path = LOCAL_STORAGE_DIR):
+        self.root = root
+        self.objects_dir = root / "objects"
+        self.tmp_dir = root / "tmp"
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / sha256[2:4] / sha256
+
+    def _write(self, fileobj) -> str:
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        fileobj.seek(0)
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = fileobj.read(READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            sha256 = digest.hexdigest()
+            target = self._object_path(sha256)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_name, target)
+            return sha256
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    async def put_stream(self, file, pathname, content_type, size=None):
+        started = time.perf_counter()
+        try:
+            sha256 = await asyncio.to_thread(self._write, file.file)
+        except OSError as e:
+            print(f"Error writing to local storage: {e}")
+            _record_upload(self.name, started, size, None)
+            return None
+        url = f"{FILES_URL_PREFIX}{sha256}/{Path(pathname).name}"
+        _record_upload(self.name, started, size if size is not None else file.size, url)
+        return url
+
+    async def delete(self, urls):
+        for url in urls:
+            parsed = _split_files_url(url)
+            if parsed:
+                try:
+                    self._object_path(parsed[0]).unlink()
+                except FileNotFoundError:
+                    pass
+        return True
+
+    def resolve(self, url):
+        parsed = _split_files_url(url)
+        if not parsed:
+            return None
+        path = self._object_path(parsed[0])
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return None
+        return StoredObject(parsed[0], parsed[1], size, path=path, root=self.root)
+
+    def is_healthy(self):
+        return os.access(self.root if self.root.exists() else self.root.parent, os.W_OK)
+
+class MemoryBackend(StorageBackend):
+    """In-process storage for unit tests - nothing leaves the process"""
+    name = "memory"
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+
+    async def put_stream(self, file, pathname, content_type, size=None):
+        await file.seek(0)
+        data = await file.read()
+        sha256 = hashlib.sha256(data).hexdigest()
+        self.objects[sha256] = data
+        return f"{FILES_URL_PREFIX}{sha256}/{Path(pathname).name}"
+
+    async def delete(self, urls):
+        for url in urls:
+            parsed = _split_files_url(url)
+            if parsed:
+                self.objects.pop(parsed[0], None)
+        return True
+
+    def resolve(self, url):
+        parsed = _split_files_url(url)
+        if not parsed or parsed[0] not in self.objects:
+            return None
+        data = self.objects[parsed[0]]
+        return StoredObject(parsed[0], parsed[1], len(data), data=data)
+
+_BACKENDS = {
+    "vercel": VercelBlobBackend,
+    "local": LocalDiskBackend,
+    "memory": MemoryBackend,
+}
+
+_storage: Optional[StorageBackend] = None
+
+def get_storage() -> StorageBackend:
+    """Get the configured storage backend"""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND not in _BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}' (expected one of {sorted(_BACKENDS)})")
+        _storage = _BACKENDS[STORAGE_BACKEND]()
+    return _storage
+
+def set_storage(backend: StorageBackend):
+    """Swap the storage backend (e.g. MemoryBackend in tests)"""
+    global _storage
+    _storage = backend
+
+async def download_to_path(file_url: str, target: Path) -> bool:
+    """Copy a stored file (local or remote) to a local path, e.g. for ffmpeg"""
+    stored = get_storage().resolve(file_url)
+    if stored is not None:
+        if stored.path is not None:
+            await asyncio.to_thread(shutil.copyfile, stored.path, target)
+        else:
+            await asyncio.to_thread(target.write_bytes, stored.data)
+        return True
+
+    client = blob_utils.get_http_client()
+    async with client.stream("GET", file_url) as response:
+        if response.status_code != 200:
+            print(f"Download failed: {response.status_code} for {file_url}")
+            return False
+        with open(target, "wb") as out:
+            async for chunk in response.aiter_bytes(1024 * 1024):
+                await asyncio.to_thread(out.write, chunk)
+    return True
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range 'bytes=' header into an inclusive (start, end)
+    Returns None when the whole file should be sent (no or malformed header);
+    raises ValueError if unsatisfiable (416)
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    if not start_text and not end_text:
+        return None
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start is None:
+        # Suffix range: last N bytes; "-0" and any suffix of an empty file select nothing
+        if end <= 0 or size == 0:
+            raise ValueError("suffix range not satisfiable")
+        return max(size - end, 0), size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+class RangeFileResponse(Response):
+    """
+    ASGI response for a StoredObject with Range/206 and conditional request support
+
+    Disk files are sent zero-copy when possible: through a front proxy
+    (LOCAL_STORAGE_SENDFILE_HEADER), or the ASGI 'http.response.zerocopysend'
+    extension when the server offers it; otherwise they are read in chunks
+    off the event loop.
+    """
+    def __init__(self, obj: StoredObject, headers, cache_control: str = "public, max-age=31536000, immutable", disposition: Optional[str] = None):
+        self.obj = obj
+        self.request_headers = headers
+        response_headers = {
+            "accept-ranges": "bytes",
+            "cache-control": cache_control,
+            "etag": obj.etag,
+            "content-type": obj.content_type,
+            # Of the whole file; each response sends the length of what it serves
+            "content-length": str(obj.size),
+        }
+        if disposition:
+            response_headers["content-disposition"] = disposition
+        super().__init__(headers=response_headers)
+
+    def _response_headers(self, status: int, start: int, end: int) -> List[Tuple[bytes, bytes]]:
+        # self.raw_headers, so headers added to the response object are sent too
+        headers = [header for header in self.raw_headers if header[0] != b"content-length"]
+        if status == 206:
+            headers.append((b"content-range", f"bytes {start}-{end}/{self.obj.size}".encode()))
+        if status != 304:
+            headers.append((b"content-length", str(end - start + 1).encode()))
+        return headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self._send(scope, send)
+        if self.background is not None:
+            await self.background()
+
+    async def _send(self, scope: Scope, send: Send):
+        size = self.obj.size
+        if self.request_headers.get("if-none-match") == self.obj.etag:
+            await send({"type": "http.response.start", "status": 304, "headers": self._response_headers(304, 0, -1)})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        try:
+            byte_range = parse_range(self.request_headers.get("range"), size)
+        except ValueError:
+            await send({
+                "type": "http.response.start",
+                "status": 416,
+                "headers": [(b"content-range", f"bytes */{size}".encode()), (b"content-length", b"0")],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        status = 206 if byte_range else 200
+        start, end = byte_range or (0, size - 1)
+        headers = self._response_headers(status, start, end)
+
+        if self.obj.root is not None and LOCAL_STORAGE_SENDFILE_HEADER and scope["method"] != "HEAD":
+            # Let nginx/apache serve the bytes (it handles Range itself)
+            internal = f"{LOCAL_STORAGE_SENDFILE_PREFIX}/{self.obj.path.relative_to(self.obj.root).as_posix()}"
+            headers = [h for h in headers if h[0] not in (b"content-length", b"content-range")]
+            headers.append((LOCAL_STORAGE_SENDFILE_HEADER.lower().encode(), internal.encode()))
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if scope["method"] == "HEAD" or size == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if self.obj.data is not None:
+            await send({"type": "http.response.body", "body": self.obj.data[start:end + 1]})
+            return
+
+        with open(self.obj.path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": start,
+                    "count": end - start + 1,
+                })
+                return
+
+            offset = start
+            while offset <= end:
+                length = min(READ_CHUNK_SIZE, end - offset + 1)
+                chunk = await asyncio.to_thread(os.pread, f.fileno(), length, offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": offset <= end})
+            if offset <= end:
+                # File shrank underneath us - end the response cleanly
+                await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,6 @@
+"""Gunicorn worker class for production (see gunicorn.conf.py)"""
+from uvicorn.workers import UvicornWorker
+
+class ProductionUvicornWorker(UvicornWorker):
+    """Uvicorn worker pinned to uvloop + httptools (fails loudly if either is missing)"""
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Standalone background job worker
+
+Runs the jobs table workers outside the web process (JOB_WORKER_MODE=external).
+Any number of these can run against the same database.
+
+Usage: python worker.py [--concurrency N]
+"""
+import argparse
+import asyncio
+import signal
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import jobs
+import logging_config
+
+async def main(concurrency: int):
+    pool = jobs.WorkerPool(concurrency)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, pool.stop.set)
+
+    pool.start()
+    await pool.stop.wait()
+    print("🛑 Stopping job workers...")
+    await pool.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--concurrency", type=int, default=jobs.JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    logging_config.configure_logging(Path(__file__).parent)
+    asyncio.run(main(args.concurrency))